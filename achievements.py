@@ -1,4 +1,5 @@
 # Complete 200 achievement system from original Goal Quest
+from streak_matrix import load_completion_matrix
 
 ALL_ACHIEVEMENTS = [
     # ========== STREAKS (1-25) ==========
@@ -199,29 +200,64 @@ ALL_ACHIEVEMENTS = [
 ]
 
 def initialize_achievements(db):
-    """Initialize all 200 achievements in the database"""
+    """Initialize all 200 achievements in the database (one query when they already are)"""
     conn = db.get_connection()
     c = conn.cursor()
     
-    for ach in ALL_ACHIEVEMENTS:
-        try:
-            c.execute("""
-                INSERT OR IGNORE INTO achievements 
-                (key, title, description, icon, category, tier, xp_reward, gold_reward, stat_bonus, special_power)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                ach["key"],
-                ach["title"],
-                ach["description"],
-                ach["icon"],
-                ach["category"],
-                ach["tier"],
-                ach["xp_reward"],
-                ach["gold_reward"],
-                ach.get("stat_bonus"),
-                ach.get("special_power")
-            ))
-        except Exception as e:
-            print(f"Error initializing achievement {ach['key']}: {e}")
+    c.execute("SELECT COUNT(*) FROM achievements")
+    if c.fetchone()[0] >= len(ALL_ACHIEVEMENTS):
+        return
+    
+    c.executemany("""
+        INSERT INTO achievements 
+        (key, title, description, icon, category, tier, xp_reward, gold_reward, stat_bonus, special_power)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO NOTHING
+    """, [(
+        ach["key"],
+        ach["title"],
+        ach["description"],
+        ach["icon"],
+        ach["category"],
+        ach["tier"],
+        ach["xp_reward"],
+        ach["gold_reward"],
+        ach.get("stat_bonus"),
+        ach.get("special_power")
+    ) for ach in ALL_ACHIEVEMENTS])
     
     conn.commit()
+
+STREAK_THRESHOLDS = [3, 7, 14, 21, 30, 45, 60, 90, 180, 365]
+MULTI_STREAK_THRESHOLDS = [3, 5, 10]
+
+COMPLETION_THRESHOLDS = {1: "first_complete", 10: "complete_10", 50: "complete_50", 100: "complete_100",
+                         250: "complete_250", 500: "complete_500", 1000: "complete_1000", 5000: "complete_5000"}
+
+def check_streak_achievements(db) -> list:
+    """Unlock streak, perfect-run and schedule achievements; returns newly unlocked keys"""
+    return [key for key in earned_streak_achievements(db) if db.unlock_achievement(key)]
+
+def earned_checkin_achievements(db) -> list:
+    """Completion-count and streak achievements the user qualifies for; used to evaluate bulk check-ins"""
+    total = sum(len(bitmap) for bitmap in db.get_habit_bitmaps().values())
+    earned = [key for n, key in COMPLETION_THRESHOLDS.items() if total >= n]
+    return earned + earned_streak_achievements(db)
+
+def earned_streak_achievements(db) -> list:
+    """Streak, perfect-run and schedule achievement keys the user currently qualifies for"""
+    matrix = load_completion_matrix(db, days=max(STREAK_THRESHOLDS) + 1)
+    summary = matrix.summary()
+    scheduled_days = int(matrix.expected.any(axis=0).sum())
+    
+    earned = [f"streak_{n}" for n in STREAK_THRESHOLDS if summary['best_current_streak'] >= n]
+    earned += [f"streak_multi_{n}" for n in MULTI_STREAK_THRESHOLDS if summary['habits_with_7_day_streak'] >= n]
+    if summary['longest_perfect_run'] >= 7:
+        earned.append("perfect_week")
+    if summary['longest_perfect_run'] >= 30:
+        earned.append("perfect_month")
+    if scheduled_days >= 14 and matrix.days_without_misses() >= 14:
+        earned.append("no_breaks")
+    if scheduled_days >= 30 and matrix.completion_rate(30) >= 0.9:
+        earned.append("consistency_king")
+    return earned
@@ -2,15 +2,33 @@ import os
 from typing import Optional, Dict, List
 import random
 import json
-from anthropic import Anthropic
+import threading
 
 class AICoach:
     def __init__(self, api_key):
-        # Initializes the Anthropic client with the provided API key
-        self.client = Anthropic(api_key=api_key) if api_key else None
+        # The Anthropic SDK takes over a second to import, so the client is only built on first use.
+        # One coach can serve every session: the client is thread-safe and pools keep-alive connections.
+        self.api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
         # Standardized model name for all calls
         self.model = "claude-3-5-sonnet-20240620"
 
+    @property
+    def available(self) -> bool:
+        """Whether AI features are on, without loading the SDK"""
+        return bool(self.api_key)
+
+    @property
+    def client(self):
+        """The Anthropic client (None without an API key)"""
+        if self._client is None and self.api_key:
+            with self._lock:
+                if self._client is None:
+                    from anthropic import Anthropic
+                    self._client = Anthropic(api_key=self.api_key)
+        return self._client
+
     def generate_daily_quote(self, tradition: str = "esoteric", habit_context: str = None, user_name: str = "Hunter") -> Dict:
         """Generate daily wisdom quote using AI with a tradition-based fallback database."""
         
@@ -1,19 +1,31 @@
 # Import character visuals
 import streamlit as st
-import PyPDF2
 import io
+import hashlib
 import os
-import pandas as pd
 from datetime import datetime, timedelta, date
-from database import Database
-from achievements import initialize_achievements, ALL_ACHIEVEMENTS
+from database import Database, USABLE_EFFECTS, STAT_NAMES
+from effects import to_utc
+from shards import ShardRouter
+from storage import backend_from_url
+from backup import BackupManager
+from instrumentation import Profiler
+from achievements import initialize_achievements, check_streak_achievements, earned_checkin_achievements, ALL_ACHIEVEMENTS
 from ai_coach import AICoach
-from shop_items import ALL_SHOP_ITEMS, RARITY_COLORS, get_items_by_category, get_item_by_id, can_afford, meets_level_requirement
+from shop_items import ALL_SHOP_ITEMS, RARITY_COLORS, get_items_by_category, get_item_by_id, can_afford, meets_level_requirement, stack_limit
 from utils import *
+from habit_schedule import habit_mask
+from theme import STYLESHEET, card, equipment_slot, gold_counter, heading, hunter_card, profile_card, tagline
+from rollover import roll_over, live_streaks
+from streak_matrix import load_completion_matrix
+from clock import use_clock, timezone_choices
 import json
+# pandas and PyPDF2 are imported on the pages that use them (Analytics, CSV backfill, PDF uploads),
+# and ai_coach loads the Anthropic SDK on the first AI call: together they are most of a cold start.
 
 def extract_pdf_text(uploaded_file):
     """Extracts text content from an uploaded PDF file."""
+    import PyPDF2
     try:
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(uploaded_file.read()))
         text = ""
@@ -25,6 +37,33 @@ def extract_pdf_text(uploaded_file):
     except Exception as e:
         st.error(f"Error reading PDF: {e}")
         return ""
+
+def store_pdf(db, uploaded_file, extract=extract_pdf_text):
+    """Adds an uploaded PDF to the library, keyed by the SHA-256 of its bytes.
+    
+    Returns (document, status). 'duplicate' means the file is already in this library,
+    'linked' that an earlier upload's text, segments and analysis were reused, and
+    'new' that the text was extracted now (document is None if there was none).
+    """
+    sha = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    existing = db.get_document_by_hash(sha)
+    if existing:
+        return existing, 'duplicate'
+    if not db.link_document(uploaded_file.name, sha):
+        text = extract(uploaded_file)
+        if not text.strip():
+            return None, 'new'
+        db.upload_document(uploaded_file.name, text, 'pdf', uploaded_file.size, content_sha256=sha)
+        return db.get_document_by_hash(sha), 'new'
+    return db.get_document_by_hash(sha), 'linked'
+
+def warn_similar_documents(db, doc_id):
+    """Flags library documents that look like another scan or edition of this one; returns whether any did."""
+    similar = db.find_similar_documents(doc_id)
+    if similar:
+        names = ", ".join(f"'{doc['filename']}' ({doc['similarity']:.0%})" for doc in similar[:3])
+        st.warning(f"⚠️ This looks very similar to {names} already in your library.")
+    return bool(similar)
         
 # Page config
 st.set_page_config(
@@ -34,169 +73,107 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Enhanced Custom CSS with animations and glows
-st.markdown("""
-<style>
-    .main {
-        background-color: #0a0a0a;
-        color: #ffffff;
-    }
-    
-    [data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #1a1a1a 0%, #0f0f0f 100%);
-        border-right: 2px solid #d4af37;
-    }
-    
-    h1, h2, h3 {
-        color: #d4af37;
-        text-shadow: 0 0 20px rgba(212, 175, 55, 0.5);
-        font-family: 'Cinzel', serif;
-        letter-spacing: 2px;
-    }
-    
-    [data-testid="stMetricValue"] {
-        color: #d4af37;
-        font-size: 2.5rem;
-        font-weight: bold;
-        text-shadow: 0 0 15px rgba(212, 175, 55, 0.6);
-    }
-    
-    .stButton>button {
-        background: linear-gradient(135deg, #d4af37 0%, #f1c40f 100%);
-        color: #0a0a0a;
-        border: 2px solid #ffd700;
-        border-radius: 12px;
-        font-weight: bold;
-        padding: 12px 24px;
-        transition: all 0.3s ease;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-        box-shadow: 0 4px 15px rgba(212, 175, 55, 0.4);
-    }
-    
-    .stButton>button:hover {
-        background: linear-gradient(135deg, #ffd700 0%, #d4af37 100%);
-        box-shadow: 0 6px 25px rgba(212, 175, 55, 0.7);
-        transform: translateY(-2px);
-    }
-    
-    .stProgress > div > div > div {
-        background: linear-gradient(90deg, #d4af37 0%, #ffd700 100%);
-        box-shadow: 0 0 10px rgba(212, 175, 55, 0.8);
-    }
-    
-    .stCheckbox {
-        color: #ffffff;
-    }
-    
-    .achievement-card {
-        background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 100%);
-        border: 2px solid #d4af37;
-        border-radius: 15px;
-        padding: 20px;
-        margin: 10px 0;
-        box-shadow: 0 8px 20px rgba(0, 0, 0, 0.6);
-    }
-    
-    .shop-item {
-        background: linear-gradient(135deg, #1a1a1a 0%, #2a2a2a 100%);
-        border: 3px solid;
-        border-radius: 15px;
-        padding: 20px;
-        margin: 15px 0;
-        transition: all 0.3s ease;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .shop-item:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 12px 30px rgba(0, 0, 0, 0.8);
-    }
-    
-    .shop-item::before {
-        content: '';
-        position: absolute;
-        top: -50%;
-        left: -50%;
-        width: 200%;
-        height: 200%;
-        background: linear-gradient(45deg, transparent, rgba(255, 255, 255, 0.1), transparent);
-        transform: rotate(45deg);
-        animation: shimmer 3s infinite;
-    }
-    
-    @keyframes shimmer {
-        0% { transform: translateX(-100%) translateY(-100%) rotate(45deg); }
-        100% { transform: translateX(100%) translateY(100%) rotate(45deg); }
-    }
-    
-    .stat-display {
-        background: linear-gradient(135deg, #2d2d2d 0%, #1a1a1a 100%);
-        border: 2px solid #d4af37;
-        border-radius: 10px;
-        padding: 15px;
-        text-align: center;
-        box-shadow: 0 4px 15px rgba(212, 175, 55, 0.3);
-    }
-    
-    .quote-box {
-        background: linear-gradient(135deg, #2d2d2d 0%, #1a1a1a 100%);
-        border-left: 5px solid #d4af37;
-        padding: 20px;
-        margin: 20px 0;
-        border-radius: 10px;
-        font-style: italic;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.5);
-    }
-    
-    .level-badge {
-        display: inline-block;
-        background: linear-gradient(135deg, #d4af37 0%, #ffd700 100%);
-        color: #0a0a0a;
-        padding: 8px 16px;
-        border-radius: 20px;
-        font-weight: bold;
-        box-shadow: 0 4px 10px rgba(212, 175, 55, 0.5);
-    }
-    
-    .xp-glow {
-        animation: xpPulse 2s infinite;
-    }
-    
-    @keyframes xpPulse {
-        0%, 100% { opacity: 1; }
-        50% { opacity: 0.7; text-shadow: 0 0 20px #d4af37; }
-    }
-    
-    p, span, label {
-        color: #ffffff;
-    }
-    
-    .stSelectbox, .stTextInput, .stTextArea {
-        color: #ffffff;
-    }
-    
-    [data-baseweb="select"] {
-        background-color: #2d2d2d;
-    }
-    
-    input, textarea {
-        background-color: #2d2d2d !important;
-        color: #ffffff !important;
-        border: 2px solid #d4af37 !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Theme: static/theme.css, fetched once and cached by the browser
+st.html(STYLESHEET)
 
 # Initialize session state
-if 'db' not in st.session_state:
-    st.session_state.db = Database()
-    initialize_achievements(st.session_state.db)
+@st.cache_resource
+def get_shard_router(data_dir: str) -> ShardRouter:
+    """One router (and connection LRU) per process"""
+    return ShardRouter(data_dir)
+
+@st.cache_resource
+def get_database(url: str) -> Database:
+    """One Database per process, its connection pool and caches shared by every session; schema and catalog are set up here, once"""
+    db = Database(backend=backend_from_url(url))
+    initialize_achievements(db)
+    db.close()
+    return db
+
+@st.cache_resource
+def get_ai_coach(api_key: str) -> AICoach:
+    """One coach, and one Anthropic client with its keep-alive connection pool, per process"""
+    return AICoach(api_key)
+
+@st.cache_resource
+def get_backup_manager(db_path: str, backup_dir: str, interval_minutes: float) -> BackupManager:
+    """One scheduled online backup thread per process"""
+    manager = BackupManager(db_path, backup_dir)
+    manager.start(interval_minutes * 60)
+    return manager
+
+@st.cache_resource
+def get_profiler() -> Profiler:
+    """One set of call statistics per process; wraps Database and AICoach methods once"""
+    profiler = Profiler()
+    profiler.wrap(Database, skip={'get_connection'})
+    profiler.wrap(AICoach)
+    return profiler
+
+# GOAL_QUEST_PROFILE=1 times every Database and AICoach call and adds a debug panel to the sidebar;
+# its exports are written to GOAL_QUEST_PROFILE_DIR (default "profiles").
+profiler = get_profiler() if os.environ.get('GOAL_QUEST_PROFILE') else None
+if profiler:
+    if 'profile_run' in st.session_state:
+        profiler.finish_run(st.session_state.profile_run)  # no-op unless st.rerun() cut it short
+    st.session_state.profile_run = profiler.start_run(st.session_state.get('page', 'Dashboard'))
+
+# Who a session belongs to is set by GOAL_QUEST_AUTH:
+# - unset: a single-user install; every session is the 'default' user
+# - "oidc": Streamlit's built-in login ([auth] in secrets.toml); the user is their verified email
+# - "header": a trusted reverse proxy authenticates and passes the user in GOAL_QUEST_AUTH_HEADER
+#   (default X-Forwarded-User); only use it when the app can't be reached around the proxy
+# - "query": ?user=<handle>, which anyone can edit; for local testing only
+AUTH_MODE = os.environ.get('GOAL_QUEST_AUTH', '')
+
+def session_handle() -> str:
+    """The signed-in user's handle; stops the script with a login prompt when there is none"""
+    if AUTH_MODE == 'oidc':
+        if not st.user.get("is_logged_in"):
+            st.markdown(heading("⚔️ GOAL QUEST"), unsafe_allow_html=True)
+            st.button("🔑 Log in", on_click=st.login, use_container_width=True)
+            st.stop()
+        return st.user.email
+    if AUTH_MODE == 'header':
+        handle = st.context.headers.get(os.environ.get('GOAL_QUEST_AUTH_HEADER', 'X-Forwarded-User'))
+        if not handle:
+            st.error("Not signed in: the authenticating proxy sent no user")
+            st.stop()
+        return handle
+    if AUTH_MODE == 'query':
+        return st.query_params.get('user', 'default')
+    if AUTH_MODE:
+        raise ValueError(f"Unknown GOAL_QUEST_AUTH mode {AUTH_MODE!r}")
+    return 'default'
+
+# Each browser session is scoped to its user: it keeps a for_user view of the process-wide
+# Database, and script runs borrow pooled connections from it.
+# With GOAL_QUEST_DATA_DIR set, every user gets their own SQLite file under that directory;
+# GOAL_QUEST_DATABASE_URL (e.g. postgresql://...) selects another shared storage backend.
+# GOAL_QUEST_BACKUP_DIR turns on scheduled online backups of a shared SQLite database.
+handle = session_handle()
+if st.session_state.get('handle') != handle:
+    # A different login in this browser session: nothing from the previous user carries over
+    # (except the profiler's record of this run)
+    for key in [key for key in st.session_state if key != 'profile_run']:
+        del st.session_state[key]
+    st.session_state.handle = handle
+    data_dir = os.environ.get('GOAL_QUEST_DATA_DIR')
+    if data_dir:
+        # The router migrates a shard when it opens it; shards copy the template's catalog
+        router = get_shard_router(data_dir)
+        st.session_state.db = router.database(router.get_or_create_user(handle), migrate=False)
+        initialize_achievements(st.session_state.db)
+    else:
+        shared_db = get_database(os.environ.get('GOAL_QUEST_DATABASE_URL', 'goal_quest.db'))
+        if shared_db.backend.name == 'sqlite' and os.environ.get('GOAL_QUEST_BACKUP_DIR'):
+            get_backup_manager(shared_db.backend.db_path, os.environ['GOAL_QUEST_BACKUP_DIR'],
+                               float(os.environ.get('GOAL_QUEST_BACKUP_INTERVAL_MINUTES', 360)))
+        st.session_state.db = shared_db.for_user(shared_db.get_or_create_user(handle))
 
 if 'ai_coach' not in st.session_state:
     api_key = st.secrets.get("ANTHROPIC_API_KEY") if hasattr(st, 'secrets') else None
-    st.session_state.ai_coach = AICoach(api_key)
+    st.session_state.ai_coach = get_ai_coach(api_key)
 
 if 'page' not in st.session_state:
     st.session_state.page = 'Dashboard'
@@ -204,14 +181,281 @@ if 'page' not in st.session_state:
 db = st.session_state.db
 ai_coach = st.session_state.ai_coach
 
+# Dates for this run follow the user's timezone
+use_clock(db.clock)
+
+# Finalize finished days (streaks, shields, rollups) once per session per local day
+if st.session_state.get('rolled_over') != db.clock.today():
+    roll_over(db)
+    st.session_state.rolled_over = db.clock.today()
+
 # Get user profile and stats
 profile = db.get_profile()
 stats = db.get_stats()
 
+# ===== FRAGMENTS =====
+# Check-ins, purchases and equipping rerun only their own row plus the few
+# counters they change, not the whole script. Callbacks do the write, refresh
+# the dicts the rows were drawn from (bitmaps, streaks, stats, owned) in place
+# and name the fragments to rerun; fragment reruns reuse those same dicts.
+SIDEBAR_COUNTERS = 'sidebar_counters'
+PURCHASE_ERRORS = {'crystals': "Not enough crystals", 'gold': "Not enough gold",
+                   'level': "Your level is too low", 'stack_full': "Stack is full"}
+
+
+def rerun_fragments(stats: dict, *keys: str):
+    """From a widget callback: refresh the shared stats, then rerun these fragments and the sidebar counters"""
+    stats.update(db.get_stats())
+    st.rerun([*keys, SIDEBAR_COUNTERS])
+
+
+def profiled(name: str):
+    """Record reruns of just this fragment in the debug panel (under name) when profiling is on"""
+    if profiler:
+        return profiler.fragment(name, lambda: st.session_state.get('page', 'Dashboard'))
+    return lambda func: func
+
+
+def render_fragment(func, key: str, *args):
+    """Draw func(*args) as a fragment named key, so a callback can rerun that one row"""
+    return st.fragment(profiled(func.__name__)(func), key=key)(*args)
+
+
+def flash(key: str):
+    """Show the message a callback left for this fragment"""
+    message = st.session_state.pop(f"flash_{key}", None)
+    if message:
+        kind, text = message
+        if kind == 'celebrate':
+            st.balloons()
+            st.success(text)
+        else:
+            getattr(st, kind)(text)
+
+
+@st.fragment(key=SIDEBAR_COUNTERS)
+@profiled(SIDEBAR_COUNTERS)
+def sidebar_counters(profile: dict, stats: dict):
+    # User Profile Card
+    st.markdown(profile_card(profile.get('display_name', 'Hunter'), profile.get('avatar_style', 'warrior').capitalize(),
+                             stats.get('level', 1)), unsafe_allow_html=True)
+    
+    # XP Progress
+    current_xp = stats.get('current_xp', 0)
+    xp_needed = stats.get('level', 1) * 500
+    st.progress(current_xp / xp_needed if xp_needed > 0 else 0)
+    st.markdown(f"<p class='centered xp-glow'>⚡ XP: {current_xp:,} / {xp_needed:,}</p>", unsafe_allow_html=True)
+    
+    # Gold Counter with glow
+    st.markdown(gold_counter(stats.get('current_gold', 0)), unsafe_allow_html=True)
+
+
+def set_habit_done(habit: dict, today, bitmaps: dict, streaks: dict, stats: dict, widget_key: str, fragment_key: str):
+    """Checkbox callback: check the habit in (or undo it) and rerun just its row"""
+    done = st.session_state[widget_key]
+    xp, gold = db.toggle_completion(habit['id'], today, done)
+    bitmaps[habit['id']] = db.get_habit_bitmap(habit['id'])
+    if streaks is not None:
+        streaks.update(live_streaks(db, [habit], bitmaps, today))
+    if done:
+        # Check completion achievements
+        total_completions = len(bitmaps[habit['id']])
+        if total_completions == 1:
+            db.unlock_achievement("first_complete")
+        elif total_completions == 100:
+            db.unlock_achievement("complete_100")
+        check_streak_achievements(db)
+        st.session_state[f"flash_{fragment_key}"] = (
+            'celebrate', f"🎉 Completed {habit['name']}! +{xp} XP, +{gold} Gold!")
+    rerun_fragments(stats, fragment_key)
+
+
+def habit_row(habit: dict, today, bitmaps: dict, streaks: dict, stats: dict):
+    """One habit on the Habits page"""
+    fragment_key = f"habit_row_{habit['id']}"
+    bitmap = bitmaps[habit['id']]
+    with st.container():
+        col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+        
+        with col1:
+            st.checkbox(
+                f"**{habit['name']}**",
+                value=bitmap.has(today),
+                key=f"habit_{habit['id']}",
+                on_change=set_habit_done,
+                args=(habit, today, bitmaps, streaks, stats, f"habit_{habit['id']}", fragment_key)
+            )
+            flash(fragment_key)
+            
+            if habit.get('description'):
+                st.caption(habit['description'])
+        
+        with col2:
+            difficulty_map = {1: "🟢 Easy", 2: "🟡 Med", 3: "🔴 Hard"}
+            st.caption(difficulty_map.get(habit['difficulty'], '🟢'))
+            if habit.get('priority'):
+                st.caption("⭐ Priority")
+        
+        with col3:
+            st.caption(f"⚡ +{habit['xp_reward']} XP")
+            st.caption(f"💰 +{habit.get('gold_reward', 0)} Gold")
+        
+        with col4:
+            st.caption(f"🔥 {streaks[habit['id']]} days")
+            st.caption(f"✅ {len(bitmap)} total")
+        
+        st.markdown("---")
+
+
+def priority_quest(habit: dict, today, bitmaps: dict, stats: dict):
+    """One priority habit on the dashboard"""
+    fragment_key = f"quest_{habit['id']}"
+    col1, col2, col3 = st.columns([3, 1, 1])
+    
+    with col1:
+        completed = bitmaps[habit['id']].has(today)
+        st.checkbox(
+            f"{'✅' if completed else '⬜'} **{habit['name']}**",
+            value=completed,
+            key=f"dash_habit_{habit['id']}",
+            on_change=set_habit_done,
+            args=(habit, today, bitmaps, None, stats, f"dash_habit_{habit['id']}", fragment_key)
+        )
+        flash(fragment_key)
+    
+    with col2:
+        difficulty_icons = {1: "🟢 Easy", 2: "🟡 Med", 3: "🔴 Hard"}
+        st.caption(difficulty_icons.get(habit['difficulty'], '🟢'))
+    
+    with col3:
+        st.caption(f"⚡ +{habit['xp_reward']} XP")
+        st.caption(f"💰 +{habit.get('gold_reward', 0)} Gold")
+
+
+def buy(item: dict, owned: dict, stats: dict, fragment_key: str):
+    """Buy button callback: one purchase, then rerun the listing, the shop's balance and the counters"""
+    result = db.purchase(item['id'])
+    if result['purchased']:
+        owned[item['id']] = owned.get(item['id'], 0) + result['quantity']
+        st.session_state[f"flash_{fragment_key}"] = ('success', f"✨ Purchased {item['name']}!")
+    else:
+        st.session_state[f"flash_{fragment_key}"] = ('error', PURCHASE_ERRORS.get(result['reason'], "Purchase failed"))
+    rerun_fragments(stats, fragment_key, 'shop_balance')
+
+
+@st.fragment(key='shop_balance')
+@profiled('shop_balance')
+def shop_balance(stats: dict):
+    st.markdown(card(f"<h3>💰 Your Gold: {stats.get('current_gold', 0):,} • 💎 Crystals: {stats.get('crystals') or 0:,}</h3>",
+                     'centered'), unsafe_allow_html=True)
+
+
+def shop_item(item: dict, owned: dict, stats: dict):
+    """One shop listing; its Buy button reruns only this listing"""
+    fragment_key = f"shop_{item['id']}"
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        if item.get('category') == 'consumable':
+            st.markdown(f"**{item['icon']} {item['name']}** ({item['rarity'].upper()})")
+        else:
+            st.markdown(f"**{item['icon']} {item['name']}**")
+        st.caption(item['description'])
+        
+        if item.get('stats'):
+            stat_text = ", ".join([f"+{v} {k.capitalize()}" for k, v in item['stats'].items()])
+            st.caption(f"📊 {stat_text}")
+    
+    with col2:
+        price = item.get('price', {})
+        st.caption(f"💰 {price.get('gold', 0):,}" + (f" • 💎 {price['crystals']:,}" if price.get('crystals') else ""))
+        
+        limit = stack_limit(item)
+        stack_full = limit is not None and owned.get(item['id'], 0) >= limit
+        can_buy = (can_afford(item, stats.get('current_gold', 0), stats.get('crystals') or 0)
+                   and meets_level_requirement(item, stats.get('level', 1)) and not stack_full)
+        st.button(f"Buy", key=f"buy_{item['id']}", disabled=not can_buy, help="Stack is full" if stack_full else None,
+                  on_click=buy, args=(item, owned, stats, fragment_key))
+        flash(fragment_key)
+
+
+def equip(item: dict, equipped: dict, fragment_key: str):
+    """Equip button callback: rerun only the loadout and this row"""
+    db.equip_item(item['id'], item.get('slot', 'misc'))
+    equipped.update(db.get_equipped_items())
+    st.session_state[f"flash_{fragment_key}"] = ('success', f"✨ Equipped {item['name']}!")
+    st.rerun(['loadout', fragment_key])
+
+
+@st.fragment(key='loadout')
+@profiled('loadout')
+def loadout(equipped: dict):
+    for slot, icon, name in [('weapon_id', '⚔️', 'Weapon'), ('armor_id', '🛡️', 'Armor'), ('ring_id', '💍', 'Ring'), ('amulet_id', '📿', 'Amulet')]:
+        item_id = equipped.get(slot, '')
+        if item_id:
+            st.markdown(f"**{icon} {name}:** {item_id.replace('_', ' ').title()}")
+        else:
+            st.caption(f"{icon} {name}: Empty")
+
+
+def equipment_row(item: dict, equipped: dict):
+    fragment_key = f"equip_row_{item['id']}"
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        st.markdown(f"**{item['icon']} {item['name']}**")
+        st.caption(item['description'])
+    
+    with col2:
+        st.button("⚔️ Equip", key=f"equip_{item['id']}", on_click=equip, args=(item, equipped, fragment_key))
+        flash(fragment_key)
+
+# ===== PAGINATION =====
+# Long lists are fetched a page at a time with keyset queries (db.get_notes(after=row, limit=n)
+# and friends), so a rerun builds at most PAGE_SIZE rows however long the list is. Each list
+# keeps the stack of rows its pages start after in session_state; a new filter starts over.
+PAGE_SIZE = 20
+
+
+def turn_page(state: dict, after):
+    """Previous/Next callback: after is the last row of this page, or None to go back one"""
+    if after is None:
+        state['cursors'].pop()
+    else:
+        state['cursors'].append(after)
+
+
+def paginated_list(key: str, fetch, render_row, filters: tuple = (), page_size: int = PAGE_SIZE) -> list:
+    """Render one page of fetch(after=row, limit=n) with render_row, then Previous/Next buttons; returns the page"""
+    state = st.session_state.setdefault(f"pages_{key}", {'filters': filters, 'cursors': [None]})
+    if state['filters'] != filters:
+        state.update(filters=filters, cursors=[None])
+    rows = fetch(after=state['cursors'][-1], limit=page_size + 1)
+    while not rows and len(state['cursors']) > 1:
+        # Everything after this page's start is gone (deleted, archived): step back
+        state['cursors'].pop()
+        rows = fetch(after=state['cursors'][-1], limit=page_size + 1)
+
+    page, more = rows[:page_size], len(rows) > page_size
+    for row in page:
+        render_row(row)
+
+    number = len(state['cursors'])
+    if number > 1 or more:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("◀ Previous", key=f"{key}_previous", disabled=number == 1, on_click=turn_page, args=(state, None))
+        with col2:
+            st.caption(f"Page {number}")
+        with col3:
+            st.button("Next ▶", key=f"{key}_next", disabled=not more, on_click=turn_page,
+                      args=(state, page[-1] if page else None))
+    return page
+
 # ===== ONBOARDING FLOW =====
 if not profile.get('onboarding_completed'):
-    st.markdown("<h1 style='text-align: center;'>⚔️ WELCOME TO GOAL QUEST</h1>", unsafe_allow_html=True)
-    st.markdown("<h3 style='text-align: center; color: #d4af37;'>Your Journey to Power Begins Here</h3>", unsafe_allow_html=True)
+    st.markdown(heading("⚔️ WELCOME TO GOAL QUEST"), unsafe_allow_html=True)
+    st.markdown(heading("Your Journey to Power Begins Here", 3), unsafe_allow_html=True)
     
     st.markdown("---")
     
@@ -307,32 +551,10 @@ if not profile.get('onboarding_completed'):
 else:
     # ===== SIDEBAR NAVIGATION =====
     with st.sidebar:
-        st.markdown("<h1 style='text-align: center;'>⚔️ GOAL QUEST</h1>", unsafe_allow_html=True)
-        
-        # User Profile Card
-        st.markdown(f"""
-        <div style='text-align: center; padding: 20px; background: linear-gradient(135deg, #2d2d2d 0%, #1a1a1a 100%); border-radius: 15px; border: 2px solid #d4af37; margin-bottom: 20px;'>
-            <h2 style='margin: 0;'>{profile.get('display_name', 'Hunter')}</h2>
-            <p style='margin: 5px 0; color: #d4af37;'>{profile.get('avatar_style', 'warrior').capitalize()}</p>
-            <div class='level-badge'>LEVEL {stats.get('level', 1)}</div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # XP Progress
-        current_xp = stats.get('current_xp', 0)
-        level = stats.get('level', 1)
-        xp_needed = level * 500
-        progress = current_xp / xp_needed if xp_needed > 0 else 0
-        
-        st.progress(progress)
-        st.markdown(f"<p style='text-align: center;' class='xp-glow'>⚡ XP: {current_xp:,} / {xp_needed:,}</p>", unsafe_allow_html=True)
-        
-        # Gold Counter with glow
-        st.markdown(f"""
-        <div style='text-align: center; padding: 10px; background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 100%); border-radius: 10px; border: 2px solid #ffd700; margin: 10px 0;'>
-            <h3 style='margin: 0; color: #ffd700;'>💰 {stats.get('current_gold', 0):,} Gold</h3>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(heading("⚔️ GOAL QUEST"), unsafe_allow_html=True)
+        
+        # Profile card, XP and gold: reruns on its own after a check-in or purchase
+        sidebar_counters(profile, stats)
         
         st.markdown("---")
         
@@ -357,6 +579,11 @@ else:
             if st.button(label, key=page_name, use_container_width=True):
                 st.session_state.page = page_name
                 st.rerun()
+        
+        if AUTH_MODE == 'oidc':
+            st.markdown("---")
+            st.caption(f"Signed in as {handle}")
+            st.button("🚪 Log out", on_click=st.logout, use_container_width=True)
 
     # ===== MAIN CONTENT AREA =====
     current_page = st.session_state.page
@@ -366,7 +593,7 @@ else:
         user_name = profile.get('display_name', 'Hunter')
         
         st.title(f"🏠 {user_name}'s Command Center")
-        st.markdown(f"<p style='font-size: 1.2em; color: #d4af37;'>Welcome back, {user_name}! Ready to continue your journey?</p>", unsafe_allow_html=True)
+        st.markdown(tagline(f"Welcome back, {user_name}! Ready to continue your journey?"), unsafe_allow_html=True)
         
         st.markdown("---")
         
@@ -383,33 +610,6 @@ else:
             level = stats.get('level', 1)
             avatar_style = profile.get('avatar_style', 'warrior')
             
-            # Determine stage
-            if level >= 76:
-                stage_name = "Shadow Monarch"
-                stage_icon = "👑"
-                border_color = "#FFD700"
-                glow = "0 0 30px rgba(255, 215, 0, 0.8)"
-            elif level >= 51:
-                stage_name = "S-Rank Hunter"
-                stage_icon = "⚔️"
-                border_color = "#FFA500"
-                glow = "0 0 25px rgba(255, 165, 0, 0.6)"
-            elif level >= 26:
-                stage_name = "Elite Hunter"
-                stage_icon = "🛡️"
-                border_color = "#d4af37"
-                glow = "0 0 20px rgba(212, 175, 55, 0.5)"
-            elif level >= 11:
-                stage_name = "Skilled Hunter"
-                stage_icon = "🗡️"
-                border_color = "#C0C0C0"
-                glow = "0 0 15px rgba(192, 192, 192, 0.4)"
-            else:
-                stage_name = "Novice Hunter"
-                stage_icon = "⚡"
-                border_color = "#808080"
-                glow = "0 0 10px rgba(128, 128, 128, 0.3)"
-            
             # Avatar style icons
             style_icons = {
                 'warrior': '⚔️',
@@ -418,44 +618,9 @@ else:
                 'sage': '📿'
             }
             
-            main_icon = style_icons.get(avatar_style, '⚔️')
-            
-            # Render character card
-            # Render character card
-            st.markdown(f"""
-            <div style='
-                background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 100%);
-                padding: 40px;
-                border-radius: 20px;
-                border: 4px solid {border_color};
-                box-shadow: {glow};
-                text-align: center;
-                margin: 20px 0;
-            '>
-                <div style='font-size: 120px; margin-bottom: 20px;'>{main_icon}</div>
-                <div style='font-size: 48px; margin-bottom: 10px;'>{stage_icon}</div>
-                <h2 style='color: #d4af37; margin: 10px 0;'>{user_name}</h2>
-                <p style='color: #ffffff; font-size: 1.2em; margin: 5px 0;'>{stage_name}</p>
-                <p style='color: #aaaaaa; margin: 5px 0;'>{avatar_style.capitalize()}</p>
-                
-                <div style='
-                    background: linear-gradient(90deg, #d4af37 0%, #ffd700 100%);
-                    padding: 15px;
-                    border-radius: 15px;
-                    margin-top: 20px;
-                '>
-                    <p style='color: #0a0a0a; font-size: 1.5em; font-weight: bold; margin: 0;'>
-                        LEVEL {level}
-                    </p>
-                </div>
-                
-                <div style='margin-top: 20px;'>
-                    <p style='color: #ffd700; font-size: 1.3em; margin: 5px 0;'>
-                        💰 {stats.get('current_gold', 0):,} Gold
-                    </p>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            # Character card; its border and glow follow the level's stage
+            st.markdown(hunter_card(user_name, style_icons.get(avatar_style, '⚔️'), avatar_style.capitalize(),
+                                    level, stats.get('current_gold', 0)), unsafe_allow_html=True)
             
             # Equipment Display
             st.markdown("#### ⚔️ Equipment")
@@ -473,19 +638,7 @@ else:
                     item_id = equipped.get(slot, '')
                     if item_id:
                         item_name = item_id.replace('_', ' ').title()
-                        st.markdown(f"""
-                        <div style='
-                            background: #2d2d2d;
-                            padding: 10px;
-                            border-radius: 8px;
-                            border: 2px solid #d4af37;
-                            margin: 5px 0;
-                        '>
-                            <div style='font-size: 24px;'>{icon}</div>
-                            <div style='color: #d4af37; font-size: 0.9em;'>{name}</div>
-                            <div style='color: #ffffff; font-size: 0.8em;'>{item_name}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
+                        st.markdown(equipment_slot(icon, name, item_name), unsafe_allow_html=True)
                     else:
                         st.caption(f"{icon} {name}: Empty")
         
@@ -502,11 +655,13 @@ else:
                 'willpower': '🔥'
             }
             
+            # Effective values; the delta is what gear, achievements and boosts add to the base
+            effective_stats = db.get_effective_stats()
             stat_cols = st.columns(2)
             for idx, (stat, icon) in enumerate(stats_config.items()):
                 with stat_cols[idx % 2]:
-                    value = stats.get(stat, 0)
-                    st.metric(f"{icon} {stat.capitalize()}", value)
+                    bonus = effective_stats[stat] - (stats.get(stat) or 0)
+                    st.metric(f"{icon} {stat.capitalize()}", effective_stats[stat], delta=f"+{bonus}" if bonus else None)
             
             st.markdown("---")
             
@@ -517,16 +672,12 @@ else:
                 st.metric("💰 Gold", f"{stats.get('current_gold', 0):,}")
             with col2:
                 habits = db.get_habits()
-                max_streak = 0
-                if habits:
-                    for habit in habits:
-                        completions = db.get_completions(habit['id'])
-                        streak = calculate_streak(completions)
-                        max_streak = max(max_streak, streak)
+                today = get_cst_date()
+                bitmaps = db.get_habit_bitmaps([h['id'] for h in habits])
+                max_streak = max(live_streaks(db, habits, bitmaps, today).values(), default=0)
                 st.metric("🔥 Best Streak", max_streak)
                 
-                today = get_cst_date()
-                completed_today = sum(1 for h in habits if db.is_completed(h['id'], today))
+                completed_today = sum(1 for b in bitmaps.values() if b.has(today))
                 st.metric("✅ Today", f"{completed_today}/{len(habits) if habits else 0}")
         
         st.markdown("---")
@@ -563,30 +714,7 @@ else:
         
         if priority_habits:
             for habit in priority_habits[:5]:
-                col1, col2, col3 = st.columns([3, 1, 1])
-                
-                with col1:
-                    completed = db.is_completed(habit['id'], today)
-                    new_completed = st.checkbox(
-                        f"{'✅' if completed else '⬜'} **{habit['name']}**",
-                        value=completed,
-                        key=f"dash_habit_{habit['id']}"
-                    )
-                    
-                    if new_completed != completed:
-                        db.toggle_completion(habit['id'], today, new_completed)
-                        if new_completed:
-                            st.balloons()
-                            st.success(f"🎉 {user_name} completed: {habit['name']}! +{habit['xp_reward']} XP, +{habit.get('gold_reward', 0)} Gold!")
-                        st.rerun()
-                
-                with col2:
-                    difficulty_icons = {1: "🟢 Easy", 2: "🟡 Med", 3: "🔴 Hard"}
-                    st.caption(difficulty_icons.get(habit['difficulty'], '🟢'))
-                
-                with col3:
-                    st.caption(f"⚡ +{habit['xp_reward']} XP")
-                    st.caption(f"💰 +{habit.get('gold_reward', 0)} Gold")
+                render_fragment(priority_quest, f"quest_{habit['id']}", habit, today, bitmaps, stats)
         else:
             st.info(f"💡 {user_name}, mark habits as priority in the Habits page!")
         
@@ -716,71 +844,95 @@ else:
                         st.success(f"✨ Created: {name} (+{assessment['xp_reward']} XP per completion)")
                         st.rerun()
             
-            # Display Active Habits
+            # Backfill check-ins from a CSV export or a spreadsheet
+            with st.expander("📥 Backfill Check-ins from CSV", expanded=False):
+                st.caption("Columns: `date` (YYYY-MM-DD) and `habit` (name or id). Rows already checked in are skipped.")
+                csv_file = st.file_uploader("Choose a CSV file", type=['csv'], key="backfill_csv")
+                
+                if csv_file is not None:
+                    import pandas as pd
+                    try:
+                        rows = pd.read_csv(csv_file, dtype=str).rename(columns=str.lower)
+                        rows['date'] = pd.to_datetime(rows['date']).dt.date
+                    except Exception as e:
+                        st.error(f"Could not read CSV: {e}")
+                        rows = None
+                    
+                    if rows is not None and 'habit' in rows:
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            start = st.date_input("From", value=rows['date'].min(), key="backfill_start")
+                        with col2:
+                            end = st.date_input("To", value=min(rows['date'].max(), get_cst_date()), key="backfill_end")
+                        
+                        habit_ids = {h['name'].strip().lower(): h['id'] for h in db.get_habits(active_only=False)}
+                        habit_ids.update({str(habit_id): habit_id for habit_id in habit_ids.values()})
+                        in_range = rows[(rows['date'] >= start) & (rows['date'] <= end)]
+                        checkins = [(habit_ids[str(habit).strip().lower()], str(day))
+                                    for habit, day in zip(in_range['habit'], in_range['date'])
+                                    if str(habit).strip().lower() in habit_ids]
+                        unknown = len(in_range) - len(checkins)
+                        
+                        st.info(f"{len(checkins)} check-ins between {start} and {end}"
+                                + (f" ({unknown} rows with unknown habits ignored)" if unknown else ""))
+                        if st.button("📥 Import Check-ins", use_container_width=True, disabled=not checkins):
+                            result = db.complete_habits(checkins, earned_checkin_achievements)
+                            for habit_id, _ in checkins:
+                                st.session_state.pop(f"habit_{habit_id}", None)
+                                st.session_state.pop(f"dash_habit_{habit_id}", None)
+                            st.success(f"✅ {result['completed']} check-ins imported, {result['skipped']} skipped. "
+                                       f"+{result['xp']} XP, +{result['gold']} Gold!")
+                    elif rows is not None:
+                        st.error("CSV needs `date` and `habit` columns")
+            
+            # Display Active Habits (bitmaps for all, for the bulk check-in; rows a page at a time)
             habits = db.get_habits(active_only=True)
             today = get_cst_date()
+            bitmaps = db.get_habit_bitmaps([h['id'] for h in habits])
+            streaks = {}
             
             if habits:
                 st.markdown(f"### {len(habits)} Active Habits")
                 
-                for habit in habits:
-                    with st.container():
-                        col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
-                        
-                        with col1:
-                            completed = db.is_completed(habit['id'], today)
-                            new_completed = st.checkbox(
-                                f"**{habit['name']}**",
-                                value=completed,
-                                key=f"habit_{habit['id']}"
-                            )
-                            
-                            if new_completed != completed:
-                                db.toggle_completion(habit['id'], today, new_completed)
-                                
-                                if new_completed:
-                                    st.balloons()
-                                    # Check completion achievements
-                                    total_completions = len(db.get_completions(habit['id']))
-                                    if total_completions == 1:
-                                        db.unlock_achievement("first_complete")
-                                    elif total_completions == 100:
-                                        db.unlock_achievement("complete_100")
-                                
-                                st.rerun()
-                            
-                            if habit.get('description'):
-                                st.caption(habit['description'])
-                        
-                        with col2:
-                            difficulty_map = {1: "🟢 Easy", 2: "🟡 Med", 3: "🔴 Hard"}
-                            st.caption(difficulty_map.get(habit['difficulty'], '🟢'))
-                            if habit.get('priority'):
-                                st.caption("⭐ Priority")
-                        
-                        with col3:
-                            st.caption(f"⚡ +{habit['xp_reward']} XP")
-                            st.caption(f"💰 +{habit.get('gold_reward', 0)} Gold")
-                        
-                        with col4:
-                            completions = db.get_completions(habit['id'])
-                            streak = calculate_streak(completions)
-                            st.caption(f"🔥 {streak} days")
-                            st.caption(f"✅ {len(completions)} total")
-                        
-                        st.markdown("---")
+                # One transaction for the whole day instead of a rerun per checkbox
+                due_today = [h for h in habits if habit_mask(h) >> today.weekday() & 1 and not bitmaps[h['id']].has(today)]
+                if due_today and st.button(f"✅ Complete All Today's Habits ({len(due_today)})", use_container_width=True):
+                    result = db.complete_habits([(h['id'], today) for h in due_today], earned_checkin_achievements)
+                    # Drop stale checkbox state so the rows render as checked
+                    for h in due_today:
+                        st.session_state.pop(f"habit_{h['id']}", None)
+                        st.session_state.pop(f"dash_habit_{h['id']}", None)
+                    st.balloons()
+                    st.session_state.bulk_checkin_result = result
+                    st.rerun()
+                
+                if 'bulk_checkin_result' in st.session_state:
+                    result = st.session_state.pop('bulk_checkin_result')
+                    st.success(f"🎉 Completed {result['completed']} habits! +{result['xp']} XP, +{result['gold']} Gold!"
+                               + (" ⬆️ LEVEL UP!" if result['leveled_up'] else ""))
+                    if result['achievements']:
+                        st.success(f"🏆 Unlocked {len(result['achievements'])} achievements!")
+                
+                categories = sorted({h['category'] for h in habits})
+                category = st.selectbox("Category", ["All"] + categories, key="habit_category") if len(categories) > 1 else "All"
+                category = None if category == "All" else category
+                
+                def habit_page(after=None, limit=None):
+                    page = db.get_habits(active_only=True, category=category, after=after, limit=limit)
+                    streaks.update(live_streaks(db, page, bitmaps, today))
+                    return page
+                
+                paginated_list("habits", habit_page, lambda habit: render_fragment(
+                    habit_row, f"habit_row_{habit['id']}", habit, today, bitmaps, streaks, stats), (category,))
             else:
                 st.info("💡 Create your first habit to begin your journey!")
         
         with tab2:
-            all_habits = db.get_habits(active_only=False)
-            completed_habits = [h for h in all_habits if not h.get('active', True)]
+            archived = paginated_list(
+                "archived_habits", lambda after, limit: db.get_habits(active_only=False, archived_only=True, after=after, limit=limit),
+                lambda habit: st.caption(f"✅ {habit['name']} - {habit['category']}"))
             
-            if completed_habits:
-                st.markdown(f"### {len(completed_habits)} Archived Habits")
-                for habit in completed_habits:
-                    st.caption(f"✅ {habit['name']} - {habit['category']}")
-            else:
+            if not archived:
                 st.caption("No archived habits")
 
     # ===== GOALS PAGE =====
@@ -863,12 +1015,12 @@ else:
                         st.rerun()
             
             # Display Active Goals
-            goals = db.get_goals(completed=False)
+            active_goals = db.count_goals(completed=False)
             
-            if goals:
-                st.markdown(f"### {len(goals)} Active Goals")
+            if active_goals:
+                st.markdown(f"### {active_goals} Active Goals")
                 
-                for goal in goals:
+                def goal_row(goal):
                     with st.expander(f"{'⭐ ' if goal.get('priority') else ''}{goal['title']}", expanded=True):
                         if goal.get('description'):
                             st.markdown(goal['description'])
@@ -891,10 +1043,10 @@ else:
                                 st.success(f"🏆 Goal Completed! +{goal['xp_reward']} XP, +{goal.get('gold_reward', 0)} Gold!")
                                 
                                 # Check achievements
-                                completed_goals = db.get_goals(completed=True)
-                                if len(completed_goals) == 1:
+                                completed_goals = db.count_goals(completed=True)
+                                if completed_goals == 1:
                                     db.unlock_achievement("goal_complete_1")
-                                elif len(completed_goals) == 5:
+                                elif completed_goals == 5:
                                     db.unlock_achievement("goal_complete_5")
                             
                             st.rerun()
@@ -916,18 +1068,24 @@ else:
                                 st.markdown("**Action Steps:**")
                                 for i, step in enumerate(steps, 1):
                                     st.caption(f"{i}. {step}")
+                
+                paginated_list("goals", lambda after, limit: db.get_goals(completed=False, after=after, limit=limit), goal_row)
             else:
                 st.info("🎯 Set your first goal and watch your power grow!")
         
         with tab2:
-            completed_goals = db.get_goals(completed=True)
+            completed_goals = db.count_goals(completed=True)
             
             if completed_goals:
-                st.markdown(f"### 🏆 {len(completed_goals)} Completed Goals")
-                for goal in completed_goals:
+                st.markdown(f"### 🏆 {completed_goals} Completed Goals")
+                
+                def completed_goal_row(goal):
                     st.markdown(f"**✅ {goal['title']}**")
                     st.caption(f"{goal['category'].capitalize()} • +{goal['xp_reward']} XP earned")
                     st.markdown("---")
+                
+                paginated_list("completed_goals", lambda after, limit: db.get_goals(completed=True, after=after, limit=limit),
+                               completed_goal_row)
             else:
                 st.caption("No completed goals yet. Complete your first to unlock achievements!")
     
@@ -945,31 +1103,27 @@ else:
             if uploaded_file:
                 if st.button("Analyze & Save to Library"):
                     with st.spinner("The Coach is studying your document..."):
-                        pdf_text = extract_pdf_text(uploaded_file)
+                        doc, status = store_pdf(db, uploaded_file)
                         
-                        if pdf_text:
-                            # Save to philosophy_documents table
-                            doc_id = db.upload_document(
-                                filename=uploaded_file.name,
-                                content=pdf_text,
-                                file_type="pdf",
-                                file_size=uploaded_file.size
-                            )
-                            
-                            # AI Analysis
-                            analysis = ai_coach.analyze_pdf_content(pdf_text, uploaded_file.name)
-                            
-                            # Update record with analysis
-                            db.update_document(
-                                doc_id, 
-                                ai_summary=analysis.get('summary', ''), 
-                                key_concepts=analysis.get('key_concepts', [])
-                            )
+                        if status == 'duplicate':
+                            st.info(f"'{uploaded_file.name}' is already in your knowledge base.")
+                        elif doc:
+                            # AI Analysis (cached on the stored file if it was analyzed before)
+                            if not doc.get('ai_summary'):
+                                analysis = ai_coach.analyze_pdf_content(db.get_document_content(doc['id']), uploaded_file.name)
+                                
+                                # Update record with analysis
+                                db.update_document(
+                                    doc['id'], 
+                                    ai_summary=analysis.get('summary', ''), 
+                                    key_concepts=analysis.get('key_concepts', [])
+                                )
                             
                             st.success(f"Successfully added '{uploaded_file.name}' to your knowledge base!")
+                            warn_similar_documents(db, doc['id'])
         
         # Check if AI is available
-        has_api_key = ai_coach.client is not None
+        has_api_key = ai_coach.available
         if not has_api_key:
             st.warning("⚠️ AI Coach requires an Anthropic API key. Add it in Streamlit Cloud secrets.")
         
@@ -1004,68 +1158,6 @@ else:
                     else:
                         st.error("API Key required.")
         
-        # Tabs for different AI Coach features
-        coach_tabs = st.tabs(["💬 Ask Coach", "🎯 Goal Planning", "⚡ Habit Builder", "📈 Progress Analysis"])
-        
-        with coach_tabs[0]:  # Ask Coach
-            st.markdown(f"### 💬 Ask Your AI Coach")
-            
-            # Retrieves all uploaded content to give the AI context
-            pdf_context = db.get_all_document_content()
-            
-            with st.form("ask_coach_form"):
-                question = st.text_area("What would you like guidance on?")
-                submitted = st.form_submit_button("Seek Wisdom")
-                
-                if submitted and question:
-                    # Your logic for handling the question goes here
-                    pass
-                                # Build context
-                                context = ""
-                                
-                                if include_progress:
-                                    habits = db.get_habits()
-                                    goals = db.get_goals(completed=False)
-                                    context += f"\n\n{user_name}'s Current Habits:\n"
-                                    for h in habits[:5]:
-                                        context += f"- {h['name']} ({h['category']})\n"
-                                    context += f"\n{user_name}'s Active Goals:\n"
-                                    for g in goals[:5]:
-                                        context += f"- {g['title']} ({g.get('progress', 0)}% complete)\n"
-                                
-                                if include_library and pdf_context:
-                                    context += f"\n\nRelevant wisdom from {user_name}'s philosophy library:\n{pdf_context[:5000]}"
-                                
-                                # Get AI response
-                                message = ai_coach.client.messages.create(
-                                    model="claude-sonnet-4-20250514",
-                                    max_tokens=3000,
-                                    messages=[{
-                                        "role": "user",
-                                        "content": f"""You are a wise AI coach helping {user_name} on their personal growth journey. 
-
-User's Philosophy Tradition: {profile.get('philosophy_tradition', 'esoteric').capitalize()}
-User's Focus Areas: {', '.join(profile.get('focus_areas', ['personal growth']))}
-
-{context}
-
-Question from {user_name}:
-{question}
-
-Provide thoughtful, actionable guidance. Be encouraging but honest."""
-                                    }]
-                                )
-                                
-                                response = message.content[0].text
-                                
-                                st.success(f"🤖 **AI Coach's Guidance:**")
-                                st.markdown(response)
-                                
-                            except Exception as e:
-                                st.error(f"Error getting AI response: {e}")
-                    else:
-                        st.info(f"Add your Anthropic API key to unlock full AI coaching!")
-        
         with coach_tabs[1]:  # Goal Planning
             st.markdown(f"### 🎯 AI-Powered Goal Planning")
             
@@ -1262,10 +1354,10 @@ WHY IT WORKS: [reasoning]"""
                             stats = db.get_stats()
                             
                             # Calculate stats
-                            total_completions = 0
-                            for habit in habits:
-                                completions = db.get_completions(habit['id'])
-                                total_completions += len(completions)
+                            today = get_cst_date()
+                            bitmaps = db.get_habit_bitmaps([h['id'] for h in habits])
+                            streaks = live_streaks(db, habits, bitmaps, today)
+                            total_completions = sum(len(b) for b in bitmaps.values())
                             
                             # Build analysis context
                             context = f"""
@@ -1280,9 +1372,8 @@ WHY IT WORKS: [reasoning]"""
 Recent Habits:
 """
                             for habit in habits[:10]:
-                                completions = db.get_completions(habit['id'])
-                                streak = calculate_streak(completions)
-                                context += f"- {habit['name']}: {len(completions)} completions, {streak} day streak\n"
+                                bitmap = bitmaps[habit['id']]
+                                context += f"- {habit['name']}: {len(bitmap)} completions, {streaks[habit['id']]} day streak\n"
                             
                             pdf_context = db.get_all_document_content()
                             
@@ -1325,27 +1416,25 @@ Be encouraging and specific."""
         
         st.markdown("---")
         
-        # Get documents
-        documents = db.get_documents()
+        # Library totals (documents themselves are listed a page at a time below)
+        library = db.get_library_summary()
         
         # Display library stats
-        if documents:
-            total_size = sum(doc['file_size'] for doc in documents)
-            total_size_mb = total_size / (1024 * 1024)
+        if library['documents']:
+            total_size_mb = library['total_size'] / (1024 * 1024)
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("📚 Documents", len(documents))
+                st.metric("📚 Documents", library['documents'])
             with col2:
                 st.metric("💾 Total Size", f"{total_size_mb:.1f} MB")
             with col3:
-                analyzed = sum(1 for doc in documents if doc.get('ai_summary'))
-                st.metric("🤖 AI Analyzed", analyzed)
+                st.metric("🤖 AI Analyzed", library['analyzed'])
             
             st.markdown("---")
         
         # Upload Section
-        with st.expander("📤 Upload New Document", expanded=not documents):
+        with st.expander("📤 Upload New Document", expanded=not library['documents']):
             st.markdown("### Upload Philosophy Document")
             st.caption("Supported: PDF files up to 999MB")
             
@@ -1367,33 +1456,31 @@ Be encouraging and specific."""
                     if st.button(f"📥 Process and Add to Library", use_container_width=True):
                         with st.spinner(f"📖 Processing {uploaded_file.name}..."):
                             try:
-                                import PyPDF2
-                                import io
+                                pages = []
                                 
-                                pdf_reader = PyPDF2.PdfReader(io.BytesIO(uploaded_file.read()))
+                                def extract_pages(file):
+                                    import PyPDF2
+                                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.getvalue()))
+                                    pages.extend(page.extract_text() for page in pdf_reader.pages)
+                                    return "".join(page + "\n\n" for page in pages)
                                 
-                                text_content = ""
-                                for page in pdf_reader.pages:
-                                    text_content += page.extract_text() + "\n\n"
+                                doc, status = store_pdf(db, uploaded_file, extract_pages)
                                 
-                                if text_content.strip():
-                                    # Save document
-                                    doc_id = db.upload_document(
-                                        filename=uploaded_file.name,
-                                        content=text_content,
-                                        file_type='pdf',
-                                        file_size=file_size
-                                    )
-                                    
-                                    st.success(f"✅ Text extracted from {len(pdf_reader.pages)} pages")
+                                if status == 'duplicate':
+                                    st.info(f"📚 **{doc['filename']}** is already in your library")
+                                elif doc:
+                                    if status == 'linked':
+                                        st.success("✅ Already processed before - reused the extracted text and analysis")
+                                    else:
+                                        st.success(f"✅ Text extracted from {len(pages)} pages")
                                     
-                                    # AI Analysis
-                                    if ai_coach.client:
+                                    # AI Analysis (skipped when the stored file already has one)
+                                    if ai_coach.client and not doc.get('ai_summary'):
                                         with st.spinner("🤖 AI analyzing..."):
-                                            analysis = ai_coach.analyze_pdf_content(text_content, uploaded_file.name)
+                                            analysis = ai_coach.analyze_pdf_content(db.get_document_content(doc['id']), uploaded_file.name)
                                             
                                             db.update_document(
-                                                doc_id,
+                                                doc['id'],
                                                 ai_summary=analysis['summary'],
                                                 key_concepts=analysis['key_concepts']
                                             )
@@ -1409,12 +1496,13 @@ Be encouraging and specific."""
                                     
                                     # Achievements
                                     db.unlock_achievement("philosophy_upload")
-                                    docs = db.get_documents()
-                                    if len(docs) >= 5:
+                                    if db.get_library_summary()['documents'] >= 5:
                                         db.unlock_achievement("philosophy_5")
                                     
                                     st.balloons()
-                                    st.rerun()
+                                    # Keep a near-duplicate warning on screen rather than rerunning past it
+                                    if not warn_similar_documents(db, doc['id']):
+                                        st.rerun()
                                 else:
                                     st.error("❌ Could not extract text. Make sure PDF contains readable text.")
                                 
@@ -1424,10 +1512,11 @@ Be encouraging and specific."""
         st.markdown("---")
         
         # Document Library Display
-        if documents:
-            st.markdown(f"### 📚 Your Documents ({len(documents)})")
+        if library['documents']:
+            st.markdown(f"### 📚 Your Documents ({library['documents']})")
+            search = st.text_input("🔍 Search", placeholder="Filename", key="library_search").strip()
             
-            for doc in documents:
+            def document_row(doc):
                 with st.expander(f"📄 {doc['filename']}", expanded=False):
                     doc_size_mb = doc['file_size'] / (1024 * 1024)
                     
@@ -1456,13 +1545,13 @@ Be encouraging and specific."""
                                 for concept in concepts[:15]:
                                     st.markdown(f"• {concept}")
                         
-                        # Content preview
-                        if doc.get('content'):
+                        # Content preview (only the start of the text is decompressed)
+                        preview = db.get_document_content(doc['id'], limit=501)
+                        if preview:
                             st.markdown("#### 📖 Preview")
-                            preview = doc['content'][:500]
                             st.text_area(
                                 "Preview",
-                                value=preview + "..." if len(doc['content']) > 500 else preview,
+                                value=preview[:500] + "..." if len(preview) > 500 else preview,
                                 height=150,
                                 disabled=True,
                                 key=f"preview_{doc['id']}",
@@ -1477,11 +1566,11 @@ Be encouraging and specific."""
                             st.session_state[f'viewing_{doc["id"]}'] = True
                         
                         # Re-analyze
-                        if ai_coach.client:
+                        if ai_coach.available:
                             if st.button("🔄 Re-analyze", key=f"reanalyze_{doc['id']}", use_container_width=True):
                                 with st.spinner("🤖 Re-analyzing..."):
                                     analysis = ai_coach.analyze_pdf_content(
-                                        doc.get('content', ''),
+                                        db.get_document_content(doc['id']),
                                         doc['filename']
                                     )
                                     
@@ -1502,10 +1591,7 @@ Be encouraging and specific."""
                             st.warning("⚠️ Confirm?")
                             
                             if st.button("✅ Yes", key=f"yes_{doc['id']}"):
-                                conn = db.get_connection()
-                                c = conn.cursor()
-                                c.execute("DELETE FROM philosophy_documents WHERE id = ?", (doc['id'],))
-                                conn.commit()
+                                db.delete_document(doc['id'])
                                 
                                 st.success(f"🗑️ Deleted: {doc['filename']}")
                                 del st.session_state[f'confirm_delete_{doc["id"]}']
@@ -1520,10 +1606,11 @@ Be encouraging and specific."""
                         st.markdown("---")
                         st.markdown("### 📖 Full Content")
                         
-                        if doc.get('content'):
+                        full_content = db.get_document_content(doc['id'])
+                        if full_content:
                             st.text_area(
                                 "Full Content",
-                                value=doc['content'],
+                                value=full_content,
                                 height=400,
                                 disabled=True,
                                 key=f"full_{doc['id']}",
@@ -1532,7 +1619,7 @@ Be encouraging and specific."""
                             
                             st.download_button(
                                 "💾 Download as TXT",
-                                data=doc['content'],
+                                data=full_content,
                                 file_name=f"{doc['filename']}.txt",
                                 mime="text/plain",
                                 key=f"download_{doc['id']}"
@@ -1541,6 +1628,11 @@ Be encouraging and specific."""
                         if st.button("❌ Close", key=f"close_{doc['id']}"):
                             del st.session_state[f'viewing_{doc["id"]}']
                             st.rerun()
+            
+            shown = paginated_list("documents", lambda after, limit: db.get_documents(search, after=after, limit=limit),
+                                   document_row, (search,))
+            if not shown:
+                st.caption(f"No documents match \"{search}\"")
         else:
             st.info(f"📚 {user_name}'s library is empty. Upload your first document above!")
 
@@ -1548,11 +1640,10 @@ Be encouraging and specific."""
     elif current_page == "Shop":
         st.title("🛒 Shadow Monarch's Shop")
         
-        st.markdown(f"""
-        <div style='background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 100%); padding: 20px; border-radius: 15px; border: 2px solid #d4af37; margin-bottom: 20px;'>
-            <h3 style='text-align: center; color: #d4af37;'>💰 Your Gold: {stats.get('current_gold', 0):,}</h3>
-        </div>
-        """, unsafe_allow_html=True)
+        shop_balance(stats)
+        
+        # Full stacks can't take another purchase
+        owned = {inv_item['item_id']: inv_item['quantity'] for inv_item in db.get_inventory()}
         
         # Shop Categories
         shop_tabs = st.tabs(["⚗️ Consumables", "⚔️ Equipment", "🎨 Cosmetics"])
@@ -1562,51 +1653,14 @@ Be encouraging and specific."""
             consumables = get_items_by_category("consumable")
             
             for item in consumables:
-                rarity = item['rarity']
-                rarity_style = RARITY_COLORS[rarity]
-                
-                col1, col2 = st.columns([3, 1])
-                
-                with col1:
-                    st.markdown(f"**{item['icon']} {item['name']}** ({rarity.upper()})")
-                    st.caption(item['description'])
-                
-                with col2:
-                    price = item.get('price', {})
-                    st.caption(f"💰 {price.get('gold', 0):,}")
-                    
-                    can_buy = can_afford(item, stats.get('current_gold', 0), 0)
-                    if st.button(f"Buy", key=f"buy_{item['id']}", disabled=not can_buy):
-                        if db.spend_gold(price.get('gold', 0)):
-                            db.add_to_inventory(item['id'], 1)
-                            st.success(f"✨ Purchased {item['name']}!")
-                            st.rerun()
+                render_fragment(shop_item, f"shop_{item['id']}", item, owned, stats)
         
         with shop_tabs[1]:  # Equipment
             st.markdown("### ⚔️ Equipment")
             equipment = get_items_by_category("equipment")
             
             for item in equipment:
-                col1, col2 = st.columns([3, 1])
-                
-                with col1:
-                    st.markdown(f"**{item['icon']} {item['name']}**")
-                    st.caption(item['description'])
-                    
-                    if item.get('stats'):
-                        stat_text = ", ".join([f"+{v} {k.capitalize()}" for k, v in item['stats'].items()])
-                        st.caption(f"📊 {stat_text}")
-                
-                with col2:
-                    price = item.get('price', {})
-                    st.caption(f"💰 {price.get('gold', 0):,}")
-                    
-                    can_buy = can_afford(item, stats.get('current_gold', 0), 0)
-                    if st.button(f"Buy", key=f"buy_{item['id']}", disabled=not can_buy):
-                        if db.spend_gold(price.get('gold', 0)):
-                            db.add_to_inventory(item['id'], 1)
-                            st.success(f"✨ Purchased {item['name']}!")
-                            st.rerun()
+                render_fragment(shop_item, f"shop_{item['id']}", item, owned, stats)
         
         with shop_tabs[2]:  # Cosmetics
             st.info("🎨 Cosmetic items coming soon!")
@@ -1625,12 +1679,7 @@ Be encouraging and specific."""
             st.markdown("### ⚔️ Current Loadout")
             
             # Equipment slots
-            for slot, icon, name in [('weapon_id', '⚔️', 'Weapon'), ('armor_id', '🛡️', 'Armor'), ('ring_id', '💍', 'Ring'), ('amulet_id', '📿', 'Amulet')]:
-                item_id = equipped.get(slot, '')
-                if item_id:
-                    st.markdown(f"**{icon} {name}:** {item_id.replace('_', ' ').title()}")
-                else:
-                    st.caption(f"{icon} {name}: Empty")
+            loadout(equipped)
             
             st.markdown("---")
             st.markdown("### 🎒 Available Equipment")
@@ -1641,17 +1690,7 @@ Be encouraging and specific."""
                 for inv_item in equipment_items:
                     item = get_item_by_id(inv_item['item_id'])
                     if item:
-                        col1, col2 = st.columns([3, 1])
-                        
-                        with col1:
-                            st.markdown(f"**{item['icon']} {item['name']}**")
-                            st.caption(item['description'])
-                        
-                        with col2:
-                            if st.button("⚔️ Equip", key=f"equip_{item['id']}"):
-                                db.equip_item(item['id'], item.get('slot', 'misc'))
-                                st.success(f"✨ Equipped {item['name']}!")
-                                st.rerun()
+                        render_fragment(equipment_row, f"equip_row_{item['id']}", item, equipped)
             else:
                 st.info("🛒 Visit the shop to purchase equipment!")
         
@@ -1661,16 +1700,63 @@ Be encouraging and specific."""
             consumable_items = [item for item in inventory if get_item_by_id(item['item_id']) and get_item_by_id(item['item_id']).get('category') == 'consumable']
             
             if consumable_items:
+                habits_for_use = None
                 for inv_item in consumable_items:
                     item = get_item_by_id(inv_item['item_id'])
                     if item:
-                        st.markdown(f"**{item['icon']} {item['name']}** x{inv_item['quantity']}")
-                        st.caption(item['description'])
+                        col1, col2 = st.columns([3, 1])
+                        
+                        with col1:
+                            st.markdown(f"**{item['icon']} {item['name']}** x{inv_item['quantity']}")
+                            st.caption(item['description'])
+                        
+                        with col2:
+                            effect_type = item.get('effect', {}).get('type')
+                            if effect_type not in USABLE_EFFECTS:
+                                st.caption("Used automatically")
+                                continue
+                            
+                            target = None
+                            if effect_type == 'stat_boost_perm':
+                                target = st.selectbox("Stat", STAT_NAMES, key=f"use_target_{item['id']}",
+                                                      format_func=str.capitalize, label_visibility="collapsed")
+                            elif effect_type == 'instant_complete_habit':
+                                if habits_for_use is None:
+                                    active_habits = db.get_habits()
+                                    open_bitmaps = db.get_habit_bitmaps([h['id'] for h in active_habits])
+                                    habits_for_use = [h for h in active_habits if not open_bitmaps[h['id']].has(get_cst_date())]
+                                if not habits_for_use:
+                                    st.caption("No open habits today")
+                                    continue
+                                target = st.selectbox("Habit", habits_for_use, key=f"use_target_{item['id']}",
+                                                      format_func=lambda h: h['name'], label_visibility="collapsed")['id']
+                            
+                            if st.button("✨ Use", key=f"use_{item['id']}"):
+                                if db.use_item(item['id'], target):
+                                    st.success(f"✨ Used {item['name']}!")
+                                    st.rerun()
+                                else:
+                                    st.error("Couldn't use that item")
             else:
                 st.info("🛒 Your inventory is empty. Visit the shop!")
 
+            active_effects = db.get_active_effects()
+            if active_effects:
+                st.markdown("### ✨ Active Effects")
+                now = db.clock.now()
+                for effect in active_effects:
+                    item = get_item_by_id(effect.get('item_id')) if effect.get('item_id') else None
+                    minutes = max(0, int((to_utc(effect['expires_at']) - now).total_seconds() // 60))
+                    label = item['name'] if item else effect['effect_type'].replace('_', ' ').title()
+                    st.caption(f"{item['icon'] if item else '✨'} {label} (x{effect['value']:g}) • {minutes // 60}h {minutes % 60}m left")
+
+            shield_charges = db.get_rollover_state().get('shield_charges')
+            if shield_charges:
+                st.caption(f"🛡️ {shield_charges} streak shield charge(s) left from an opened item")
+
     # ===== ANALYTICS PAGE =====
     elif current_page == "Analytics":
+        import pandas as pd
         st.title("📊 Performance Analytics")
         
         # Time period selector
@@ -1682,18 +1768,12 @@ Be encouraging and specific."""
         
         start_date, end_date = get_date_range(period)
         
-        # Calculate stats
+        # Calculate stats from the daily rollups (one row per day)
         habits = db.get_habits()
-        total_completions = 0
-        xp_earned = 0
-        active_days = set()
-        
-        for habit in habits:
-            completions = db.get_completions(habit['id'], start_date, end_date)
-            total_completions += len(completions)
-            xp_earned += len(completions) * habit['xp_reward']
-            for comp in completions:
-                active_days.add(comp['date'])
+        totals = db.get_rollup_totals(start_date, end_date)
+        total_completions = totals['completions']
+        xp_earned = totals['xp_earned']
+        active_days = totals['active_days']
         
         # Metrics
         col1, col2, col3, col4 = st.columns(4)
@@ -1703,11 +1783,11 @@ Be encouraging and specific."""
         with col2:
             st.metric("⚡ XP Earned", format_xp(xp_earned))
         with col3:
-            st.metric("📅 Active Days", len(active_days))
+            st.metric("📅 Active Days", active_days)
         with col4:
-            if habits and active_days:
-                total_possible = len(habits) * len(active_days)
-                completion_rate = get_completion_percentage(total_completions, total_possible)
+            # Scheduled days only: a weekday habit isn't "missed" on Saturday
+            if habits:
+                completion_rate = int(load_completion_matrix(db, habits, start_date, end_date).completion_rate() * 100)
             else:
                 completion_rate = 0
             st.metric("📈 Rate", f"{completion_rate}%")
@@ -1719,11 +1799,11 @@ Be encouraging and specific."""
             st.markdown("### 📊 Habit Completions")
             
             habit_data = []
+            bitmaps = db.get_habit_bitmaps([h['id'] for h in habits])
             for habit in habits:
-                completions = db.get_completions(habit['id'], start_date, end_date)
                 habit_data.append({
                     'Habit': habit['name'],
-                    'Completions': len(completions)
+                    'Completions': bitmaps[habit['id']].count(start_date, end_date)
                 })
             
             if habit_data:
@@ -1747,22 +1827,31 @@ Be encouraging and specific."""
                     pdf_context = db.get_all_document_content()
                     note_id = db.create_note(title=title, content=content, category=category, pinned=pinned)
                     
-                    notes = db.get_notes()
-                    if len(notes) == 1:
+                    notes = db.count_notes()
+                    if notes == 1:
                         db.unlock_achievement("first_note")
-                    elif len(notes) == 10:
+                    elif notes == 10:
                         db.unlock_achievement("notes_10")
                     
                     st.success("✨ Note saved!")
                     st.rerun()
         
         # Display Notes
-        notes = db.get_notes()
+        notes = db.count_notes()
         
         if notes:
-            st.markdown(f"### 📚 {len(notes)} Notes")
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                search = st.text_input("🔍 Search", placeholder="Title or text", key="note_search").strip()
+            with col2:
+                category = st.selectbox("Category", ["All", "personal", "work", "health", "goals", "ideas", "learning"],
+                                        key="note_category")
+            category = None if category == "All" else category
             
-            for note in notes:
+            matching = db.count_notes(search, category) if search or category else notes
+            st.markdown(f"### 📚 {matching} Notes" if matching == notes else f"### 📚 {matching} of {notes} Notes")
+            
+            def note_row(note):
                 with st.expander(f"{'📌 ' if note.get('pinned') else ''}{note['title']}", expanded=note.get('pinned', False)):
                     st.markdown(note.get('content', ''))
                     st.caption(f"📁 {note.get('category', 'personal').capitalize()} • {note.get('created_at', '')[:16]}")
@@ -1775,6 +1864,9 @@ Be encouraging and specific."""
                     
                     if note.get('ai_summary'):
                         st.info(f"**💭 AI Summary:**\n\n{note['ai_summary']}")
+            
+            paginated_list("notes", lambda after, limit: db.get_notes(search, category, after=after, limit=limit),
+                           note_row, (search, category))
         else:
             st.info("📝 Create your first note!")
 
@@ -1782,16 +1874,16 @@ Be encouraging and specific."""
     elif current_page == "Achievements":
         st.title("🏆 Achievements")
         
-        achievements = db.get_achievements()
-        unlocked_count = sum(1 for a in achievements if a.get('unlocked_at'))
+        progress = db.get_achievement_progress()
         
-        st.markdown(f"**Progress: {unlocked_count}/{len(achievements)} Unlocked**")
-        st.progress(unlocked_count / len(achievements) if achievements else 0)
+        st.markdown(f"**Progress: {progress['unlocked']}/{progress['total']} Unlocked**")
+        st.progress(progress['unlocked'] / progress['total'] if progress['total'] else 0)
+        unlocked_only = st.toggle("Unlocked only", key="achievements_unlocked_only")
         
         # Tier icons
         tier_icons = {'bronze': '🥉', 'silver': '🥈', 'gold': '🥇', 'platinum': '💎', 'legendary': '👑'}
         
-        for ach in achievements:
+        def achievement_row(ach):
             unlocked = ach.get('unlocked_at') is not None
             icon = "✅" if unlocked else "🔒"
             tier_icon = tier_icons.get(ach.get('tier', 'bronze'), '🥉')
@@ -1800,6 +1892,9 @@ Be encouraging and specific."""
             st.caption(ach['description'])
             st.caption(f"⚡ +{ach['xp_reward']} XP, 💰 +{ach['gold_reward']} Gold")
             st.markdown("")
+        
+        paginated_list("achievements", lambda after, limit: db.get_achievements(unlocked_only, after=after, limit=limit),
+                       achievement_row, (unlocked_only,))
 
     # ===== SETTINGS PAGE =====
     elif current_page == "Settings":
@@ -1807,10 +1902,55 @@ Be encouraging and specific."""
         
         with st.form("settings_form"):
             display_name = st.text_input("Display Name", value=profile.get('display_name', 'Hunter'))
+            current_tz = profile.get('timezone') or db.clock.timezone_name
+            tz_options = timezone_choices()
+            if current_tz not in tz_options:
+                tz_options = [current_tz] + tz_options
+            timezone_name = st.selectbox("Timezone", tz_options, index=tz_options.index(current_tz),
+                                         help="Your day (and your streaks) roll over at midnight in this timezone")
             
             submitted = st.form_submit_button("💾 Save", use_container_width=True)
             
             if submitted:
-                db.update_profile(display_name=display_name)
+                db.update_profile(display_name=display_name, timezone=timezone_name)
                 st.success("✨ Settings saved!")
                 st.rerun()
+
+# ===== DEBUG PANEL =====
+if profiler:
+    import pandas as pd
+    run = st.session_state.profile_run
+    profiler.finish_run(run)
+    with st.sidebar:
+        with st.expander("🔧 Performance (debug)", expanded=False):
+            st.caption(f"This run ({run.page}): {run.calls} calls, {run.seconds * 1000:.0f} ms of "
+                       f"{run.wall_seconds * 1000:.0f} ms in Database/AICoach")
+            for name in run.hot_spots():
+                st.warning(f"⚠️ {name} ran {run.methods[name].calls}x this run - a query in a loop?")
+            if run.methods:
+                st.dataframe(pd.DataFrame([
+                    {'method': name, 'calls': stat.calls, 'ms': round(stat.seconds * 1000, 1),
+                     'rows': stat.rows, 'KB': round(stat.bytes / 1024, 1)}
+                    for name, stat in run.methods.items()
+                ]).sort_values('ms', ascending=False), hide_index=True)
+            
+            for title, label, totals_by in [("**Full-script runs per page (this process)**", 'page', profiler.pages),
+                                            ("**Fragment-only runs (this process)**", 'fragment', profiler.fragments)]:
+                if not totals_by:
+                    continue
+                st.markdown(title)
+                st.dataframe(pd.DataFrame([
+                    {label: name, 'runs': totals['runs'],
+                     'ms/run': round(totals['wall_seconds'] * 1000 / totals['runs'], 1),
+                     'calls/run': round(totals['calls'] / totals['runs'], 1)}
+                    for name, totals in sorted(totals_by.items())
+                ]), hide_index=True)
+            
+            profile_dir = os.environ.get('GOAL_QUEST_PROFILE_DIR', 'profiles')
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("JSON", key="profile_json", use_container_width=True):
+                    st.success(profiler.write(os.path.join(profile_dir, "goal_quest_profile.json")))
+            with col2:
+                if st.button("Prometheus", key="profile_prom", use_container_width=True):
+                    st.success(profiler.write(os.path.join(profile_dir, "goal_quest_profile.prom")))
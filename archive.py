@@ -0,0 +1,453 @@
+"""
+User Archives
+Streams one user's data out of a Database and back into any Database (SQLite,
+PostgreSQL or a shard) for backups, migrations and seeding.
+
+- Format: newline-delimited JSON, zstd-compressed when the zstandard package
+  is installed and gzip otherwise (detected on read). A header line per table
+  lists its columns and is followed by one JSON array per row; a trailer holds
+  per-table row counts and a SHA-256 of every line before it.
+- Export pages through each table by key and import inserts in executemany
+  batches, so memory stays constant however large the document library is.
+- Import replaces the target user's data in one transaction: ids are remapped,
+  derived tables (daily rollups, bitmaps) are recomputed, and nothing is
+  committed unless the checksum and counts match. --defer-indexes drops the
+  secondary indexes while rows load and rebuilds them afterwards; that is
+  faster but blocks every user of the tables, so only use it on a database
+  (or shard) nobody else is using.
+
+    python archive.py export <handle> <file> [--db goal_quest.db | --url postgresql://... | --data-dir data]
+    python archive.py import <handle> <file> [--defer-indexes] [...]
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+from typing import Dict, Iterator, List, Tuple
+
+from database import Database, BASE_STATS_SCHEMA, INDEXES, SCHEMA_VERSION, UTC_NOTE_TIMES_SCHEMA
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMAT = "goal_quest_archive"
+FORMAT_VERSION = 1
+BATCH_SIZE = 1000
+# Rows that can be megabytes each (whole PDFs) are paged one at a time
+PAGE_SIZES = {'philosophy_documents': 1}
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+
+# (table, how its rows belong to the user, keyset column for paging)
+# 'id' tables hold one row whose id is the user id; documents scope their segments.
+# Parents come before the rows that reference them; user_stats comes after the ledger.
+TABLES = [
+    ('user_profile', 'id', None),
+    ('equipment', 'id', None),
+    ('rollover_state', 'id', None),
+    ('habits', 'user_id', 'id'),
+    ('completions', 'user_id', 'id'),
+    ('goals', 'user_id', 'id'),
+    ('notes', 'user_id', 'id'),
+    ('achievement_unlocks', 'user_id', 'key'),
+    ('motivations', 'user_id', 'id'),
+    ('inventory', 'user_id', 'id'),
+    ('active_effects', 'user_id', 'id'),
+    ('philosophy_documents', 'user_id', 'id'),
+    ('document_segments', 'document', 'id'),
+    ('reward_ledger', 'user_id', 'id'),
+    ('user_stats', 'id', None),
+]
+SCOPES = {table: scope for table, scope, _ in TABLES}
+
+# Tables whose new ids are recorded so child rows can be pointed at them
+REMAPPED = {'habits', 'goals', 'philosophy_documents'}
+REFERENCES = {
+    'completions': {'habit_id': 'habits'},
+    'goals': {'parent_goal_id': 'goals'},
+    'document_segments': {'document_id': 'philosophy_documents'},
+}
+LEDGER_SOURCES = {'habit': 'habits', 'goal': 'goals'}
+
+# Rebuilt from completions and the ledger after import (persisted streaks are recomputed on demand)
+DERIVED = ['daily_rollups', 'habit_bitmaps', 'habit_streaks']
+
+# Stored compressed; archives carry the text itself in `content` and import recompresses it
+COMPRESSED = {'philosophy_documents', 'document_segments'}
+STORAGE_COLUMNS = {'content_compressed', 'dictionary_id'}
+
+
+# ===== FILES =====
+def open_archive(path: str, mode: str, compression: str = None) -> io.TextIOBase:
+    """Text stream over an archive; writes use zstd if available (else gzip), reads detect the format"""
+    if mode == 'w':
+        compression = compression or ('zstd' if zstandard else 'gzip')
+        if compression == 'zstd':
+            if zstandard is None:
+                raise ImportError("zstd archives need the zstandard package: pip install zstandard")
+            stream = zstandard.ZstdCompressor(level=10, threads=-1).stream_writer(open(path, 'wb'), closefd=True)
+        elif compression == 'gzip':
+            stream = gzip.open(path, 'wb', compresslevel=6)
+        else:
+            stream = open(path, 'wb')
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='\n')
+
+    with open(path, 'rb') as probe:
+        magic = probe.read(4)
+    if magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ImportError("zstd archives need the zstandard package: pip install zstandard")
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    elif magic.startswith(GZIP_MAGIC):
+        stream = gzip.open(path, 'rb')
+    else:
+        stream = open(path, 'rb')
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='\n')
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$b64': base64.b64encode(bytes(value)).decode('ascii')}
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+
+def _decode(value):
+    if isinstance(value, dict) and '$b64' in value:
+        return base64.b64decode(value['$b64'])
+    return value
+
+
+# ===== EXPORT =====
+def _select_page(table: str, scope: str, key: str, columns: List[str], limit: int) -> str:
+    selected = ', '.join(f"t.{column}" for column in columns)
+    if table == 'document_segments':
+        selected += ", t.content_compressed, t.dictionary_id"
+    if scope == 'document':
+        return f"""
+            SELECT {selected} FROM {table} t
+            JOIN philosophy_documents pd ON t.document_id = pd.id
+            WHERE pd.user_id = ? AND t.{key} > ? ORDER BY t.{key} LIMIT {limit}
+        """
+    if table == 'philosophy_documents':
+        # Inline the shared stored text so the archive stands alone
+        selected = ', '.join("COALESCE(t.content, b.content)" if column == 'content' else f"t.{column}"
+                             for column in columns)
+        selected += ", COALESCE(t.content_compressed, b.content_compressed), NULL"
+        return f"""
+            SELECT {selected} FROM {table} t
+            LEFT JOIN document_blobs b ON b.sha256 = t.content_sha256
+            WHERE t.user_id = ? AND t.{key} > ? ORDER BY t.{key} LIMIT {limit}
+        """
+    return f"SELECT {selected} FROM {table} t WHERE t.user_id = ? AND t.{key} > ? ORDER BY t.{key} LIMIT {limit}"
+
+
+def _export_rows(db: Database, c, table: str, scope: str, key: str, columns: List[str]) -> Iterator[tuple]:
+    if table == 'user_stats':
+        # Balances with the ledger tail folded in; import points ledger_id at the imported ledger's end
+        stats = db._current_stats(c)
+        if stats:
+            yield tuple(stats.get(column) for column in columns)
+        return
+    if scope == 'id':
+        c.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE id = ?", (db.user_id,))
+        yield from (tuple(row) for row in c.fetchall())
+        return
+
+    # Keyset pages keep memory flat on both backends (psycopg buffers whole result sets)
+    position = 0 if key == 'id' else ''
+    limit = PAGE_SIZES.get(table, BATCH_SIZE)
+    query = _select_page(table, scope, key, columns, limit)
+    key_index = columns.index(key)
+    content_index = columns.index('content') if table in COMPRESSED else None
+    while True:
+        c.execute(query, (db.user_id, position))
+        rows = c.fetchall()
+        for row in rows:
+            row = tuple(row)
+            if content_index is not None:
+                # Trailing (compressed text, dictionary id) columns become plain text in `content`
+                row, (compressed, dictionary_id) = row[:-2], row[-2:]
+                text = db._stored_text(row[content_index], compressed, dictionary_id)
+                row = row[:content_index] + (text,) + row[content_index + 1:]
+            yield row
+        if len(rows) < limit:
+            return
+        position = rows[-1][key_index]
+
+
+def export_user(db: Database, path: str, compression: str = None) -> Dict[str, int]:
+    """Write db's current user to an archive; returns row counts per table"""
+    c = db.get_connection().cursor()
+    available = db.backend.tables(c)
+    digest = hashlib.sha256()
+    counts = {}
+
+    with open_archive(path, 'w', compression) as out:
+        def emit(record):
+            line = json.dumps(record, separators=(',', ':'), ensure_ascii=False, default=_encode) + '\n'
+            digest.update(line.encode('utf-8'))
+            out.write(line)
+
+        emit({'format': FORMAT, 'version': FORMAT_VERSION, 'schema_version': SCHEMA_VERSION,
+              'exported_at': db.clock.now().isoformat(), 'user_id': db.user_id})
+        for table, scope, key in TABLES:
+            if table not in available:
+                continue
+            # user_id is implied by the archive; it is re-applied on import
+            columns = [column for column in db.backend.columns(c, table)
+                       if column != 'user_id' and column not in STORAGE_COLUMNS]
+            emit({'table': table, 'columns': columns})
+            counts[table] = 0
+            for row in _export_rows(db, c, table, scope, key, columns):
+                emit(list(row))
+                counts[table] += 1
+
+        trailer = {'counts': counts, 'sha256': digest.hexdigest()}
+        out.write(json.dumps(trailer, separators=(',', ':')) + '\n')
+    return counts
+
+
+# ===== IMPORT =====
+def _read_lines(path: str) -> Iterator[Tuple[str, object]]:
+    """(raw line, parsed record) pairs"""
+    with open_archive(path, 'r') as source:
+        for line in source:
+            if line.strip():
+                yield line, json.loads(line)
+
+
+def _clear_user(db: Database, c, tables: set):
+    """Delete everything the user owns ahead of a replacing import"""
+    if 'document_segments' in tables:
+        c.execute("""
+            DELETE FROM document_segments
+            WHERE document_id IN (SELECT id FROM philosophy_documents WHERE user_id = ?)
+        """, (db.user_id,))
+    for table, scope, _ in TABLES:
+        if table in tables and scope != 'document':
+            c.execute(f"DELETE FROM {table} WHERE {scope} = ?", (db.user_id,))
+    for table in DERIVED:
+        c.execute(f"DELETE FROM {table} WHERE user_id = ?", (db.user_id,))
+    # Shared stored text that only this user's documents used
+    c.execute("""
+        DELETE FROM document_blobs
+        WHERE NOT EXISTS (SELECT 1 FROM philosophy_documents pd WHERE pd.content_sha256 = document_blobs.sha256)
+    """)
+    if 'document_segments' in tables:
+        c.execute("""
+            DELETE FROM compression_dictionaries
+            WHERE NOT EXISTS (SELECT 1 FROM document_segments ds WHERE ds.dictionary_id = compression_dictionaries.id)
+        """)
+
+
+class _TableLoader:
+    """Maps archived rows of one table onto the target schema and inserts them in batches"""
+
+    def __init__(self, db: Database, c, table: str, columns: List[str], id_maps: Dict[str, Dict]):
+        self.db, self.c, self.table = db, c, table
+        self.id_maps = id_maps
+        self.references = REFERENCES.get(table, {})
+        self.remap = table in REMAPPED
+        self.batch = []
+        self.loaded = self.skipped = 0
+
+        # Columns the target schema doesn't know (archives from newer builds) are dropped
+        target = set(db.backend.columns(c, table))
+        scope = SCOPES[table]
+        keep_id = scope == 'id'
+        self.positions = [(i, column) for i, column in enumerate(columns)
+                          if column in target and (column != 'id' or keep_id)]
+        self.source_id = columns.index('id') if 'id' in columns else None
+        self.source_index = columns.index('source') if table == 'reward_ledger' and 'source' in columns else None
+        self.source_id_index = columns.index('source_id') if self.source_index is not None else None
+
+        names = [column for _, column in self.positions]
+        if scope == 'user_id':
+            names.append('user_id')
+        self.query = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})"
+        if self.remap:
+            self.query += " RETURNING id"
+        self.scope = scope
+
+    def add(self, row: list):
+        record = {column: _decode(row[i]) for i, column in self.positions}
+        for column, parent in self.references.items():
+            if record.get(column) is not None:
+                new_id = self.id_maps[parent].get(record[column])
+                if new_id is None and column != 'parent_goal_id':
+                    self.skipped += 1  # orphaned row in the source database
+                    return
+                record[column] = new_id
+        if self.source_index is not None:
+            parent = LEDGER_SOURCES.get(row[self.source_index])
+            if parent and row[self.source_id_index] is not None:
+                new_id = self.id_maps[parent].get(int(row[self.source_id_index]))
+                record['source_id'] = str(new_id) if new_id is not None else row[self.source_id_index]
+        if self.scope == 'id':
+            record['id'] = self.db.user_id
+        if self.table == 'user_stats' and 'ledger_id' in record:
+            self.c.execute("SELECT COALESCE(MAX(id), 0) FROM reward_ledger WHERE user_id = ?", (self.db.user_id,))
+            record['ledger_id'] = self.c.fetchone()[0]
+
+        values = tuple(record.values())
+        if self.scope == 'user_id':
+            values += (self.db.user_id,)
+        if self.remap:
+            # Few rows (habits, goals, documents); each new id is needed for child rows
+            self.c.execute(self.query, values)
+            self.id_maps[self.table][row[self.source_id]] = self.c.fetchone()[0]
+            self.loaded += 1
+            return
+        self.batch.append(values)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.c.executemany(self.query, self.batch)
+            self.loaded += len(self.batch)
+            self.batch = []
+
+
+def import_user(db: Database, path: str, defer_indexes: bool = False) -> Dict[str, int]:
+    """Replace db's current user with an archive's contents; returns rows loaded per table.
+
+    Raises ValueError (and leaves the database untouched) if the archive is
+    truncated, corrupt or fails its checksum. defer_indexes drops and rebuilds
+    the secondary indexes around the load, which locks the indexed tables for
+    every user until commit: only for a database no one else is using.
+    """
+    conn = db.get_connection()
+    c = conn.cursor()
+    digest = hashlib.sha256()
+    id_maps = {table: {} for table in REMAPPED}
+    loaded, seen = {}, {}
+    loader = None
+    table = columns = None
+    trailer = None
+
+    lines = _read_lines(path)
+    db.backend.begin(c)
+    try:
+        available = db.backend.tables(c)
+        _clear_user(db, c, available)
+        if defer_indexes:
+            for name in INDEXES:
+                c.execute(f"DROP INDEX IF EXISTS {name}")
+
+        line, header = next(lines, (None, None))
+        if not isinstance(header, dict) or header.get('format') != FORMAT:
+            raise ValueError("Not a Goal Quest archive")
+        if header.get('version', 0) > FORMAT_VERSION:
+            raise ValueError(f"Archive format {header['version']} is newer than this build supports")
+        digest.update(line.encode('utf-8'))
+
+        for line, record in lines:
+            if isinstance(record, dict) and 'sha256' in record:
+                trailer = record
+                break
+            digest.update(line.encode('utf-8'))
+            if isinstance(record, dict):
+                if loader:
+                    loader.flush()
+                    loaded[loader.table] = loader.loaded
+                table, columns = record.get('table'), record.get('columns')
+                if not isinstance(table, str) or not isinstance(columns, list) \
+                        or not all(isinstance(column, str) for column in columns):
+                    raise ValueError("Archive has a malformed table header")
+                seen[table] = 0
+                if table == 'document_segments' and table not in available:
+                    db._create_segments_table(c)
+                    available.add(table)
+                # Tables this build doesn't archive (or doesn't have) are counted but not loaded
+                loader = _TableLoader(db, c, table, columns, id_maps) if table in available and table in SCOPES else None
+                continue
+            if table is None:
+                raise ValueError("Archive row before table header")
+            if not isinstance(record, list) or len(record) != len(columns):
+                raise ValueError(f"Archive has a malformed {table} row")
+            seen[table] += 1
+            if loader:
+                loader.add(record)
+        if loader:
+            loader.flush()
+            loaded[loader.table] = loader.loaded
+
+        if trailer is None:
+            raise ValueError("Archive is truncated (no trailer)")
+        if trailer['sha256'] != digest.hexdigest() or trailer.get('counts') != seen:
+            raise ValueError("Archive checksum mismatch")
+        if header.get('schema_version', 0) < BASE_STATS_SCHEMA:
+            db._remove_achievement_bonuses(c, db.user_id)
+        if header.get('schema_version', 0) < UTC_NOTE_TIMES_SCHEMA:
+            db._normalize_note_times(c, db.user_id)
+
+        if defer_indexes:
+            for name, target in INDEXES.items():
+                c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    except (ValueError, EOFError, OSError, json.JSONDecodeError) as e:
+        conn.rollback()
+        if isinstance(e, ValueError):
+            raise
+        raise ValueError(f"Archive is unreadable: {e}") from e
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        lines.close()
+
+    conn.commit()
+    db.reset_effects()
+    db.reset_stat_sheet()
+    # Defaults for anything an older archive lacked, then derived tables
+    db.init_defaults()
+    db.compress_stored_text()
+    db.rebuild_daily_rollups()
+    db.rebuild_habit_bitmaps()
+    return loaded
+
+
+# ===== CLI =====
+def _open_database(args) -> Database:
+    if args.data_dir:
+        from shards import ShardRouter
+        router = ShardRouter(args.data_dir)
+        return router.database(router.get_or_create_user(args.handle))
+
+    from storage import backend_from_url
+    db = Database(backend=backend_from_url(args.url, db_path=args.db))
+    return db.for_user(db.get_or_create_user(args.handle))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import one user's Goal Quest data")
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('handle', help="user handle (the signed-in user in the app); 'default' for single-user installs")
+    parser.add_argument('path')
+    parser.add_argument('--db', default='goal_quest.db', help="SQLite file")
+    parser.add_argument('--url', default=os.environ.get('GOAL_QUEST_DATABASE_URL'), help="database URL, e.g. postgresql://...")
+    parser.add_argument('--data-dir', default=os.environ.get('GOAL_QUEST_DATA_DIR'), help="shard directory")
+    parser.add_argument('--compression', choices=['zstd', 'gzip', 'none'])
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="drop indexes during import and rebuild them after; locks out other users")
+    args = parser.parse_args()
+
+    db = _open_database(args)
+    if args.command == 'export':
+        counts = export_user(db, args.path, args.compression)
+    else:
+        counts = import_user(db, args.path, defer_indexes=args.defer_indexes)
+    db.close()
+
+    for table, count in counts.items():
+        print(f"  {table:<22} {count:>10,}")
+    print(f"{args.command}ed {sum(counts.values()):,} rows ({os.path.getsize(args.path):,} bytes on disk)")
+
+
+if __name__ == '__main__':
+    main()
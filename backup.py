@@ -0,0 +1,231 @@
+"""
+Online Backups
+Consistent copies of the live SQLite database, taken with the sqlite3 backup
+API while the app keeps serving.
+
+- Pages are copied in pages_per_step slices with a short sleep between steps,
+  so writers only wait for one slice at a time. If writers keep restarting
+  the copy, it falls back to a single-step pass (a WAL read snapshot, which
+  doesn't block writers either).
+- Each copy is written to a temporary file, switched to rollback-journal mode,
+  checked with PRAGMA integrity_check and only then renamed into place, so a
+  listed backup is always a complete, verified database.
+- Rotation keeps the newest `keep` backups.
+- restore() verifies the backup, snapshots the current database, then copies
+  the backup over the live file through the backup API (never a file copy).
+  Pre-restore snapshots are listed separately and never rotated away.
+- start() runs backups every `interval` seconds on a daemon thread.
+
+    python backup.py backup|list|verify|restore [backup file] [--db goal_quest.db] [--dir backups] [--keep 7]
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+SNAPSHOT_SUFFIX = "-pre-restore.db"
+
+
+class BackupRestarted(Exception):
+    """Raised from the progress callback to abandon a copy that writers keep restarting"""
+
+
+class BackupManager:
+    """Rotating, verified online backups of one SQLite file"""
+
+    def __init__(self, db_path: str = "goal_quest.db", backup_dir: str = "backups", keep: int = 7,
+                 pages_per_step: int = 256, step_sleep: float = 0.005, max_restarts: int = 1):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.stem = os.path.splitext(os.path.basename(db_path))[0]
+        self.history = deque(maxlen=50)
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(backup_dir, exist_ok=True)
+
+    # ===== BACKUP =====
+    def backup(self) -> Dict:
+        """Take one verified backup and apply retention; returns timing and size"""
+        with self._lock:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+            path = os.path.join(self.backup_dir, f"{self.stem}-{stamp}.db")
+            partial = path + ".tmp"
+
+            began = time.perf_counter()
+            try:
+                pages, restarts = self._copy(partial)
+                if not self.verify(partial):
+                    raise sqlite3.DatabaseError(f"integrity check failed for {partial}")
+                os.replace(partial, path)
+            except:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+            elapsed = time.perf_counter() - began
+
+            size = os.path.getsize(path)
+            result = {'path': path, 'pages': pages, 'bytes': size, 'seconds': elapsed,
+                      'mb_per_second': size / 1e6 / elapsed if elapsed else 0.0, 'restarts': restarts}
+            self.history.append(result)
+            self.rotate()
+            return result
+
+    def _copy(self, target_path: str) -> tuple:
+        """Copy the live database into target_path; returns (pages, restarts)"""
+        source = sqlite3.connect(self.db_path, timeout=30)
+        target = sqlite3.connect(target_path)
+        state = {'remaining': None, 'total': 0, 'restarts': 0}
+
+        def progress(status, remaining, total):
+            # remaining jumps back up when another connection writes mid-copy
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > self.max_restarts:
+                    raise BackupRestarted()
+            state['remaining'], state['total'] = remaining, total
+
+        try:
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=progress, sleep=self.step_sleep)
+            except BackupRestarted:
+                source.backup(target, pages=-1)
+            # Backups are read standalone; don't leave them needing -wal/-shm files
+            target.execute("PRAGMA journal_mode=DELETE")
+            pages = target.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+        return pages, state['restarts']
+
+    def verify(self, path: str, quick: bool = False) -> bool:
+        """PRAGMA integrity_check (or quick_check) on a read-only connection"""
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute(f"PRAGMA {'quick_check' if quick else 'integrity_check'}").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            return False
+        return rows == [('ok',)]
+
+    # ===== RETENTION =====
+    def list_backups(self) -> List[Dict]:
+        """Completed backups, newest first (pre-restore snapshots are not backups)"""
+        paths = glob.glob(os.path.join(self.backup_dir, f"{self.stem}-*.db"))
+        return self._describe([path for path in paths if not path.endswith(SNAPSHOT_SUFFIX)])
+
+    def list_snapshots(self) -> List[Dict]:
+        """Copies restore() took of the database it replaced, newest first"""
+        return self._describe(glob.glob(os.path.join(self.backup_dir, f"{self.stem}-*{SNAPSHOT_SUFFIX}")))
+
+    @staticmethod
+    def _describe(paths: List[str]) -> List[Dict]:
+        backups = []
+        for path in sorted(paths, reverse=True):
+            stat = os.stat(path)
+            backups.append({'path': path, 'bytes': stat.st_size,
+                            'created': datetime.fromtimestamp(stat.st_mtime, timezone.utc)})
+        return backups
+
+    def rotate(self) -> List[str]:
+        """Delete all but the newest `keep` backups; returns removed paths"""
+        removed = [backup['path'] for backup in self.list_backups()[self.keep:]]
+        for path in removed:
+            os.remove(path)
+        return removed
+
+    # ===== RESTORE =====
+    def restore(self, backup_path: str) -> Optional[str]:
+        """Replace the live database's contents with a backup; returns the pre-restore snapshot path"""
+        if not self.verify(backup_path):
+            raise sqlite3.DatabaseError(f"{backup_path} failed its integrity check; not restoring")
+
+        with self._lock:
+            snapshot = None
+            if os.path.exists(self.db_path):
+                stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+                snapshot = os.path.join(self.backup_dir, f"{self.stem}-{stamp}{SNAPSHOT_SUFFIX}")
+                self._copy(snapshot)
+
+            # One step holds the write lock for the whole copy, so no session sees a half-restored file
+            source = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+            target = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                source.backup(target, pages=-1)
+            finally:
+                target.close()
+                source.close()
+            return snapshot
+
+    # ===== SCHEDULE =====
+    def start(self, interval: float):
+        """Back up every `interval` seconds on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.backup()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+
+        self._thread = threading.Thread(target=run, name="goal-quest-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up or restore the Goal Quest SQLite database")
+    parser.add_argument('command', choices=['backup', 'list', 'verify', 'restore'])
+    parser.add_argument('path', nargs='?', help="backup file (verify/restore; defaults to the newest)")
+    parser.add_argument('--db', default='goal_quest.db')
+    parser.add_argument('--dir', default=os.environ.get('GOAL_QUEST_BACKUP_DIR', 'backups'))
+    parser.add_argument('--keep', type=int, default=7)
+    args = parser.parse_args()
+
+    manager = BackupManager(args.db, args.dir, keep=args.keep)
+    if args.command == 'backup':
+        result = manager.backup()
+        print(f"{result['path']}: {result['bytes'] / 1e6:.1f} MB in {result['seconds']:.2f} s "
+              f"({result['mb_per_second']:.0f} MB/s, {result['restarts']} restarts)")
+    elif args.command == 'list':
+        for backup in manager.list_backups():
+            print(f"{backup['created']:%Y-%m-%d %H:%M:%S}  {backup['bytes'] / 1e6:8.1f} MB  {backup['path']}")
+        for snapshot in manager.list_snapshots():
+            print(f"{snapshot['created']:%Y-%m-%d %H:%M:%S}  {snapshot['bytes'] / 1e6:8.1f} MB  {snapshot['path']} (pre-restore)")
+    else:
+        backups = manager.list_backups()
+        path = args.path or (backups[0]['path'] if backups else None)
+        if not path:
+            parser.error("no backups found")
+        if args.command == 'verify':
+            ok = manager.verify(path)
+            print(f"{path}: {'ok' if ok else 'CORRUPT'}")
+            raise SystemExit(0 if ok else 1)
+        snapshot = manager.restore(path)
+        print(f"restored {path} into {args.db}" + (f" (previous contents saved to {snapshot})" if snapshot else ""))
+
+
+if __name__ == '__main__':
+    main()
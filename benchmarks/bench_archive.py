@@ -0,0 +1,71 @@
+"""
+Benchmark: archive export/import throughput and peak memory for a large document library
+
+Peak memory (tracemalloc) should stay flat as the library grows, since both
+directions stream in fixed-size batches.
+
+    python benchmarks/bench_archive.py [documents] [segments_per_document] [--gzip]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import export_user, import_user
+from database import Database
+from utils import get_cst_date
+
+SEGMENT_TEXT = "The obstacle is the way. What stands in the way becomes the way. " * 12
+
+
+def populate(db, documents, segments):
+    today = get_cst_date()
+    habits = [db.create_habit(f"habit {n}", "health") for n in range(10)]
+    db.complete_habits([(h, str(today - timedelta(days=offset))) for h in habits for offset in range(365)])
+    db.create_segments_table()
+    for n in range(documents):
+        doc_id = db.upload_document(f"book_{n}.pdf", SEGMENT_TEXT * segments, "pdf", len(SEGMENT_TEXT) * segments)
+        db.save_document_segments(doc_id, [{'content': f"{i} {SEGMENT_TEXT}", 'number': i} for i in range(segments)])
+
+
+def measure(fn):
+    tracemalloc.start()
+    began = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    documents = int(args[0]) if len(args) > 0 else 20
+    segments = int(args[1]) if len(args) > 1 else 2000
+    compression = 'gzip' if '--gzip' in sys.argv else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Database(os.path.join(tmp, "source.db"))
+        populate(source, documents, segments)
+        source_size = os.path.getsize(os.path.join(tmp, "source.db"))
+        path = os.path.join(tmp, "user.archive")
+
+        counts, exported, export_peak = measure(lambda: export_user(source, path, compression))
+        rows = sum(counts.values())
+        target = Database(os.path.join(tmp, "target.db"))
+        # A fresh file nobody else uses, so the indexes can be rebuilt after the load
+        _, imported, import_peak = measure(lambda: import_user(target, path, defer_indexes=True))
+
+        print(f"{rows:,} rows ({documents} documents x {segments} segments), database {source_size / 1e6:.1f} MB")
+        print(f"  archive          {os.path.getsize(path) / 1e6:8.1f} MB")
+        print(f"  export           {exported:8.2f} s  {rows / exported:10,.0f} rows/s  peak {export_peak / 1e6:6.1f} MB")
+        print(f"  import           {imported:8.2f} s  {rows / imported:10,.0f} rows/s  peak {import_peak / 1e6:6.1f} MB")
+        print(f"  round trip ok    {target.get_stats()['total_xp'] == source.get_stats()['total_xp']}")
+
+
+if __name__ == '__main__':
+    main()
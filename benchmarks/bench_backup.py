@@ -0,0 +1,100 @@
+"""
+Benchmark: online backup throughput and its impact on check-in latency
+
+Runs a steady stream of check-ins against a populated database three times:
+alone, with back-to-back incremental backups (pages-per-step with sleeps) on
+a background thread, and with back-to-back single-step backups, and reports
+check-in latency percentiles and backup MB/s for each.
+
+    python benchmarks/bench_backup.py [checkins] [document_mb] [pages_per_step]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup import BackupManager
+from database import Database
+from utils import get_cst_date
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def populate(path, document_mb):
+    db = Database(path)
+    today = get_cst_date()
+    habits = [db.create_habit(f"habit {n}", "health") for n in range(20)]
+    db.complete_habits([(h, str(today - timedelta(days=offset))) for h in habits for offset in range(1, 366)])
+    db.upload_document("library.pdf", "wisdom " * (document_mb * 1024 * 1024 // 7), "pdf", document_mb * 1024 * 1024)
+    db.close()
+
+
+def run(path, checkins, first_day, manager=None, pages_per_step=None):
+    db = Database(path)
+    habit_ids = [h['id'] for h in db.get_habits()]
+    today = get_cst_date()
+    stop = threading.Event()
+    backups = []
+
+    def back_up():
+        while not stop.is_set():
+            backups.append(manager.backup())
+
+    if manager:
+        manager.pages_per_step = pages_per_step
+        thread = threading.Thread(target=back_up)
+        thread.start()
+
+    latencies = []
+    for n in range(checkins):
+        habit_id = habit_ids[n % len(habit_ids)]
+        day = str(today - timedelta(days=first_day + n // len(habit_ids)))
+        began = time.perf_counter()
+        db.toggle_completion(habit_id, day)
+        latencies.append(time.perf_counter() - began)
+
+    if manager:
+        stop.set()
+        thread.join()
+    db.close()
+    return latencies, backups
+
+
+def main():
+    checkins = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    document_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    pages_per_step = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "goal_quest.db")
+        populate(path, document_mb)
+        print(f"database {os.path.getsize(path) / 1e6:.0f} MB, {checkins} check-ins per run\n")
+        manager = BackupManager(path, os.path.join(tmp, "backups"), keep=2)
+
+        runs = [("no backup", None, None),
+                (f"incremental ({pages_per_step} pages/step)", manager, pages_per_step),
+                ("single step", manager, -1)]
+        for number, (label, backup_manager, step) in enumerate(runs):
+            # Each run checks in on its own, earlier, days so every toggle is a real write
+            first_day = 366 + number * (checkins // 20 + 1)
+            latencies, backups = run(path, checkins, first_day, backup_manager, step)
+            line = (f"  {label:<28} p50 {percentile(latencies, 50) * 1000:6.2f} ms  "
+                    f"p95 {percentile(latencies, 95) * 1000:6.2f} ms  p99 {percentile(latencies, 99) * 1000:6.2f} ms")
+            if backups:
+                mb_per_second = sum(b['bytes'] for b in backups) / 1e6 / sum(b['seconds'] for b in backups)
+                restarts = sum(b['restarts'] for b in backups)
+                line += f"  | {len(backups)} backups, {mb_per_second:5.0f} MB/s, {restarts} restarts"
+            print(line)
+        shutil.rmtree(os.path.join(tmp, "backups"))
+
+
+if __name__ == '__main__':
+    main()
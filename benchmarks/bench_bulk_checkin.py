@@ -0,0 +1,59 @@
+"""
+Benchmark: backfilling check-ins one toggle at a time vs one complete_habits batch
+
+    python benchmarks/bench_bulk_checkin.py [habits] [days]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from achievements import check_streak_achievements, earned_checkin_achievements, initialize_achievements
+from database import Database
+from utils import get_cst_date
+
+
+def setup(path, habits):
+    db = Database(path)
+    initialize_achievements(db)
+    return db, [db.create_habit(f"habit {n}", "health") for n in range(habits)]
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    today = get_cst_date()
+    dates = [str(today - timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db, habit_ids = setup(os.path.join(tmp, "toggle.db"), habits)
+        began = time.perf_counter()
+        for date_str in dates:
+            for habit_id in habit_ids:
+                db.toggle_completion(habit_id, date_str)
+                check_streak_achievements(db)
+        toggled = time.perf_counter() - began
+        toggle_stats = db.get_stats()
+        db.close()
+
+        db, habit_ids = setup(os.path.join(tmp, "bulk.db"), habits)
+        began = time.perf_counter()
+        result = db.complete_habits([(h, d) for d in dates for h in habit_ids], earned_checkin_achievements)
+        bulk = time.perf_counter() - began
+        bulk_stats = db.get_stats()
+        db.close()
+
+    checkins = habits * days
+    print(f"{checkins} check-ins ({habits} habits x {days} days)")
+    print(f"  toggle + achievements each   {toggled * 1000:9.1f} ms   ({toggled / checkins * 1e6:7.1f} us/check-in)")
+    print(f"  complete_habits batch        {bulk * 1000:9.1f} ms   ({bulk / checkins * 1e6:7.1f} us/check-in)")
+    print(f"  speedup                      {toggled / bulk:9.1f}x")
+    print(f"  batch: {result['completed']} completed, {len(result['achievements'])} achievements, "
+          f"level {bulk_stats['level']} (toggled run: level {toggle_stats['level']})")
+
+
+if __name__ == '__main__':
+    main()
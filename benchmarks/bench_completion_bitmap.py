@@ -0,0 +1,105 @@
+"""
+Benchmark: row-based completion history vs per-habit bitmaps
+
+Seeds a throwaway database with N habits x D days of completions, then times
+streak, total-count and range-count queries through both paths and compares
+the memory held by each representation.
+
+    python benchmarks/bench_completion_bitmap.py [habits] [days]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from utils import calculate_streak, get_cst_date
+
+
+def seed(db, habits, days):
+    today = get_cst_date()
+    conn = db.get_connection()
+    c = conn.cursor()
+    habit_ids = [db.create_habit(f"Habit {i}", "fitness", xp_reward=100) for i in range(habits)]
+    rows = []
+    for habit_id in habit_ids:
+        for d in range(days):
+            if random.random() < 0.8:
+                rows.append((habit_id, (today - timedelta(days=d)).isoformat()))
+    c.executemany("INSERT INTO completions (habit_id, date) VALUES (?, ?)", rows)
+    conn.commit()
+    db.rebuild_habit_bitmaps()
+    return habit_ids, len(rows)
+
+
+def timed(label, fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<38} {best * 1000:9.2f} ms")
+    return best
+
+
+def measure(fn):
+    tracemalloc.start()
+    value = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        habit_ids, total = seed(db, habits, days)
+        today = get_cst_date()
+        month_start = today - timedelta(days=30)
+        print(f"{habits} habits x {days} days ({total:,} completions)\n")
+
+        def rows_streaks():
+            for habit_id in habit_ids:
+                calculate_streak(db.get_completions(habit_id))
+
+        def bitmap_streaks():
+            for bitmap in db.get_habit_bitmaps(habit_ids).values():
+                bitmap.current_streak(today)
+
+        def rows_range():
+            for habit_id in habit_ids:
+                len(db.get_completions(habit_id, month_start.isoformat(), today.isoformat()))
+
+        def bitmap_range():
+            for bitmap in db.get_habit_bitmaps(habit_ids).values():
+                bitmap.count(month_start, today)
+
+        print("Latency (best of 5, all habits):")
+        timed("current streak - rows", rows_streaks)
+        timed("current streak - bitmaps", bitmap_streaks)
+        timed("last-30-day count - rows", rows_range)
+        timed("last-30-day count - bitmaps", bitmap_range)
+        timed("longest streak - bitmaps", lambda: [b.longest_streak() for b in db.get_habit_bitmaps(habit_ids).values()])
+
+        _, rows_bytes = measure(lambda: [db.get_completions(h) for h in habit_ids])
+        bitmaps, bitmap_bytes = measure(lambda: db.get_habit_bitmaps(habit_ids))
+        blob_bytes = sum(len(b.to_blob()) for b in bitmaps.values())
+
+        print("\nMemory:")
+        print(f"  {'row dicts in Python':<38} {rows_bytes / 1024:9.1f} KB")
+        print(f"  {'bitmaps in Python':<38} {bitmap_bytes / 1024:9.1f} KB")
+        print(f"  {'bitmap BLOBs on disk':<38} {blob_bytes / 1024:9.1f} KB")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
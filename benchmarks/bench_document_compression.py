@@ -0,0 +1,102 @@
+"""
+Benchmark: document text compression - database size, ingest rate and random segment reads
+
+Loads the same synthetic library twice, once as plain text (how rows were
+stored before compression) and once through the compressed document store,
+then reports file size, ingest MB/s and get_segment latency percentiles.
+The text is Zipf-distributed words, so it compresses about like prose.
+
+    python benchmarks/bench_document_compression.py [documents] [segments_per_document] [--zlib]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_codec
+from database import Database
+
+
+def make_library(documents, segments):
+    rng = random.Random(7)
+    vocabulary = [''.join(rng.choice('etaoinshrdlucmfwyp') for _ in range(rng.randint(2, 9)))
+                  for _ in range(5000)]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    library = []
+    for _ in range(documents):
+        words = rng.choices(vocabulary, weights, k=segments * 120)
+        library.append([' '.join(words[i * 120:(i + 1) * 120]) + '.' for i in range(segments)])
+    return library
+
+
+def load(db, library, compressed):
+    conn = db.get_connection()
+    db.create_segments_table()
+    for n, segments in enumerate(library):
+        text = '\n\n'.join(segments)
+        if compressed:
+            doc_id = db.upload_document(f"book_{n}.pdf", text, "pdf", len(text))
+            db.save_document_segments(doc_id, [{'content': content, 'number': i} for i, content in enumerate(segments)])
+            continue
+        c = conn.cursor()
+        c.execute("INSERT INTO philosophy_documents (user_id, filename, content, file_type, file_size) "
+                  "VALUES (?, ?, ?, 'pdf', ?) RETURNING id", (db.user_id, f"book_{n}.pdf", text, len(text)))
+        doc_id = c.fetchone()[0]
+        c.executemany("INSERT INTO document_segments (document_id, segment_number, content) VALUES (?, ?, ?)",
+                      [(doc_id, i, content) for i, content in enumerate(segments)])
+        conn.commit()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    documents = int(args[0]) if len(args) > 0 else 10
+    segments = int(args[1]) if len(args) > 1 else 2000
+    if '--zlib' in sys.argv:
+        text_codec.zstandard = None
+    codec = 'zstd' if text_codec.zstandard else 'zlib'
+
+    library = make_library(documents, segments)
+    text_mb = 2 * sum(len(s) for segments in library for s in segments) / 1e6  # document text + segments
+    print(f"{documents} documents x {segments} segments, {text_mb:.1f} MB of text (codec: {codec})\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, compressed in [("plain", False), ("compressed", True)]:
+            path = os.path.join(tmp, f"{label}.db")
+            db = Database(path)
+            began = time.perf_counter()
+            load(db, library, compressed)
+            ingest = time.perf_counter() - began
+            db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            size = os.path.getsize(path)
+
+            c = db.get_connection().cursor()
+            c.execute("SELECT id FROM document_segments")
+            segment_ids = [row[0] for row in c.fetchall()]
+            rng = random.Random(1)
+            latencies = []
+            for segment_id in rng.sample(segment_ids, min(5000, len(segment_ids))):
+                began = time.perf_counter()
+                db.get_segment(segment_id)
+                latencies.append(time.perf_counter() - began)
+
+            doc_id = db.get_documents()[0]['id']
+            began = time.perf_counter()
+            db.get_document_content(doc_id, limit=500)
+            preview = time.perf_counter() - began
+
+            print(f"  {label:<11} db {size / 1e6:7.1f} MB  ingest {text_mb / ingest:6.1f} MB/s  "
+                  f"segment read p50 {percentile(latencies, 50) * 1e6:5.0f} us  p99 {percentile(latencies, 99) * 1e6:5.0f} us  "
+                  f"preview {preview * 1e3:5.2f} ms")
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
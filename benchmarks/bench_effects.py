@@ -0,0 +1,66 @@
+"""
+Benchmark: check-in cost with active effects, and the multiplier lookup itself
+
+Times toggle_completion with no effects and with a stack of running potions
+plus equipped gear, then times EffectsEngine.multipliers() on its own.
+
+    python benchmarks/bench_effects.py [checkins] [effects]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+CATEGORIES = ["fitness", "health", "learning", "mindfulness", "productivity", "creativity"]
+
+
+def run(path, checkins, effects):
+    db = Database(path)
+    habit_ids = [db.create_habit(f"habit {n}", CATEGORIES[n % len(CATEGORIES)], difficulty=n % 3 + 1)
+                 for n in range(12)]
+    rng = random.Random(3)
+    for _ in range(effects):
+        db.add_effect(rng.choice(['xp_multiplier', 'gold_multiplier']), rng.choice([2, 3, 5]), rng.randint(3600, 86400))
+    if effects:
+        db.equip_item('knights_sword', 'weapon')
+        db.equip_item('amulet_wealth', 'amulet')
+    start = date(2026, 1, 1)
+    began = time.perf_counter()
+    for n in range(checkins):
+        db.toggle_completion(habit_ids[n % len(habit_ids)], str(start + timedelta(days=n // len(habit_ids))))
+    elapsed = time.perf_counter() - began
+    engine = db.get_effects()
+    xp = db.get_stats()['total_xp']
+    db.close()
+    return elapsed, engine, xp
+
+
+def main():
+    checkins = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    effects = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain, _, plain_xp = run(os.path.join(tmp, "plain.db"), checkins, 0)
+        boosted, engine, boosted_xp = run(os.path.join(tmp, "boosted.db"), checkins, effects)
+
+    keys = [(category, difficulty) for category in CATEGORIES for difficulty in (1, 2, 3)]
+    lookups = 200000
+    began = time.perf_counter()
+    for n in range(lookups):
+        engine.multipliers(*keys[n % len(keys)])
+    lookup = time.perf_counter() - began
+
+    print(f"{checkins} check-ins, {effects} timed effects + 2 equipped items")
+    print(f"  no effects     {plain / checkins * 1e6:7.1f} us/check-in   total XP {plain_xp}")
+    print(f"  with effects   {boosted / checkins * 1e6:7.1f} us/check-in   total XP {boosted_xp}")
+    print(f"  multipliers()  {lookup / lookups * 1e9:7.0f} ns/lookup")
+
+
+if __name__ == '__main__':
+    main()
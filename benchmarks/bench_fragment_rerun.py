@@ -0,0 +1,76 @@
+"""
+Benchmark: cost of one habit check-in as the Habits page grows
+
+Runs app.py headless (streamlit.testing) with 10, 50 and 200 habits and
+compares a full rerun of the Habits page with checking one habit in, which
+reruns only that habit's row and the sidebar counters. Reports wall time and
+the serialized size of the ForwardMsgs each produces.
+
+    python benchmarks/bench_fragment_rerun.py [habit counts...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+from database import Database
+
+_messages = []
+_parse = local_script_runner.parse_tree_from_messages
+
+
+def _recording_parse(messages):
+    _messages[:] = messages
+    return _parse(messages)
+
+
+local_script_runner.parse_tree_from_messages = _recording_parse
+
+
+def timed(at):
+    began = time.perf_counter()
+    at.run()
+    if at.exception:
+        raise SystemExit(at.exception[0].message)
+    return time.perf_counter() - began, sum(msg.ByteSize() for msg in _messages)
+
+
+def run(habits, checkins=5):
+    db = Database('goal_quest.db')
+    db.update_profile(display_name="Bench", onboarding_completed=1)
+    habit_ids = [db.create_habit(f"habit {n}", 'fitness') for n in range(habits)]
+    db.close()
+
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120)
+    at.secrets['ANTHROPIC_API_KEY'] = ''
+    at.run()
+    at.session_state.page = 'Habits'
+    full = [timed(at) for _ in range(checkins)]
+    row = []
+    for habit_id in habit_ids[:checkins]:
+        at.run()  # the tree holds only the rerun fragments after a check-in
+        at.checkbox(key=f"habit_{habit_id}").check()
+        row.append(timed(at))
+    return full, row
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 50, 200]
+    print(f"{'habits':>7}{'full rerun':>14}{'bytes':>10}{'check-in':>12}{'bytes':>10}")
+    for habits in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            full, row = run(habits)
+        mean = lambda samples, i: sum(sample[i] for sample in samples) / len(samples)
+        print(f"{habits:>7}{mean(full, 0) * 1000:>11.0f} ms{mean(full, 1):>10,.0f}"
+              f"{mean(row, 0) * 1000:>9.0f} ms{mean(row, 1):>10,.0f}")
+        os.chdir(ROOT)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: cost of the Notes and Habits pages as the lists grow
+
+Runs app.py headless (streamlit.testing) with 100, 1,000 and 5,000 notes
+(and a tenth as many habits) and reports the wall time and serialized size
+of the ForwardMsgs of a rerun of each page. With paged lists both should stay
+flat as the counts grow.
+
+    python benchmarks/bench_paginated_lists.py [note counts...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+from database import Database
+
+_messages = []
+_parse = local_script_runner.parse_tree_from_messages
+
+
+def _recording_parse(messages):
+    _messages[:] = messages
+    return _parse(messages)
+
+
+local_script_runner.parse_tree_from_messages = _recording_parse
+
+
+def timed(at):
+    began = time.perf_counter()
+    at.run()
+    if at.exception:
+        raise SystemExit(at.exception[0].message)
+    return time.perf_counter() - began, sum(msg.ByteSize() for msg in _messages)
+
+
+def run(notes, reruns=3):
+    db = Database('goal_quest.db')
+    db.update_profile(display_name="Bench", onboarding_completed=1)
+    for n in range(notes):
+        db.create_note(title=f"note {n}", content="Some journal text. " * 20, category='personal')
+    for n in range(notes // 10):
+        db.create_habit(f"habit {n}", 'fitness')
+    db.close()
+
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=600)
+    at.secrets['ANTHROPIC_API_KEY'] = ''
+    at.run()
+    results = {}
+    for page in ['Notes', 'Habits']:
+        at.session_state.page = page
+        results[page] = [timed(at) for _ in range(reruns)]
+    return results
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+    print(f"{'notes':>7}{'Notes page':>14}{'bytes':>11}{'habits':>8}{'Habits page':>14}{'bytes':>11}")
+    for notes in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            results = run(notes)
+        mean = lambda samples, i: sum(sample[i] for sample in samples) / len(samples)
+        print(f"{notes:>7}{mean(results['Notes'], 0) * 1000:>11.0f} ms{mean(results['Notes'], 1):>11,.0f}"
+              f"{notes // 10:>8}{mean(results['Habits'], 0) * 1000:>11.0f} ms{mean(results['Habits'], 1):>11,.0f}")
+        os.chdir(ROOT)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark: bytes the app sends to the browser per rerun, page by page
+
+Runs app.py headless (streamlit.testing) against a scratch database and sums
+the serialized size of the ForwardMsgs each rerun produces, i.e. what goes
+over the websocket. Also reports how much of it is raw HTML/CSS from
+st.markdown(unsafe_allow_html=True) and st.html, and the largest such elements.
+
+    python benchmarks/bench_rerun_payload.py [--top N]
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+from database import Database
+
+PAGES = ['Dashboard', 'Habits', 'Goals', 'Analytics', 'Shop', 'Inventory', 'Achievements', 'Notes', 'Settings']
+
+_messages = []
+_parse = local_script_runner.parse_tree_from_messages
+
+
+def _recording_parse(messages):
+    _messages[:] = messages
+    return _parse(messages)
+
+
+local_script_runner.parse_tree_from_messages = _recording_parse
+
+
+def _html_elements(messages):
+    for msg in messages:
+        if msg.WhichOneof('type') != 'delta' or msg.delta.WhichOneof('type') != 'new_element':
+            continue
+        element = msg.delta.new_element
+        kind = element.WhichOneof('type')
+        if kind == 'markdown' and element.markdown.allow_html:
+            yield kind, element.markdown.body, msg.ByteSize()
+        elif kind == 'html':
+            yield kind, element.html.body, msg.ByteSize()
+
+
+def seed():
+    db = Database('goal_quest.db')
+    db.update_profile(display_name="Bench", onboarding_completed=1)
+    for n, category in enumerate(['fitness', 'learning', 'mindfulness', 'health', 'productivity']):
+        db.create_habit(f"habit {n}", category)
+    db.create_goal("Finish the benchmark", category='productivity')
+    db.close()
+
+
+def main():
+    top = int(sys.argv[sys.argv.index('--top') + 1]) if '--top' in sys.argv else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        seed()
+        at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=60)
+        at.secrets['ANTHROPIC_API_KEY'] = ''
+        at.run()
+        rows, largest = [], {}
+        for page in PAGES:
+            at.session_state.page = page
+            at.run()
+            if at.exception:
+                raise SystemExit(f"{page}: {at.exception[0].message}")
+            html = list(_html_elements(_messages))
+            rows.append((page, sum(msg.ByteSize() for msg in _messages), sum(size for _, _, size in html)))
+            for kind, body, size in html:
+                largest[body[:60].strip().replace('\n', ' ')] = max(size, largest.get(body[:60].strip().replace('\n', ' '), 0))
+
+    print(f"{'page':<14}{'bytes/rerun':>12}{'HTML/CSS':>10}")
+    for page, total, html in rows:
+        print(f"{page:<14}{total:>12,}{html:>10,}")
+    print(f"{'mean':<14}{sum(r[1] for r in rows) // len(rows):>12,}{sum(r[2] for r in rows) // len(rows):>10,}")
+    print(f"largest HTML elements:")
+    for snippet, size in sorted(largest.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {size:>7,}  {snippet}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: file descriptors, memory and throughput as sessions pile up
+
+Simulates Streamlit sessions against one SQLite file (or --url): a small
+pool of script threads runs a few "reruns" per session (stats, habits,
+a check-in, effective stats) and builds each session's AI client. Each mode
+runs in its own process:
+- per-session: every session opens its own Database (on a shared backend)
+  and AICoach, as the app used to keep them in st.session_state;
+- shared: one Database and one AICoach per process (st.cache_resource), each
+  session holding a for_user view.
+
+With a PostgreSQL --url, per-session mode holds one pooled connection per
+session, so keep sessions under the pool's max_size (20) or it times out.
+
+Reports open file descriptors, database connections checked out, peak RSS
+and reruns per second once every session exists.
+
+    python benchmarks/bench_shared_resources.py [sessions] [threads] [--url URL]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RERUNS = 3
+
+
+def run_mode(mode: str, url: str, sessions: int, threads: int) -> dict:
+    from ai_coach import AICoach
+    from database import Database
+    from storage import backend_from_url
+    from utils import get_cst_date
+
+    backend = backend_from_url(url)
+    shared_db = Database(backend=backend)
+    shared_coach = AICoach('sk-bench')
+    today = get_cst_date()
+    checked_out = set()
+    alive = []  # what st.session_state would keep
+
+    def session(n):
+        if mode == 'shared':
+            db, coach = shared_db.for_user(shared_db.get_or_create_user(f"user{n}")), shared_coach
+        else:
+            db = Database(backend=backend)
+            db = db.for_user(db.get_or_create_user(f"user{n}"))
+            coach = AICoach('sk-bench')
+        coach.client  # built on first use; no request is sent
+        habit = db.create_habit("bench", 'health')
+        for _ in range(RERUNS):
+            db.get_stats()
+            db.get_habits()
+            db.toggle_completion(habit, today)
+            db.get_effective_stats()
+        checked_out.add(id(db.get_connection()))
+        alive.append((db, coach))
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(session, range(sessions)))
+    elapsed = time.perf_counter() - began
+    return {'fds': len(os.listdir('/proc/self/fd')), 'connections': len(checked_out),
+            'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'reruns_per_s': sessions * RERUNS / elapsed}
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    sessions = int(args[0]) if args else 300
+    threads = int(args[1]) if len(args) > 1 else 8
+    url = sys.argv[sys.argv.index('--url') + 1] if '--url' in sys.argv else None
+
+    print(f"{sessions} sessions on {threads} script threads")
+    print(f"{'mode':<13}{'open fds':>10}{'connections':>13}{'peak RSS':>12}{'reruns/s':>10}")
+    for mode in ['per-session', 'shared']:
+        with tempfile.TemporaryDirectory() as tmp:
+            target = url or os.path.join(tmp, 'goal_quest.db')
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, target,
+                                    str(sessions), str(threads)], capture_output=True, text=True)
+        if child.returncode:
+            raise SystemExit(child.stderr[-2000:])
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{mode:<13}{result['fds']:>10}{result['connections']:>13}{result['rss_mb']:>9.0f} MB"
+              f"{result['reruns_per_s']:>10,.0f}")
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        mode, target, sessions, threads = sys.argv[sys.argv.index('--child') + 1:][:4]
+        print(json.dumps(run_mode(mode, target, int(sessions), int(threads))))
+    else:
+        main()
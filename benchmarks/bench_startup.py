@@ -0,0 +1,108 @@
+"""
+Benchmark: cold start of the app
+
+Seeds a scratch database, then starts a fresh Python process that runs
+app.py headless (streamlit.testing) under `python -X importtime` and reports:
+- cold start: process start to the first rendered Dashboard (imports, schema
+  and catalog setup, the first script run);
+- a second session's first run in the same, now warm, process;
+- the first visit of each page in the first session (lazily imported modules
+  show up here);
+- the slowest top-level imports by cumulative time, from the importtime report.
+
+    python benchmarks/bench_startup.py [--top N] [--target SECONDS]
+
+Exits non-zero when the cold start is slower than --target.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTED = time.perf_counter()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ['Habits', 'Goals', 'Analytics', 'Shop', 'Inventory', 'Achievements', 'Notes', 'Library', 'AI Coach', 'Settings']
+TARGET_SECONDS = 1.5  # was ~3.4 s with pandas, PyPDF2 and the Anthropic SDK imported up front
+
+
+def child():
+    """Runs in the measured process: nothing but the harness is imported before the clock starts"""
+    from streamlit.testing.v1 import AppTest
+
+    def session():
+        at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120)
+        at.secrets['ANTHROPIC_API_KEY'] = ''
+        at.run()
+        if at.exception:
+            raise SystemExit(at.exception[0].message)
+        return at
+
+    at = session()
+    timings = {'cold start': time.perf_counter() - STARTED}
+    began = time.perf_counter()
+    session()
+    timings['second session'] = time.perf_counter() - began
+    for page in PAGES:
+        at.session_state.page = page
+        began = time.perf_counter()
+        at.run()
+        timings[f"first visit: {page}"] = time.perf_counter() - began
+    print(json.dumps(timings))
+
+
+def seed():
+    from database import Database
+
+    db = Database('goal_quest.db')
+    db.update_profile(display_name="Bench", onboarding_completed=1)
+    for n, category in enumerate(['fitness', 'learning', 'mindfulness', 'health', 'productivity']):
+        db.create_habit(f"habit {n}", category)
+    db.create_note("A note", "Some text")
+    db.close()
+
+
+def top_imports(report: str, top: int):
+    """(cumulative seconds, module) of the slowest imports that nothing else in the report pulled in"""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # one leading space; nested imports are indented further
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    top = int(sys.argv[sys.argv.index('--top') + 1]) if '--top' in sys.argv else 10
+    target = float(sys.argv[sys.argv.index('--target') + 1]) if '--target' in sys.argv else TARGET_SECONDS
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        seed()
+        os.chdir(ROOT)
+        result = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child'],
+                                cwd=tmp, capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit(result.stderr[-2000:])
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    for name, seconds in timings.items():
+        print(f"{name:<28}{seconds * 1000:>8.0f} ms")
+    print("slowest imports (cumulative):")
+    for seconds, name in top_imports(result.stderr, top):
+        print(f"  {seconds * 1000:>7.0f} ms  {name}")
+    met = timings['cold start'] <= target
+    print(f"cold start target {target:.1f} s: {'met' if met else 'MISSED'}")
+    return 0 if met else 1
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child()
+    else:
+        sys.exit(main())
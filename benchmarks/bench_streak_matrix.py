@@ -0,0 +1,78 @@
+"""
+Benchmark: vectorized multi-habit streaks (target < 50 ms for 1,000 habits x 3 years)
+over a mix of daily, weekday and weekend schedules
+
+Times loading the habit bitmaps plus matrix build separately from the streak,
+perfect-run and rolling-rate computations.
+
+    python benchmarks/bench_streak_matrix.py [habits] [days]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from database import Database
+from habit_schedule import expected_matrix
+from streak_matrix import CompletionMatrix, load_completion_matrix
+from utils import get_cst_date
+
+
+def timed(label, fn, repeat=5):
+    best, value = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<40} {best * 1000:9.2f} ms")
+    return value
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 3 * 365
+    today = get_cst_date()
+    start = today - timedelta(days=days - 1)
+    habit_ids = list(range(1, habits + 1))
+
+    # Compute path alone, on a synthetic matrix
+    rng = np.random.default_rng(42)
+    completed = rng.random((habits, days)) < 0.85
+    schedules = [{'frequency': ("daily", "weekdays", "weekends")[h % 3]} for h in habit_ids]
+    expected = expected_matrix(schedules, start, today)
+    fresh = lambda: CompletionMatrix(habit_ids, start, completed, expected.copy())
+    print(f"{habits} habits x {days} days\n\nCompute only:")
+    timed("current + longest streaks", lambda: (lambda m: (m.current_streaks(), m.longest_streaks()))(fresh()))
+    timed("longest all-habits-done run", lambda: fresh().longest_perfect_run())
+    timed("7-day rolling rates", lambda: fresh().rolling_rates(7))
+    timed("30-day completion rate", lambda: fresh().completion_rate(30))
+    timed("full summary", lambda: fresh().summary())
+
+    # End to end, from SQLite
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        conn = db.get_connection()
+        conn.executemany("INSERT INTO habits (id, name, category, frequency) VALUES (?, ?, 'fitness', ?)",
+                         [(h, f"Habit {h}", schedules[h - 1]['frequency']) for h in habit_ids])
+        random.seed(42)
+        rows = [(h, (start + timedelta(days=d)).isoformat())
+                for h in habit_ids for d in range(days) if random.random() < 0.85]
+        conn.executemany("INSERT INTO completions (habit_id, date) VALUES (?, ?)", rows)
+        conn.commit()
+        db.rebuild_habit_bitmaps()
+
+        print(f"\nEnd to end ({len(rows):,} completion rows):")
+        habit_rows = db.get_habits()
+        loaded = timed("load bitmaps + build matrix", lambda: load_completion_matrix(db, habit_rows, start, today), repeat=3)
+        timed("summary", lambda: CompletionMatrix(habit_ids, start, loaded.matrix, loaded.expected).summary())
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Load test: hundreds of concurrent users checking in against one shared database
+
+Every simulated user gets its own Database instance (as each Streamlit session
+does), creates a few habits, then checks them in day by day, reading the
+dashboard data (stats, bitmaps, rollups) after each check-in. Reports
+throughput, latency percentiles and errors, then verifies that no user's
+data leaked into another's. With --shards every user writes to their own
+SQLite file through a ShardRouter instead of the shared database.
+
+    python benchmarks/load_test_multi_user.py [users] [days] [habits_per_user] [--shards]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from shards import ShardRouter
+from utils import get_cst_date
+
+XP_PER_CHECKIN = 50
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def open_user(target, handle) -> Database:
+    if isinstance(target, ShardRouter):
+        return target.database(target.get_or_create_user(handle))
+    db = Database(target)
+    return db.for_user(db.get_or_create_user(handle))
+
+
+def simulate_user(target, handle, days, habits_per_user, start_gate, latencies, errors):
+    db = open_user(target, handle)
+    habit_ids = [db.create_habit(f"{handle} habit {n}", "health", xp_reward=XP_PER_CHECKIN, gold_reward=10)
+                 for n in range(habits_per_user)]
+    today = get_cst_date()
+    start_gate.wait()
+
+    for offset in range(days - 1, -1, -1):
+        day = str(today - timedelta(days=offset))
+        for habit_id in habit_ids:
+            began = time.perf_counter()
+            try:
+                db.toggle_completion(habit_id, day)
+                latencies['checkin'].append(time.perf_counter() - began)
+
+                began = time.perf_counter()
+                db.get_stats()
+                db.get_habit_bitmaps(habit_ids)
+                db.get_rollup_totals(day, day)
+                latencies['dashboard'].append(time.perf_counter() - began)
+            except Exception as e:
+                errors.append(f"{handle}: {e}")
+    db.close()
+    return db.user_id
+
+
+def verify(target, user_ids, days, habits_per_user):
+    """Each user sees exactly their own completions and rewards"""
+    problems = 0
+    for user_id in user_ids:
+        db = target.database(user_id) if isinstance(target, ShardRouter) else Database(target, user_id=user_id)
+        habits = db.get_habits()
+        completions = sum(len(bitmap) for bitmap in db.get_habit_bitmaps().values())
+        totals = db.get_rollup_totals()
+        expected = days * habits_per_user
+        if (len(habits) != habits_per_user or completions != expected or totals['completions'] != expected
+                or db.get_stats()['total_xp'] != expected * XP_PER_CHECKIN):
+            problems += 1
+        db.close()
+    return problems
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    users = int(args[0]) if len(args) > 0 else 300
+    days = int(args[1]) if len(args) > 1 else 14
+    habits_per_user = int(args[2]) if len(args) > 2 else 3
+    sharded = '--shards' in sys.argv
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if sharded:
+            target = ShardRouter(os.path.join(tmp, "data"), max_open=users + 1)
+        else:
+            target = os.path.join(tmp, "load.db")
+            Database(target).close()
+
+        latencies = {'checkin': [], 'dashboard': []}
+        errors = []
+        start_gate = threading.Barrier(users + 1)
+        print(f"{users} users x {habits_per_user} habits x {days} days, all concurrent, "
+              f"{'one shard per user' if sharded else 'one shared database'}")
+
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            futures = [pool.submit(simulate_user, target, f"user-{n}", days, habits_per_user,
+                                   start_gate, latencies, errors)
+                       for n in range(users)]
+            start_gate.wait()
+            began = time.perf_counter()
+            user_ids = [f.result() for f in futures]
+            elapsed = time.perf_counter() - began
+
+        checkins = len(latencies['checkin'])
+        print(f"\n  {checkins} check-ins in {elapsed:.2f} s ({checkins / elapsed:,.0f}/s)")
+        for label, values in latencies.items():
+            print(f"  {label:<10} p50 {percentile(values, 50) * 1000:7.2f} ms   "
+                  f"p95 {percentile(values, 95) * 1000:7.2f} ms   p99 {percentile(values, 99) * 1000:7.2f} ms")
+        print(f"  errors: {len(errors)}")
+        for error in errors[:5]:
+            print(f"    {error}")
+
+        problems = verify(target, user_ids, days, habits_per_user)
+        print(f"  isolation: {'OK' if not problems else f'{problems} users with wrong totals'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Stress test: hundreds of parallel purchases against one user's balance
+
+Gives one user enough gold and crystals for a known number of items, then
+fires purchases from many threads at once, each with its own Database (as
+separate Streamlit sessions or browser tabs would). Fails unless exactly the
+affordable number went through, neither balance went negative, and the
+inventory, ledger and balances all agree.
+
+    python benchmarks/stress_purchases.py [threads] [purchases_per_thread] [--postgres URL]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from shop_items import get_item_by_id
+from storage import backend_from_url
+
+ITEM = 'xp_boost_1h'  # 500 gold, stacks to 99
+CRYSTAL_ITEM = 'instant_complete_habit'  # 3000 gold + 5 crystals, stacks to 10
+GOLD = 20000
+CRYSTALS = 15
+
+
+def open_user(target, handle) -> Database:
+    db = Database(backend=backend_from_url(target)) if target.startswith('postgres') else Database(target)
+    return db.for_user(db.get_or_create_user(handle))
+
+
+def run(target, threads, per_thread):
+    db = open_user(target, 'shopper')
+    db.add_gold(GOLD - db.get_stats()['current_gold'])
+    db.add_crystals(CRYSTALS - (db.get_stats()['crystals'] or 0))
+    start_gate = threading.Barrier(threads)
+    outcomes, errors = [], []
+
+    def shopper(n):
+        session = open_user(target, 'shopper')
+        start_gate.wait()
+        for i in range(per_thread):
+            try:
+                # Every tenth attempt races for the crystals as well as the gold
+                outcomes.append(session.purchase(CRYSTAL_ITEM if (n + i) % 10 == 0 else ITEM))
+            except Exception as e:
+                errors.append(repr(e))
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(shopper, range(threads)))
+    elapsed = time.perf_counter() - began
+
+    stats = db.get_stats()
+    bought = [o for o in outcomes if o['purchased']]
+    gold_spent = sum(o['gold'] for o in bought)
+    crystals_spent = sum(o['crystals'] for o in bought)
+    inventory = {row['item_id']: row['quantity'] for row in db.get_inventory()}
+    ledger = -sum(entry['gold'] for entry in db.get_ledger(source='shop'))
+    reasons = {}
+    for o in outcomes:
+        reasons[o['reason'] or 'purchased'] = reasons.get(o['reason'] or 'purchased', 0) + 1
+
+    print(f"{len(outcomes)} purchases from {threads} threads in {elapsed:.2f} s "
+          f"({len(outcomes) / elapsed:,.0f}/s): {reasons}, {len(errors)} errors")
+    print(f"  spent {gold_spent:,} of {GOLD:,} gold and {crystals_spent} of {CRYSTALS} crystals; "
+          f"left {stats['current_gold']:,} gold, {stats['crystals']} crystals; inventory {inventory}")
+    failures = []
+    if errors:
+        failures.append(f"errors: {errors[:3]}")
+    if stats['current_gold'] < 0 or stats['crystals'] < 0:
+        failures.append("overspent")
+    if stats['current_gold'] != GOLD - gold_spent or ledger != gold_spent:
+        failures.append(f"gold doesn't add up (ledger says {ledger:,} spent)")
+    if stats['crystals'] != CRYSTALS - crystals_spent:
+        failures.append("crystals don't add up")
+    if sum(inventory.values()) != len(bought):
+        failures.append("inventory doesn't match purchases")
+    if stats['current_gold'] >= get_item_by_id(ITEM)['price']['gold']:
+        failures.append("affordable purchases were refused")
+    print("  FAILED: " + "; ".join(failures) if failures else "  ok: no overspend; balances, ledger and inventory agree")
+    return not failures
+
+
+def main():
+    url = sys.argv[sys.argv.index('--postgres') + 1] if '--postgres' in sys.argv else None
+    args = [a for a in sys.argv[1:] if not a.startswith('--') and a != url]
+    threads = int(args[0]) if len(args) > 0 else 16
+    per_thread = int(args[1]) if len(args) > 1 else 25
+    if url:
+        ok = run(url, threads, per_thread)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            ok = run(os.path.join(tmp, "stress.db"), threads, per_thread)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Stress test: concurrent rewards against one user's running ledger totals
+
+Many threads, each with its own Database (and so its own connection, as
+separate Streamlit sessions or browser tabs would), hand one user XP and gold
+at once: manual awards, single check-ins and their undo, batched check-ins
+(including empty and already-done batches) and shop purchases, while all of
+them race to check one shared habit in on the same days, half with single
+check-ins and half in batches. Fails unless every ledger entry's running
+totals equal the sum of the entries before it, the balances moved by the
+ledger's sums, each contested check-in paid out once, and a writer can still
+get in after an empty or already-done batch.
+
+    python benchmarks/stress_rewards.py [threads] [rounds_per_thread] [--postgres URL]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from storage import backend_from_url
+
+
+def open_user(target, handle) -> Database:
+    db = Database(backend=backend_from_url(target)) if target.startswith('postgres') else Database(target)
+    return db.for_user(db.get_or_create_user(handle))
+
+
+def run(target, threads, rounds):
+    db = open_user(target, 'earner')
+    db.add_gold(100000)
+    start = db.get_stats()
+    habits = [db.create_habit(f"habit {n}", 'fitness', xp_reward=10, gold_reward=5) for n in range(threads)]
+    contested = db.create_habit("contested", 'fitness', xp_reward=10, gold_reward=5)
+    start_gate = threading.Barrier(threads)
+    errors = []
+
+    def earner(n):
+        session = open_user(target, 'earner')
+        habit = habits[n]
+        start_gate.wait()
+        for i in range(rounds):
+            day = (date(2024, 1, 1) + timedelta(days=i)).isoformat()
+            try:
+                session.add_xp(7)
+                session.add_gold(3)
+                session.toggle_completion(habit, day)
+                if i % 2:
+                    session.toggle_completion(habit, day, completed=False)
+                session.complete_habits([(habit, (date(2025, 1, 1) + timedelta(days=i)).isoformat())])
+                session.complete_habits([])
+                session.complete_habits([(habit, (date(2025, 1, 1) + timedelta(days=i)).isoformat())])
+                if n % 2:
+                    session.complete_habits([(contested, day)])
+                else:
+                    session.toggle_completion(contested, day)
+                if i % 5 == 0:
+                    session.purchase('xp_boost_1h')
+            except Exception as e:
+                errors.append(repr(e))
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(earner, range(threads)))
+    elapsed = time.perf_counter() - began
+
+    ledger = db.get_ledger()[::-1]  # oldest first
+    xp = earned = spent = 0
+    broken = 0
+    for entry in ledger:
+        xp += entry['xp']
+        if entry['source'] == 'shop':
+            spent -= entry['gold']
+        else:
+            earned += entry['gold']
+        if (entry['xp_running'], entry['gold_earned_running'], entry['gold_spent_running']) != (xp, earned, spent):
+            broken += 1
+    stats = db.get_stats()
+    paid = sum(entry['xp'] for entry in ledger if entry['source'] == 'habit' and entry['source_id'] == str(contested))
+    contested_days = len(db.get_completions(contested))
+
+    # Neither an empty nor an already-done batch may leave a write transaction open
+    db.complete_habits([])
+    db.complete_habits([(contested, date(2024, 1, 1).isoformat())])
+    writer = threading.Thread(target=lambda: open_user(target, 'earner').add_gold(0), daemon=True)
+    writer.start()
+    writer.join(10)
+
+    print(f"{len(ledger)} ledger entries from {threads} threads in {elapsed:.2f} s "
+          f"({len(ledger) / elapsed:,.0f}/s), {len(errors)} errors")
+    print(f"  ledger: {xp:,} XP, {earned:,} gold earned, {spent:,} spent; "
+          f"balances: {stats['total_xp']:,} XP, {stats['lifetime_gold']:,} lifetime gold, {stats['current_gold']:,} gold")
+    failures = []
+    if errors:
+        failures.append(f"errors: {errors[:3]}")
+    if broken:
+        failures.append(f"{broken} entries' running totals don't match the entries before them")
+    if paid != 10 * contested_days:
+        failures.append(f"contested check-ins paid {paid} XP for {contested_days} days")
+    if writer.is_alive():
+        failures.append("a writer was locked out after an empty or already-done batch")
+    if (stats['total_xp'], stats['lifetime_gold'], stats['current_gold'] - start['current_gold']) != \
+            (xp, earned, earned - start['lifetime_gold'] - spent):
+        failures.append("balances don't match the ledger")
+    print("  FAILED: " + "; ".join(failures) if failures else "  ok: running totals and balances agree with the ledger")
+    return not failures
+
+
+def main():
+    url = sys.argv[sys.argv.index('--postgres') + 1] if '--postgres' in sys.argv else None
+    args = [a for a in sys.argv[1:] if not a.startswith('--') and a != url]
+    threads = int(args[0]) if len(args) > 0 else 8
+    rounds = int(args[1]) if len(args) > 1 else 25
+    if url:
+        ok = run(url, threads, rounds)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            ok = run(os.path.join(tmp, "stress.db"), threads, rounds)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
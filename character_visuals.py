@@ -2,6 +2,7 @@
 Character Visualization System
 Creates dynamic SVG-based character avatars that evolve with level, stats, and equipment
 """
+from theme import stat_bar
 
 def get_character_svg(profile: dict, stats: dict, equipped: dict, active_effects: list = None) -> str:
     """
@@ -13,6 +14,9 @@ def get_character_svg(profile: dict, stats: dict, equipped: dict, active_effects
     - Elite (Lv 26-50): Advanced design with auras
     - S-Rank (Lv 51-75): Legendary appearance
     - Monarch (Lv 76-100): Ultimate transcendent form
+    
+    stats is get_stats() updated with get_effective_stats(), so gear,
+    achievements and boosts show on the character.
     """
     
     # Safely get values with defaults
@@ -331,8 +335,12 @@ def get_character_svg(profile: dict, stats: dict, equipped: dict, active_effects
     return svg
 
 
-def get_stat_visual_bars(stats: dict) -> str:
-    """Generate animated stat bars with icons and visual effects"""
+def get_stat_visual_bars(stats: dict, base: dict = None) -> str:
+    """Generate animated stat bars with icons (classes from static/theme.css)
+
+    stats should be Database.get_effective_stats(); pass base (get_stats())
+    to label each bar with what gear, achievements and boosts add.
+    """
     
     stat_config = {
         'strength': {'icon': '⚔️', 'color': '#FF4500', 'name': 'Strength'},
@@ -342,57 +350,16 @@ def get_stat_visual_bars(stats: dict) -> str:
         'sense': {'icon': '👁️', 'color': '#00CED1', 'name': 'Sense'},
         'willpower': {'icon': '🔥', 'color': '#FF6347', 'name': 'Willpower'}
     }
+    max_value = 100
     
-    html = "<div style='background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 100%); padding: 20px; border-radius: 15px; border: 2px solid #d4af37; margin: 20px 0;'>"
-    
+    bars = []
     for stat, config in stat_config.items():
         value = stats.get(stat, 0) if stats else 0
-        max_value = 100
-        percentage = min(100, (value / max_value) * 100) if max_value > 0 else 0
-        
-        html += f"""
-        <div style='margin: 15px 0;'>
-            <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
-                <span style='color: #ffffff; font-weight: bold;'>{config['icon']} {config['name']}</span>
-                <span style='color: {config['color']}; font-weight: bold;'>{value}</span>
-            </div>
-            <div style='background: #0a0a0a; height: 25px; border-radius: 12px; overflow: hidden; border: 2px solid #d4af37;'>
-                <div style='
-                    width: {percentage}%; 
-                    height: 100%; 
-                    background: linear-gradient(90deg, {config['color']} 0%, {config['color']}88 100%);
-                    box-shadow: 0 0 20px {config['color']};
-                    animation: fillBar 1s ease-out;
-                    position: relative;
-                '>
-                    <div style='
-                        position: absolute;
-                        top: 0;
-                        left: 0;
-                        right: 0;
-                        bottom: 0;
-                        background: linear-gradient(90deg, transparent 0%, rgba(255,255,255,0.3) 50%, transparent 100%);
-                        animation: shimmer 2s infinite;
-                    '></div>
-                </div>
-            </div>
-        </div>
-        """
+        bonus = value - (base.get(stat) or 0) if base else 0
+        bars.append(stat_bar(f"{config['icon']} {config['name']}", value, min(100, value / max_value * 100),
+                             config['color'], bonus))
     
-    html += """
-    </div>
-    <style>
-        @keyframes fillBar {
-            from { width: 0%; }
-        }
-        @keyframes shimmer {
-            0% { transform: translateX(-100%); }
-            100% { transform: translateX(100%); }
-        }
-    </style>
-    """
-    
-    return html
+    return f"<div class='stat-bars'>{''.join(bars)}</div>"
 
 
 def get_level_up_animation() -> str:
@@ -0,0 +1,100 @@
+"""
+Clock Service
+Resolves the user's timezone once, caches tzinfo objects, and answers "now",
+"today" and day-boundary questions so streaks roll over at the user's real
+midnight. The current clock is context-local and can be swapped for a
+FixedClock in tests and benchmarks.
+"""
+from contextvars import ContextVar
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+DEFAULT_TIMEZONE = 'America/Chicago'
+
+
+@lru_cache(maxsize=None)
+def get_zone(name: Optional[str]) -> tzinfo:
+    """Cached tzinfo for an IANA name; unknown names fall back to the default zone"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+@lru_cache(maxsize=1)
+def timezone_choices() -> List[str]:
+    """Sorted IANA timezone names for pickers"""
+    return sorted(name for name in available_timezones() if '/' in name and not name.startswith(('Etc/', 'SystemV/')))
+
+
+class Clock:
+    """Wall clock in one timezone"""
+
+    def __init__(self, timezone_name: str = DEFAULT_TIMEZONE):
+        self.timezone_name = timezone_name or DEFAULT_TIMEZONE
+        self.tz = get_zone(self.timezone_name)
+
+    def with_timezone(self, timezone_name: str) -> 'Clock':
+        return Clock(timezone_name)
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    def today(self) -> date:
+        return self.now().date()
+
+    def today_str(self) -> str:
+        return self.today().isoformat()
+
+    def day_bounds(self, day: date = None) -> Tuple[datetime, datetime]:
+        """[start, end) of a local day as aware datetimes (23 or 25 hours long across DST changes)"""
+        day = day or self.today()
+        start = datetime.combine(day, time.min, tzinfo=self.tz)
+        end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=self.tz)
+        return start, end
+
+    def seconds_until_midnight(self) -> float:
+        now = self.now()
+        return (self.day_bounds(now.date())[1] - now).total_seconds()
+
+    def local_date(self, value) -> Optional[date]:
+        """Local date of a timestamp; naive values (SQLite CURRENT_TIMESTAMP) are taken as UTC"""
+        if not value:
+            return None
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(self.tz).date()
+
+
+class FixedClock(Clock):
+    """Clock frozen at a given instant, for tests and benchmarks"""
+
+    def __init__(self, now: datetime, timezone_name: str = DEFAULT_TIMEZONE):
+        super().__init__(timezone_name)
+        self._now = now if now.tzinfo else now.replace(tzinfo=self.tz)
+
+    def with_timezone(self, timezone_name: str) -> 'Clock':
+        return FixedClock(self._now, timezone_name)
+
+    def now(self) -> datetime:
+        return self._now.astimezone(self.tz)
+
+    def advance(self, **kwargs):
+        self._now += timedelta(**kwargs)
+
+
+_default_clock = Clock()
+_current_clock: ContextVar[Optional[Clock]] = ContextVar('goal_quest_clock', default=None)
+
+
+def get_clock() -> Clock:
+    return _current_clock.get() or _default_clock
+
+
+def use_clock(clock: Clock):
+    """Make `clock` current for this context (a Streamlit script run, a test, a benchmark)"""
+    return _current_clock.set(clock)
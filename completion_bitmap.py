@@ -0,0 +1,160 @@
+"""
+Completion Bitmaps
+Compact per-habit completion history: one bit per day, bit 0 = base day.
+Streaks, range counts, perfect weeks and heatmaps become integer bit
+operations instead of row scans and ISO date parsing.
+"""
+from datetime import date, datetime
+from typing import Iterable, List, Tuple
+
+
+def to_day(value) -> int:
+    """Convert a date, datetime or ISO date string to a day number (proleptic ordinal)"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+def from_day(day: int) -> date:
+    return date.fromordinal(day)
+
+
+def longest_run(bits: int) -> int:
+    """Length of the longest run of set bits"""
+    run = 0
+    while bits:
+        bits &= bits >> 1
+        run += 1
+    return run
+
+
+class CompletionBitmap:
+    """Day-indexed bitset for one habit, stored as (base_day, little-endian BLOB)"""
+
+    __slots__ = ('base', 'bits')
+
+    def __init__(self, base: int = 0, bits: int = 0):
+        self.base = base
+        self.bits = bits
+
+    @classmethod
+    def from_blob(cls, base: int, blob: bytes) -> 'CompletionBitmap':
+        return cls(base, int.from_bytes(blob or b'', 'little'))
+
+    @classmethod
+    def from_dates(cls, dates: Iterable) -> 'CompletionBitmap':
+        days = [to_day(d) for d in dates]
+        bitmap = cls(min(days) if days else 0)
+        for day in days:
+            bitmap.bits |= 1 << (day - bitmap.base)
+        return bitmap
+
+    def to_blob(self) -> bytes:
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def set(self, day, completed: bool = True):
+        day = to_day(day)
+        if not self.bits:
+            self.base = day
+        elif day < self.base:
+            # Re-base so bit 0 stays the earliest day
+            self.bits <<= self.base - day
+            self.base = day
+
+        if completed:
+            self.bits |= 1 << (day - self.base)
+        else:
+            self.bits &= ~(1 << (day - self.base))
+
+    def has(self, day) -> bool:
+        offset = to_day(day) - self.base
+        return offset >= 0 and bool(self.bits >> offset & 1)
+
+    def window(self, start, end) -> int:
+        """Bits for [start, end] inclusive, with start at bit 0"""
+        start, end = to_day(start), to_day(end)
+        if end < start:
+            return 0
+        offset = start - self.base
+        bits = self.bits >> offset if offset >= 0 else self.bits << -offset
+        return bits & ((1 << (end - start + 1)) - 1)
+
+    def count(self, start=None, end=None) -> int:
+        """Completions in [start, end] inclusive (whole history by default)"""
+        if start is None and end is None:
+            return len(self)
+        start = to_day(start) if start is not None else self.base
+        end = to_day(end) if end is not None else self.base + self.bits.bit_length()
+        return self.window(start, end).bit_count()
+
+    def current_streak(self, today, expected: int = None) -> int:
+        """Consecutive completed days ending today, or yesterday if today is still open.
+        
+        With `expected` (scheduled-day bits, bit 0 = base day) only scheduled days
+        count, and only a missed scheduled day breaks the streak.
+        """
+        offset = to_day(today) - self.base
+        if offset < 0 or not self.bits:
+            return 0
+
+        if expected is None:
+            if not self.bits >> offset & 1:
+                offset -= 1
+            if offset < 0 or not self.bits >> offset & 1:
+                return 0
+            gaps = ~self.bits & ((1 << (offset + 1)) - 1)
+            return offset + 1 - gaps.bit_length()
+
+        # Today can't break the streak while it is still open
+        hits = self.bits & expected & ((1 << (offset + 1)) - 1)
+        misses = expected & ~self.bits & ((1 << offset) - 1)
+        return (hits >> misses.bit_length()).bit_count()
+
+    def longest_streak(self) -> int:
+        return longest_run(self.bits)
+
+    def calendar(self, start, end) -> List[Tuple[date, bool]]:
+        """(date, completed) for each day in [start, end], for heatmaps"""
+        start, end = to_day(start), to_day(end)
+        bits = self.window(start, end)
+        return [(from_day(start + i), bool(bits >> i & 1)) for i in range(end - start + 1)]
+
+
+def all_completed(bitmaps: List[CompletionBitmap], start, end) -> int:
+    """Bits for [start, end] set only on days every habit was completed"""
+    start, end = to_day(start), to_day(end)
+    if not bitmaps or end < start:
+        return 0
+
+    bits = (1 << (end - start + 1)) - 1
+    for bitmap in bitmaps:
+        bits &= bitmap.window(start, end)
+    return bits
+
+
+def has_perfect_run(bitmaps: List[CompletionBitmap], start, end, length: int = 7) -> bool:
+    """True if every habit was completed on `length` consecutive days within [start, end]"""
+    bits = all_completed(bitmaps, start, end)
+    for _ in range(length - 1):
+        bits &= bits >> 1
+    return bits != 0
+
+
+def heatmap(bitmaps: List[CompletionBitmap], start, end) -> List[Tuple[date, int]]:
+    """(date, habits completed) for each day in [start, end]"""
+    start, end = to_day(start), to_day(end)
+    counts = [0] * max(end - start + 1, 0)
+    for bitmap in bitmaps:
+        bits = bitmap.window(start, end)
+        while bits:
+            low = bits & -bits
+            counts[low.bit_length() - 1] += 1
+            bits ^= low
+    return [(from_day(start + i), n) for i, n in enumerate(counts)]
@@ -1,26 +1,176 @@
-import sqlite3
 import json
-from datetime import datetime, date
-from typing import List, Dict, Optional, Any
-import pytz
+import copy
+import threading
+import weakref
+from datetime import datetime, date, timedelta
+from typing import List, Dict, Optional, Any, Callable
+from clock import Clock
+from completion_bitmap import CompletionBitmap
+from effects import EffectsEngine, to_stored
+from habit_schedule import weekday_mask
+import minhash
+import text_codec
+from shop_items import get_item_by_id, meets_level_requirement, stack_limit
+from stat_sheet import STAT_NAMES, StatSheet, parse_stat_bonus
+from storage import SQLiteBackend, StorageBackend, connect
+
+# Stored by the backend (PRAGMA user_version on SQLite); bump whenever init_db
+# changes so existing databases (and shards) migrate
+SCHEMA_VERSION = 10
+# From this schema on, user_stats holds base stats only; achievement stat bonuses are added on read
+BASE_STATS_SCHEMA = 7
+# From this schema on, notes.updated_at is UTC in CURRENT_TIMESTAMP's format (was local isoformat())
+UTC_NOTE_TIMES_SCHEMA = 10
+# Check-ins per multi-row completions upsert (3 parameters each, under SQLite's variable limit)
+CHECKIN_BATCH = 300
+
+# Every per-user query filters on user_id first, so indexes lead with it. The
+# ledger tail is the newest row per user (rowid order within user_id); period
+# sums are two running-total lookups on (user_id, day); undo finds entries by source.
+# Paged lists end with their sort order, so a page is an index range scan. Streak
+# shield markers (completed = 0) are a sliver of completions and get their own partial index.
+INDEXES = {
+    'idx_habits_user_order': 'habits(user_id, active, priority, created_at, id)',
+    'idx_goals_user_order': 'goals(user_id, completed, priority DESC, deadline, id)',
+    'idx_completions_user_date': 'completions(user_id, date)',
+    'idx_completions_shields': 'completions(user_id, habit_id, date) WHERE completed = 0',
+    'idx_notes_user_order': 'notes(user_id, pinned, updated_at, id)',
+    'idx_effects_user': 'active_effects(user_id, expires_at)',
+    'idx_documents_user_order': 'philosophy_documents(user_id, uploaded_at, id)',
+    'idx_documents_hash': 'philosophy_documents(content_sha256, user_id)',
+    'idx_bitmaps_user': 'habit_bitmaps(user_id)',
+    'idx_streaks_user': 'habit_streaks(user_id)',
+    'idx_ledger_user': 'reward_ledger(user_id)',
+    'idx_ledger_user_day': 'reward_ledger(user_id, day)',
+    'idx_ledger_user_source': 'reward_ledger(user_id, source, source_id, ref_date)',
+}
+# Upsert targets: ON CONFLICT needs these, so imports never drop them
+UNIQUE_INDEXES = {
+    'idx_inventory_user_item': 'inventory(user_id, item_id)',
+}
+# Consumable effects use_item() can apply; streak shields are spent by the rollover, not by hand
+USABLE_EFFECTS = ('xp_multiplier', 'gold_multiplier', 'stat_boost_temp', 'stat_boost_perm', 'instant_complete_habit')
+# Equipment columns are <slot>_id
+EQUIPMENT_SLOTS = ('weapon', 'armor', 'ring', 'amulet', 'head')
+
+# Sort orders of the paged lists as (column, descending, nullable); each ends
+# with id so it is total and a page can resume after any row
+HABIT_ORDER = [('priority', True, False), ('created_at', True, False), ('id', True, False)]
+GOAL_ORDER = [('priority', True, False), ('deadline', False, True), ('id', False, False)]
+NOTE_ORDER = [('pinned', True, False), ('updated_at', True, False), ('id', True, False)]
+DOCUMENT_ORDER = [('pd.uploaded_at', True, False), ('pd.id', True, False)]
+ACHIEVEMENT_ORDER = [('u.unlocked_at', True, True), ('a.tier', False, False), ('a.category', False, False),
+                     ('a.id', False, False)]
+
+
+def _order_by(order: List) -> str:
+    """ORDER BY clause for a sort order; NULLs sort last either way"""
+    return ", ".join(f"{column} {'DESC' if descending else 'ASC'}{' NULLS LAST' if nullable else ''}"
+                     for column, descending, nullable in order)
+
+
+def _after(order: List, row: Dict) -> tuple:
+    """Keyset condition for the rows that sort after `row` (the last row of the previous page), with its params.
+
+    Expands to (a > x) OR (a = x AND b > y) OR ..., which works for mixed
+    directions and NULLs; `row` only needs the order's columns.
+    """
+    clauses, params = [], []
+    equal, equal_params = [], []
+    for column, descending, nullable in order:
+        value = row[column.split('.')[-1]]
+        if value is not None:
+            beyond = f"{column} {'<' if descending else '>'} ?"
+            clauses.append(" AND ".join(equal + [f"({beyond} OR {column} IS NULL)" if nullable else beyond]))
+            params += equal_params + [value]
+            equal, equal_params = equal + [f"{column} = ?"], equal_params + [value]
+        else:
+            equal.append(f"{column} IS NULL")  # NULLs sort last: nothing is beyond one
+    return "(" + " OR ".join(f"({clause})" for clause in clauses) + ")" if clauses else "1 = 0", params
+
+
+def _page(query: str, params: List, order: List, after: Dict = None, limit: int = None) -> tuple:
+    """Add ORDER BY, and a keyset condition and LIMIT when paging, to a query that ends in its WHERE clause"""
+    if after is not None:
+        condition, after_params = _after(order, after)
+        query += f" AND {condition}"
+        params = params + after_params
+    query += f" ORDER BY {_order_by(order)}"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return query, params
 
 class Database:
-    def __init__(self, db_path="goal_quest.db"):
+    def __init__(self, db_path="goal_quest.db", clock: Clock = None, user_id: int = 1, router=None,
+                 backend: StorageBackend = None, migrate: bool = True):
         self.db_path = db_path
-        self.conn = None
-        self.cst = pytz.timezone('America/Chicago')
-        self.init_db()
+        self._local = threading.local()  # each thread's pooled connection; shared by for_user copies
+        self.user_id = user_id
+        self.router = router  # ShardRouter: each user's data lives in its own file
+        self.backend = backend or SQLiteBackend(db_path)
+        self.dictionaries: Dict[int, bytes] = {}  # compression dictionaries by id; shared by for_user copies
+        self.effects: Dict[int, EffectsEngine] = {}  # active effects by user id; shared by for_user copies
+        self.stat_sheets: Dict[int, StatSheet] = {}  # effective stats by user id; shared by for_user copies
+        self._cache_lock = threading.Lock()  # guards in-place updates of cached engines, never SQL (sheets lock themselves)
+        self.clock = clock or Clock()
+        # migrate=False when the schema is known to be current (the app checks it once per process)
+        if migrate:
+            self.init_db()
+        else:
+            self.init_defaults()
+        if clock is None:
+            self.clock = Clock(self.get_profile().get('timezone'))
     
     def get_connection(self):
-        if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
-        return self.conn
+        """This thread's connection, taken from the backend's pool on first use and given back when the thread ends.
+
+        One Database can serve every session of the app: each script thread
+        gets its own connection (so transactions never interleave), and idle
+        sessions hold none.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.router is not None:
+                # The router's pool for this shard, reopened if its LRU evicted the one we had
+                self.backend = self.router.backend(self.user_id)
+            backend = self.backend
+            conn = self._local.conn = backend.connect()
+            self._local.release = weakref.finalize(threading.current_thread(), backend.release, conn)
+        return conn
+    
+    def for_user(self, user_id: int) -> 'Database':
+        """This database scoped to another user (shares the connection pool and caches)"""
+        scoped = copy.copy(self)
+        scoped.user_id = user_id
+        scoped.init_defaults()
+        scoped.clock = self.clock.with_timezone(scoped.get_profile().get('timezone'))
+        return scoped
     
     def init_db(self):
         conn = self.get_connection()
         c = conn.cursor()
         
+        version = self.backend.schema_version(c)
+        if version >= SCHEMA_VERSION:
+            self.init_defaults()
+            return
+        
+        # Single-user databases keyed motivations and rollups by date alone; re-key them by (user_id, date)
+        tables = self.backend.tables(c)
+        legacy_motivations = 'motivations' in tables and 'user_id' not in self._columns(c, 'motivations')
+        if legacy_motivations:
+            c.execute("ALTER TABLE motivations RENAME TO motivations_single_user")
+        if 'daily_rollups' in tables and 'user_id' not in self._columns(c, 'daily_rollups'):
+            c.execute("DROP TABLE daily_rollups")  # derived; rebuilt per user below
+        
+        # Users (profile, stats and equipment rows share the user's id)
+        c.execute('''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            handle TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        c.execute("INSERT INTO users (handle) VALUES ('default') ON CONFLICT(handle) DO NOTHING")
+        
         # User Profile
         c.execute('''CREATE TABLE IF NOT EXISTS user_profile (
             id INTEGER PRIMARY KEY,
@@ -42,6 +192,7 @@ class Database:
         # Habits
         c.execute('''CREATE TABLE IF NOT EXISTS habits (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             name TEXT NOT NULL,
             description TEXT,
             category TEXT NOT NULL,
@@ -63,6 +214,7 @@ class Database:
         # Goals
         c.execute('''CREATE TABLE IF NOT EXISTS goals (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             title TEXT NOT NULL,
             description TEXT,
             category TEXT DEFAULT 'personal',
@@ -87,6 +239,7 @@ class Database:
         # Habit Completions
         c.execute('''CREATE TABLE IF NOT EXISTS completions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             habit_id INTEGER NOT NULL,
             date DATE NOT NULL,
             completed BOOLEAN DEFAULT 1,
@@ -113,6 +266,7 @@ class Database:
         # Notes
         c.execute('''CREATE TABLE IF NOT EXISTS notes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             title TEXT NOT NULL,
             content TEXT DEFAULT '',
             category TEXT DEFAULT 'personal',
@@ -124,7 +278,7 @@ class Database:
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
         
-        # Achievements
+        # Achievements (shared catalog; unlocks are per user)
         c.execute('''CREATE TABLE IF NOT EXISTS achievements (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             key TEXT NOT NULL UNIQUE,
@@ -140,20 +294,41 @@ class Database:
             unlocked_at TIMESTAMP
         )''')
         
+        c.execute('''CREATE TABLE IF NOT EXISTS achievement_unlocks (
+            user_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, key)
+        )''')
+        
+        if 'achievement_unlocks' not in tables:
+            c.execute('''INSERT INTO achievement_unlocks (user_id, key, unlocked_at)
+                         SELECT 1, key, unlocked_at FROM achievements WHERE unlocked_at IS NOT NULL
+                         ON CONFLICT DO NOTHING''')
+        
         # Daily Motivations
         c.execute('''CREATE TABLE IF NOT EXISTS motivations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date DATE NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL DEFAULT 1,
+            date DATE NOT NULL,
             quote TEXT NOT NULL,
             philosophy TEXT NOT NULL,
             tradition TEXT NOT NULL,
             habit_context TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, date)
         )''')
         
+        if legacy_motivations:
+            c.execute('''INSERT INTO motivations (user_id, date, quote, philosophy, tradition, habit_context, created_at)
+                         SELECT 1, date, quote, philosophy, tradition, habit_context, created_at
+                         FROM motivations_single_user''')
+            c.execute("DROP TABLE motivations_single_user")
+        
         # Inventory
         c.execute('''CREATE TABLE IF NOT EXISTS inventory (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             item_id TEXT NOT NULL,
             quantity INTEGER DEFAULT 1,
             equipped BOOLEAN DEFAULT 0,
@@ -163,6 +338,7 @@ class Database:
         # Active Effects
         c.execute('''CREATE TABLE IF NOT EXISTS active_effects (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             effect_type TEXT NOT NULL,
             value REAL NOT NULL,
             expires_at TIMESTAMP NOT NULL,
@@ -183,6 +359,7 @@ class Database:
         # Philosophy Library (NEW!)
         c.execute('''CREATE TABLE IF NOT EXISTS philosophy_documents (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
             filename TEXT NOT NULL,
             content TEXT,
             file_type TEXT,
@@ -192,31 +369,209 @@ class Database:
             uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
         
+        # Document Store (shared, content-addressed by the SHA-256 of the uploaded file):
+        # identical uploads share one extraction, one AI analysis and one MinHash signature
+        c.execute('''CREATE TABLE IF NOT EXISTS document_blobs (
+            sha256 TEXT PRIMARY KEY,
+            content TEXT,
+            content_compressed BLOB,
+            file_size INTEGER,
+            ai_summary TEXT,
+            key_concepts TEXT,
+            minhash BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        self._ensure_column(c, 'philosophy_documents', 'content_sha256', 'TEXT')
+        
+        # Document text is stored compressed (text_codec); content holds only rows not yet compressed
+        self._ensure_column(c, 'philosophy_documents', 'content_compressed', 'BLOB')
+        self._ensure_column(c, 'document_blobs', 'content_compressed', 'BLOB')
+        self.backend.drop_not_null(c, 'document_blobs', 'content')
+        c.execute('''CREATE TABLE IF NOT EXISTS compression_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        if 'document_segments' in tables:
+            self._ensure_column(c, 'document_segments', 'content_compressed', 'BLOB')
+            self._ensure_column(c, 'document_segments', 'dictionary_id', 'INTEGER')
+            self.backend.drop_not_null(c, 'document_segments', 'content')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_segments_document ON document_segments(document_id, segment_number)")
+        
+        # Daily Rollups (materialized per-day totals for analytics)
+        c.execute('''CREATE TABLE IF NOT EXISTS daily_rollups (
+            user_id INTEGER NOT NULL DEFAULT 1,
+            date DATE NOT NULL,
+            completions INTEGER DEFAULT 0,
+            xp_earned INTEGER DEFAULT 0,
+            gold_earned INTEGER DEFAULT 0,
+            habits_completed INTEGER DEFAULT 0,
+            perfect_day BOOLEAN DEFAULT 0,
+            PRIMARY KEY (user_id, date)
+        )''')
+        
+        # Reward Ledger (append-only XP/gold history; user_stats is a checkpoint of it)
+        c.execute('''CREATE TABLE IF NOT EXISTS reward_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 1,
+            source TEXT NOT NULL,
+            source_id TEXT,
+            xp INTEGER NOT NULL DEFAULT 0,
+            gold INTEGER NOT NULL DEFAULT 0,
+            xp_running INTEGER NOT NULL DEFAULT 0,
+            gold_earned_running INTEGER NOT NULL DEFAULT 0,
+            gold_spent_running INTEGER NOT NULL DEFAULT 0,
+            day DATE NOT NULL,
+            ref_date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        
+        self._ensure_column(c, 'user_stats', 'ledger_id', 'INTEGER DEFAULT 0')
+        self._ensure_column(c, 'user_stats', 'crystals', 'INTEGER DEFAULT 0')
+        
+        # Habit Bitmaps (one bit per day since base_day, kept alongside completions)
+        c.execute('''CREATE TABLE IF NOT EXISTS habit_bitmaps (
+            habit_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL DEFAULT 1,
+            base_day INTEGER NOT NULL,
+            bits BLOB NOT NULL
+        )''')
+        
+        # Daily Rollover: the last finalized local day and the user's unspent streak shields
+        c.execute('''CREATE TABLE IF NOT EXISTS rollover_state (
+            id INTEGER PRIMARY KEY,
+            last_day DATE,
+            shield_charges INTEGER DEFAULT 0,
+            auto_shield_week TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        
+        # Habit Streaks (persisted by the rollover as of `through`, the last finalized day)
+        c.execute('''CREATE TABLE IF NOT EXISTS habit_streaks (
+            habit_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL DEFAULT 1,
+            current_streak INTEGER DEFAULT 0,
+            longest_streak INTEGER DEFAULT 0,
+            through DATE NOT NULL
+        )''')
+        
+        # Rows from single-user databases belong to user 1
+        for table in ['habits', 'goals', 'completions', 'notes', 'inventory', 'active_effects',
+                      'philosophy_documents', 'reward_ledger', 'habit_bitmaps']:
+            self._ensure_column(c, table, 'user_id', 'INTEGER NOT NULL DEFAULT 1')
+        
+        for index in ['idx_completions_date', 'idx_ledger_day', 'idx_ledger_source', 'idx_inventory_user',
+                      'idx_habits_user', 'idx_goals_user', 'idx_notes_user', 'idx_documents_user']:
+            c.execute(f"DROP INDEX IF EXISTS {index}")
+        for name, target in INDEXES.items():
+            c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        self._merge_inventory_stacks(c)
+        for name, target in UNIQUE_INDEXES.items():
+            c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {target}")
+        
+        self._compress_stored_text(c)
+        if version < BASE_STATS_SCHEMA:
+            self._remove_achievement_bonuses(c)
+        if version < UTC_NOTE_TIMES_SCHEMA:
+            self._normalize_note_times(c)
+        self.backend.set_schema_version(c, SCHEMA_VERSION)
         conn.commit()
         self.init_defaults()
+        
+        # Backfill rollups and bitmaps for databases created before those tables existed
+        c.execute("SELECT EXISTS(SELECT 1 FROM daily_rollups), EXISTS(SELECT 1 FROM habit_bitmaps), EXISTS(SELECT 1 FROM completions)")
+        has_rollups, has_bitmaps, has_completions = c.fetchone()
+        if has_completions and not (has_rollups and has_bitmaps):
+            c.execute("SELECT DISTINCT user_id FROM completions")
+            for (user_id,) in c.fetchall():
+                scoped = self if user_id == self.user_id else self.for_user(user_id)
+                if not has_rollups:
+                    scoped.rebuild_daily_rollups()
+                if not has_bitmaps:
+                    scoped.rebuild_habit_bitmaps()
+    
+    def _merge_inventory_stacks(self, c):
+        """Fold duplicate (user_id, item_id) inventory rows into the oldest one"""
+        c.execute("""
+            UPDATE inventory SET quantity = (
+                SELECT SUM(stack.quantity) FROM inventory AS stack
+                WHERE stack.user_id = inventory.user_id AND stack.item_id = inventory.item_id
+            )
+            WHERE id IN (SELECT MIN(id) FROM inventory GROUP BY user_id, item_id HAVING COUNT(*) > 1)
+        """)
+        c.execute("DELETE FROM inventory WHERE id NOT IN (SELECT MIN(id) FROM inventory GROUP BY user_id, item_id)")
+    
+    def _remove_achievement_bonuses(self, c, user_id: int = None):
+        """Take achievement stat bonuses that older schemas added on unlock back out of user_stats (all users by default)"""
+        query = """
+            SELECT u.user_id, a.stat_bonus FROM achievement_unlocks u
+            JOIN achievements a ON a.key = u.key
+            WHERE a.stat_bonus IS NOT NULL
+        """
+        params = ()
+        if user_id is not None:
+            query += " AND u.user_id = ?"
+            params = (user_id,)
+        c.execute(query, params)
+        totals = {}
+        for owner, value in c.fetchall():
+            bonus = parse_stat_bonus(value)
+            if bonus:
+                totals[(owner, bonus[0])] = totals.get((owner, bonus[0]), 0) + bonus[1]
+        for stat in STAT_NAMES:
+            c.executemany(f"UPDATE user_stats SET {stat} = {stat} - ? WHERE id = ?",
+                          [(amount, owner) for (owner, name), amount in totals.items() if name == stat])
+    
+    def _normalize_note_times(self, c, user_id: int = None):
+        """Rewrite local isoformat() note edit times as UTC CURRENT_TIMESTAMP text (all users by default)"""
+        query, params = "SELECT id, updated_at FROM notes WHERE updated_at LIKE ?", ['%T%']
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        c.execute(query, params)
+        c.executemany("UPDATE notes SET updated_at = ? WHERE id = ?",
+                      [(to_stored(updated_at), note_id) for note_id, updated_at in c.fetchall()])
+    
+    def _columns(self, c, table: str) -> List[str]:
+        return self.backend.columns(c, table)
+    
+    def _ensure_column(self, c, table: str, column: str, ddl: str):
+        """Add a column to an existing table if an older schema lacks it"""
+        if column not in self._columns(c, table):
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
     
     def init_defaults(self):
         conn = self.get_connection()
         c = conn.cursor()
         
-        c.execute("SELECT COUNT(*) FROM user_profile")
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO user_profile (id) VALUES (1)")
-        
-        c.execute("SELECT COUNT(*) FROM user_stats")
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO user_stats (id, current_gold) VALUES (1, 5000)")  # Start with 5000 gold!
+        c.execute("INSERT INTO user_profile (id) VALUES (?) ON CONFLICT DO NOTHING", (self.user_id,))
+        c.execute("INSERT INTO user_stats (id, current_gold) VALUES (?, 5000) ON CONFLICT DO NOTHING", (self.user_id,))  # Start with 5000 gold!
+        c.execute("INSERT INTO equipment (id) VALUES (?) ON CONFLICT DO NOTHING", (self.user_id,))
         
-        c.execute("SELECT COUNT(*) FROM equipment")
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO equipment (id) VALUES (1)")
+        conn.commit()
+    
+    # ===== USERS =====
+    def get_or_create_user(self, handle: str) -> int:
+        """Id for a user handle, registering it on first sight"""
+        if self.router is not None:
+            return self.router.get_or_create_user(handle)
         
+        conn = self.get_connection()
+        c = conn.cursor()
+        c.execute("INSERT INTO users (handle) VALUES (?) ON CONFLICT(handle) DO NOTHING", (handle,))
         conn.commit()
+        c.execute("SELECT id FROM users WHERE handle = ?", (handle,))
+        return c.fetchone()[0]
+    
+    def get_users(self) -> List[Dict]:
+        c = self.get_connection().cursor()
+        c.execute("SELECT * FROM users ORDER BY id")
+        return [dict(row) for row in c.fetchall()]
     
     # ===== USER PROFILE =====
     def get_profile(self) -> Dict:
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM user_profile WHERE id = 1")
+        c.execute("SELECT * FROM user_profile WHERE id = ?", (self.user_id,))
         row = c.fetchone()
         if row:
             profile = dict(row)
@@ -241,9 +596,13 @@ class Database:
             fields.append(f"{key} = ?")
             values.append(value)
         
-        query = f"UPDATE user_profile SET {', '.join(fields)} WHERE id = 1"
+        values.append(self.user_id)
+        query = f"UPDATE user_profile SET {', '.join(fields)} WHERE id = ?"
         c.execute(query, values)
         conn.commit()
+        
+        if kwargs.get('timezone'):
+            self.clock = self.clock.with_timezone(kwargs['timezone'])
     
     # ===== HABITS =====
     def create_habit(self, name: str, category: str, description: str = "", **kwargs) -> int:
@@ -257,23 +616,30 @@ class Database:
         if 'frequency_days' in kwargs and isinstance(kwargs['frequency_days'], list):
             kwargs['frequency_days'] = json.dumps(kwargs['frequency_days'])
         
-        fields = ['name', 'category', 'description'] + list(kwargs.keys())
-        values = [name, category, description] + list(kwargs.values())
+        fields = ['user_id', 'name', 'category', 'description'] + list(kwargs.keys())
+        values = [self.user_id, name, category, description] + list(kwargs.values())
         placeholders = ', '.join(['?'] * len(fields))
         
-        query = f"INSERT INTO habits ({', '.join(fields)}) VALUES ({placeholders})"
-        c.execute(query, values)
+        query = f"INSERT INTO habits ({', '.join(fields)}) VALUES ({placeholders}) RETURNING id"
+        new_id = c.execute(query, values).fetchone()[0]
         conn.commit()
-        return c.lastrowid
+        return new_id
     
-    def get_habits(self, active_only=True) -> List[Dict]:
+    def get_habits(self, active_only=True, archived_only=False, category: str = None,
+                   after: Dict = None, limit: int = None) -> List[Dict]:
+        """Habits in display order; with limit, one page of them starting after the row `after`"""
         c = self.get_connection().cursor()
-        query = "SELECT * FROM habits"
+        query = "SELECT * FROM habits WHERE user_id = ?"
+        params = [self.user_id]
         if active_only:
-            query += " WHERE active = 1"
-        query += " ORDER BY priority DESC, created_at DESC"
-        
-        c.execute(query)
+            query += " AND active = 1"
+        elif archived_only:
+            query += " AND active = 0"
+        if category:
+            query += " AND category = ?"
+            params.append(category)
+        
+        c.execute(*_page(query, params, HABIT_ORDER, after, limit))
         habits = [dict(row) for row in c.fetchall()]
         
         for habit in habits:
@@ -298,46 +664,197 @@ class Database:
             fields.append(f"{key} = ?")
             values.append(value)
         
-        values.append(habit_id)
-        query = f"UPDATE habits SET {', '.join(fields)} WHERE id = ?"
+        values += [habit_id, self.user_id]
+        query = f"UPDATE habits SET {', '.join(fields)} WHERE id = ? AND user_id = ?"
         c.execute(query, values)
         conn.commit()
     
     def delete_habit(self, habit_id: int):
         conn = self.get_connection()
         c = conn.cursor()
-        c.execute("DELETE FROM habits WHERE id = ?", (habit_id,))
+        c.execute("DELETE FROM habits WHERE id = ? AND user_id = ? RETURNING substr(created_at, 1, 10), active",
+                  (habit_id, self.user_id))
+        deleted = c.fetchone()
+        if deleted is None:
+            conn.commit()
+            return
+        created, active = deleted
+        c.execute("""
+            UPDATE daily_rollups
+            SET completions = completions - 1, habits_completed = habits_completed - 1
+            WHERE user_id = ? AND date IN (SELECT date FROM completions WHERE habit_id = ? AND completed = 1)
+            RETURNING date
+        """, (self.user_id, habit_id))
+        dates = [row[0] for row in c.fetchall()]
+        if active:
+            # Days it was scheduled but missed may be perfect without it
+            c.execute("SELECT date FROM daily_rollups WHERE user_id = ? AND date >= ?", (self.user_id, created))
+            dates += [row[0] for row in c.fetchall()]
         c.execute("DELETE FROM completions WHERE habit_id = ?", (habit_id,))
+        c.execute("DELETE FROM habit_bitmaps WHERE habit_id = ?", (habit_id,))
+        c.execute("DELETE FROM habit_streaks WHERE habit_id = ?", (habit_id,))
+        self._update_perfect_days(c, dates)
         conn.commit()
     
     # ===== COMPLETIONS =====
-    def toggle_completion(self, habit_id: int, date_str: str, completed: bool = True):
+    def toggle_completion(self, habit_id: int, date_str: str, completed: bool = True) -> tuple:
+        """Check a habit in or undo it; returns the (xp, gold) granted, negative for an undo and (0, 0) if nothing changed"""
         conn = self.get_connection()
         c = conn.cursor()
+        date_str = str(date_str)
+        granted = (0, 0)
         
         if completed:
-            c.execute("""
-                INSERT OR REPLACE INTO completions (habit_id, date, completed)
-                VALUES (?, ?, 1)
-            """, (habit_id, date_str))
-            
-            # Get rewards
-            c.execute("SELECT xp_reward, gold_reward FROM habits WHERE id = ?", (habit_id,))
-            row = c.fetchone()
-            if row:
-                xp_reward = row[0]
-                gold_reward = row[1]
-                self.add_xp(xp_reward)
-                self.add_gold(gold_reward)
+            granted = self._check_in(c, habit_id, date_str) or granted
         else:
-            c.execute("DELETE FROM completions WHERE habit_id = ? AND date = ?", (habit_id, date_str))
+            c.execute("DELETE FROM completions WHERE habit_id = ? AND date = ? AND user_id = ? AND completed = 1",
+                      (habit_id, date_str, self.user_id))
+            if c.rowcount == 1:
+                self._invalidate_streaks(c, [(habit_id, date_str)])
+                # Undo: reverse whatever this check-in earned
+                c.execute("""
+                    SELECT COALESCE(SUM(xp), 0), COALESCE(SUM(gold), 0) FROM reward_ledger
+                    WHERE user_id = ? AND source = 'habit' AND source_id = ? AND ref_date = ?
+                """, (self.user_id, str(habit_id), date_str))
+                xp_earned, gold_earned = c.fetchone()
+                if xp_earned or gold_earned:
+                    self._record_reward(c, 'habit', habit_id, -xp_earned, -gold_earned, ref_date=date_str)
+                    granted = (-xp_earned, -gold_earned)
+                self._bump_rollup(c, date_str, completions=-1)
+                self._set_bitmap_day(c, habit_id, date_str, False)
         
         conn.commit()
+        return granted
+    
+    def _check_in(self, c, habit_id: int, date_str: str) -> Optional[tuple]:
+        """Record one check-in and its boosted reward, returned as (xp, gold); None if the habit isn't this user's or is already done"""
+        c.execute("SELECT xp_reward, gold_reward, category, difficulty FROM habits WHERE id = ? AND user_id = ?",
+                  (habit_id, self.user_id))
+        row = c.fetchone()
+        if not row:
+            return None
+        
+        # A rollover's protected marker (completed = 0) becomes a real check-in
+        c.execute("""
+            INSERT INTO completions (user_id, habit_id, date, completed)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT(habit_id, date) DO UPDATE SET completed = 1 WHERE completions.completed = 0
+        """, (self.user_id, habit_id, date_str))
+        
+        # Only a new check-in earns rewards
+        if c.rowcount != 1:
+            return None
+        self._invalidate_streaks(c, [(habit_id, date_str)])
+        xp, gold = self._effects(c).apply(row[0], row[1], row[2], row[3])
+        self._record_reward(c, 'habit', habit_id, xp, gold, ref_date=date_str)
+        self._bump_rollup(c, date_str, completions=1)
+        self._set_bitmap_day(c, habit_id, date_str, True)
+        return xp, gold
+    
+    def complete_habits(self, checkins: List[tuple], evaluate_achievements: Callable[['Database'], List[str]] = None) -> Dict:
+        """Check in many (habit_id, date) pairs in one transaction.
+        
+        Completions and their ledger entries are written in batches; rewards
+        are totalled and levels applied once, each day's rollup and each habit's
+        bitmap is written once, and evaluate_achievements(db) -> keys runs once
+        against the batch before the commit. Pairs already checked in and habits
+        the user doesn't own are skipped.
+        """
+        conn = self.get_connection()
+        c = conn.cursor()
+        self.backend.begin(c)
+        try:
+            summary = self._complete_habits(c, checkins, evaluate_achievements)
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        return summary
+    
+    def _complete_habits(self, c, checkins: List[tuple], evaluate_achievements) -> Dict:
+        # Rewards with the active effects applied, one multiplier lookup per habit
+        effects = self._effects(c)
+        c.execute("SELECT id, xp_reward, gold_reward, category, difficulty FROM habits WHERE user_id = ?", (self.user_id,))
+        rewards = {row[0]: effects.apply(row[1], row[2], row[3], row[4]) for row in c.fetchall()}
+        pairs = sorted({(int(habit_id), str(date_str)) for habit_id, date_str in checkins if int(habit_id) in rewards},
+                       key=lambda pair: (pair[1], pair[0]))
+        summary = {'completed': 0, 'skipped': len(checkins) - len(pairs), 'xp': 0, 'gold': 0,
+                   'leveled_up': False, 'achievements': []}
+        
+        # Only the rows this upsert inserted or flipped earn rewards: a check-in committed
+        # by another session since the batch was built is left alone and skipped
+        new = set()
+        for start in range(0, len(pairs), CHECKIN_BATCH):
+            batch = pairs[start:start + CHECKIN_BATCH]
+            c.execute(f"""
+                INSERT INTO completions (user_id, habit_id, date, completed)
+                VALUES {', '.join(['(?, ?, ?, 1)'] * len(batch))}
+                ON CONFLICT(habit_id, date) DO UPDATE SET completed = 1 WHERE completions.completed = 0
+                RETURNING habit_id, date
+            """, [value for habit_id, date_str in batch for value in (self.user_id, habit_id, date_str)])
+            new.update((row[0], row[1]) for row in c.fetchall())
+        new = [pair for pair in pairs if pair in new]
+        summary['skipped'] += len(pairs) - len(new)
+        if not new:
+            return summary
+        self._invalidate_streaks(c, new)
+        
+        # One ledger entry per check-in (undo reverses them individually), running totals computed here
+        # from the tail, read under the stats row lock so concurrent writers can't append in between
+        self._lock_stats(c)
+        before = self._current_stats(c)
+        c.execute("""
+            SELECT xp_running, gold_earned_running, gold_spent_running FROM reward_ledger
+            WHERE user_id = ? ORDER BY id DESC LIMIT 1
+        """, (self.user_id,))
+        xp_running, earned_running, spent_running = c.fetchone() or (0, 0, 0)
+        today = self._today()
+        entries, per_day, dates_by_habit = [], {}, {}
+        for habit_id, date_str in new:
+            xp, gold = rewards[habit_id]
+            xp_running += xp
+            earned_running += gold
+            entries.append((self.user_id, 'habit', str(habit_id), xp, gold,
+                            xp_running, earned_running, spent_running, today, date_str))
+            day = per_day.setdefault(date_str, [0, 0, 0])
+            day[0] += 1
+            day[1] += xp
+            day[2] += gold
+            dates_by_habit.setdefault(habit_id, []).append(date_str)
+        c.executemany("""
+            INSERT INTO reward_ledger
+            (user_id, source, source_id, xp, gold, xp_running, gold_earned_running, gold_spent_running, day, ref_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, entries)
+        
+        self._bump_rollups(c, [(date_str, *totals) for date_str, totals in per_day.items()])
+        
+        bitmaps = self.get_habit_bitmaps(list(dates_by_habit))
+        for habit_id, dates in dates_by_habit.items():
+            for date_str in dates:
+                bitmaps[habit_id].set(date_str, True)
+        self._save_bitmaps(c, bitmaps)
+        
+        summary['completed'] = len(new)
+        summary['xp'] = sum(entry[3] for entry in entries)
+        summary['gold'] = sum(entry[4] for entry in entries)
+        new_level, _ = self._apply_xp(before['level'], before['current_xp'], summary['xp'])
+        if new_level > before['level']:
+            summary['leveled_up'] = True
+            c.execute("UPDATE user_stats SET last_level_up = CURRENT_TIMESTAMP WHERE id = ?", (self.user_id,))
+        
+        c.execute("SELECT MAX(id) FROM reward_ledger WHERE user_id = ?", (self.user_id,))
+        if c.fetchone()[0] - (before.get('ledger_id') or 0) >= self.LEDGER_CHECKPOINT_INTERVAL:
+            self._checkpoint_stats(c)
+        
+        if evaluate_achievements:
+            summary['achievements'] = [key for key in evaluate_achievements(self) if self._unlock_achievement(c, key)]
+        return summary
     
     def get_completions(self, habit_id: int, start_date: str = None, end_date: str = None) -> List[Dict]:
         c = self.get_connection().cursor()
-        query = "SELECT * FROM completions WHERE habit_id = ?"
-        params = [habit_id]
+        query = "SELECT * FROM completions WHERE habit_id = ? AND user_id = ?"
+        params = [habit_id, self.user_id]
         
         if start_date:
             query += " AND date >= ?"
@@ -349,12 +866,95 @@ class Database:
         c.execute(query, params)
         return [dict(row) for row in c.fetchall()]
     
+    # ===== COMPLETION BITMAPS =====
+    def _set_bitmap_day(self, c, habit_id: int, date_str: str, completed: bool):
+        """Flip one day in a habit's bitmap on an open cursor; the caller owns the commit"""
+        bitmap = self._load_bitmap(c, habit_id)
+        bitmap.set(date_str, completed)
+        self._save_bitmaps(c, {habit_id: bitmap})
+    
+    def _save_bitmaps(self, c, bitmaps: Dict[int, CompletionBitmap]):
+        c.executemany("""
+            INSERT INTO habit_bitmaps (habit_id, user_id, base_day, bits) VALUES (?, ?, ?, ?)
+            ON CONFLICT(habit_id) DO UPDATE SET base_day = excluded.base_day, bits = excluded.bits
+        """, [(habit_id, self.user_id, bitmap.base, bitmap.to_blob()) for habit_id, bitmap in bitmaps.items()])
+    
+    def _load_bitmap(self, c, habit_id: int) -> CompletionBitmap:
+        c.execute("SELECT base_day, bits FROM habit_bitmaps WHERE habit_id = ? AND user_id = ?", (habit_id, self.user_id))
+        row = c.fetchone()
+        return CompletionBitmap.from_blob(row[0], row[1]) if row else CompletionBitmap()
+    
+    def get_habit_bitmap(self, habit_id: int) -> CompletionBitmap:
+        return self._load_bitmap(self.get_connection().cursor(), habit_id)
+    
+    def get_habit_bitmaps(self, habit_ids: List[int] = None) -> Dict[int, CompletionBitmap]:
+        """Bitmaps keyed by habit id; habits with no completions get an empty bitmap"""
+        c = self.get_connection().cursor()
+        c.execute("SELECT habit_id, base_day, bits FROM habit_bitmaps WHERE user_id = ?", (self.user_id,))
+        bitmaps = {row[0]: CompletionBitmap.from_blob(row[1], row[2]) for row in c.fetchall()}
+        if habit_ids is None:
+            return bitmaps
+        return {habit_id: bitmaps.get(habit_id, CompletionBitmap()) for habit_id in habit_ids}
+    
+    def rebuild_habit_bitmaps(self):
+        """Re-encode every one of this user's habit bitmaps from the completions table"""
+        conn = self.get_connection()
+        c = conn.cursor()
+        
+        dates_by_habit = {}
+        c.execute("SELECT habit_id, date FROM completions WHERE user_id = ? AND completed = 1", (self.user_id,))
+        for habit_id, date_str in c.fetchall():
+            dates_by_habit.setdefault(habit_id, []).append(date_str)
+        
+        c.execute("DELETE FROM habit_bitmaps WHERE user_id = ?", (self.user_id,))
+        c.executemany(
+            "INSERT INTO habit_bitmaps (habit_id, user_id, base_day, bits) VALUES (?, ?, ?, ?)",
+            [(habit_id, self.user_id, bitmap.base, bitmap.to_blob())
+             for habit_id, bitmap in ((h, CompletionBitmap.from_dates(d)) for h, d in dates_by_habit.items())]
+        )
+        conn.commit()
+    
     def is_completed(self, habit_id: int, date_str: str) -> bool:
         c = self.get_connection().cursor()
-        c.execute("SELECT completed FROM completions WHERE habit_id = ? AND date = ?", (habit_id, date_str))
+        c.execute("SELECT completed FROM completions WHERE habit_id = ? AND date = ? AND user_id = ?",
+                  (habit_id, date_str, self.user_id))
         row = c.fetchone()
         return bool(row and row[0]) if row else False
     
+    def get_protected_days(self, habit_ids: List[int] = None) -> Dict[int, CompletionBitmap]:
+        """Days a streak shield covered (completed = 0 markers), as bitmaps keyed by habit id"""
+        c = self.get_connection().cursor()
+        query, params = "SELECT habit_id, date FROM completions WHERE user_id = ? AND completed = 0", [self.user_id]
+        if habit_ids is not None:
+            if not habit_ids:
+                return {}
+            query += f" AND habit_id IN ({', '.join('?' * len(habit_ids))})"
+            params += list(habit_ids)
+        c.execute(query, params)
+        dates_by_habit = {}
+        for habit_id, date_str in c.fetchall():
+            dates_by_habit.setdefault(habit_id, []).append(date_str)
+        if habit_ids is None:
+            habit_ids = list(dates_by_habit)
+        return {habit_id: CompletionBitmap.from_dates(dates_by_habit.get(habit_id, [])) for habit_id in habit_ids}
+    
+    def get_habit_streaks(self) -> Dict[int, Dict]:
+        """Streaks persisted by the daily rollover, keyed by habit id"""
+        c = self.get_connection().cursor()
+        c.execute("SELECT * FROM habit_streaks WHERE user_id = ?", (self.user_id,))
+        return {row['habit_id']: dict(row) for row in c.fetchall()}
+    
+    def _invalidate_streaks(self, c, checkins: List[tuple]):
+        """Drop persisted streaks a (habit_id, date) change lands inside; the rollover recomputes them"""
+        c.executemany("DELETE FROM habit_streaks WHERE habit_id = ? AND user_id = ? AND through >= ?",
+                      [(habit_id, self.user_id, str(date_str)) for habit_id, date_str in checkins])
+    
+    def get_rollover_state(self) -> Dict:
+        c = self.get_connection().cursor()
+        c.execute("SELECT * FROM rollover_state WHERE id = ?", (self.user_id,))
+        row = c.fetchone()
+        return dict(row) if row else {}
+    
     # ===== GOALS =====
     def create_goal(self, title: str, **kwargs) -> int:
         conn = self.get_connection()
@@ -373,23 +973,23 @@ class Database:
         if 'progressive_suggestions' in kwargs and isinstance(kwargs['progressive_suggestions'], list):
             kwargs['progressive_suggestions'] = json.dumps(kwargs['progressive_suggestions'])
         
-        fields = ['title'] + list(kwargs.keys())
-        values = [title] + list(kwargs.values())
+        fields = ['user_id', 'title'] + list(kwargs.keys())
+        values = [self.user_id, title] + list(kwargs.values())
         placeholders = ', '.join(['?'] * len(fields))
         
-        query = f"INSERT INTO goals ({', '.join(fields)}) VALUES ({placeholders})"
-        c.execute(query, values)
+        query = f"INSERT INTO goals ({', '.join(fields)}) VALUES ({placeholders}) RETURNING id"
+        new_id = c.execute(query, values).fetchone()[0]
         conn.commit()
-        return c.lastrowid
+        return new_id
     
-    def get_goals(self, completed=None) -> List[Dict]:
+    def get_goals(self, completed=None, after: Dict = None, limit: int = None) -> List[Dict]:
+        """Goals in display order; with limit, one page of them starting after the row `after`"""
         c = self.get_connection().cursor()
-        query = "SELECT * FROM goals"
+        query = "SELECT * FROM goals WHERE user_id = ?"
         if completed is not None:
-            query += f" WHERE completed = {1 if completed else 0}"
-        query += " ORDER BY priority DESC, deadline ASC"
+            query += f" AND completed = {1 if completed else 0}"
         
-        c.execute(query)
+        c.execute(*_page(query, [self.user_id], GOAL_ORDER, after, limit))
         goals = [dict(row) for row in c.fetchall()]
         
         for goal in goals:
@@ -402,6 +1002,14 @@ class Database:
         
         return goals
     
+    def count_goals(self, completed=None) -> int:
+        c = self.get_connection().cursor()
+        query = "SELECT COUNT(*) FROM goals WHERE user_id = ?"
+        if completed is not None:
+            query += f" AND completed = {1 if completed else 0}"
+        c.execute(query, (self.user_id,))
+        return c.fetchone()[0]
+    
     def update_goal(self, goal_id: int, **kwargs):
         conn = self.get_connection()
         c = conn.cursor()
@@ -412,13 +1020,14 @@ class Database:
         
         # If marking as complete
         if kwargs.get('completed') and not kwargs.get('completed_at'):
-            kwargs['completed_at'] = datetime.now().isoformat()
+            kwargs['completed_at'] = self.clock.now().isoformat()
             
-            c.execute("SELECT xp_reward, gold_reward, completed FROM goals WHERE id = ?", (goal_id,))
+            c.execute("SELECT xp_reward, gold_reward, completed, category, difficulty FROM goals WHERE id = ? AND user_id = ?",
+                      (goal_id, self.user_id))
             row = c.fetchone()
             if row and not row[2]:
-                self.add_xp(row[0])
-                self.add_gold(row[1])
+                xp, gold = self._effects(c).apply(row[0], row[1], row[3], row[4])
+                self._record_reward(c, 'goal', goal_id, xp, gold)
         
         fields = []
         values = []
@@ -426,20 +1035,20 @@ class Database:
             fields.append(f"{key} = ?")
             values.append(value)
         
-        values.append(goal_id)
-        query = f"UPDATE goals SET {', '.join(fields)} WHERE id = ?"
+        values += [goal_id, self.user_id]
+        query = f"UPDATE goals SET {', '.join(fields)} WHERE id = ? AND user_id = ?"
         c.execute(query, values)
         conn.commit()
     
     def delete_goal(self, goal_id: int):
         conn = self.get_connection()
         c = conn.cursor()
-        c.execute("DELETE FROM goals WHERE id = ?", (goal_id,))
+        c.execute("DELETE FROM goals WHERE id = ? AND user_id = ?", (goal_id, self.user_id))
         conn.commit()
     
     def get_goal_by_id(self, goal_id: int) -> Optional[Dict]:
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM goals WHERE id = ?", (goal_id,))
+        c.execute("SELECT * FROM goals WHERE id = ? AND user_id = ?", (goal_id, self.user_id))
         row = c.fetchone()
         if row:
             goal = dict(row)
@@ -453,110 +1062,476 @@ class Database:
         return None
     
     # ===== USER STATS (100 LEVELS!) =====
+    # user_stats is a checkpoint of reward_ledger: balances are the snapshot
+    # plus the ledger tail after ledger_id, folded back in every
+    # LEDGER_CHECKPOINT_INTERVAL entries.
+    LEDGER_CHECKPOINT_INTERVAL = 100
+    
     def get_stats(self) -> Dict:
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM user_stats WHERE id = 1")
+        return self._current_stats(c)
+    
+    def _current_stats(self, c) -> Dict:
+        c.execute("SELECT * FROM user_stats WHERE id = ?", (self.user_id,))
         row = c.fetchone()
-        return dict(row) if row else {}
+        if not row:
+            return {}
+        
+        stats = dict(row)
+        tail = self._ledger_tail(c, stats.get('ledger_id') or 0)
+        if tail:
+            xp, gold_earned, gold_spent = tail
+            stats['level'], stats['current_xp'] = self._apply_xp(stats['level'], stats['current_xp'], xp)
+            stats['total_xp'] += xp
+            stats['current_gold'] += gold_earned - gold_spent
+            stats['lifetime_gold'] += gold_earned
+        return stats
     
-    def add_xp(self, amount: int):
-        """Add XP and handle leveling up (UP TO LEVEL 100!)"""
-        conn = self.get_connection()
-        c = conn.cursor()
+    def _ledger_tail(self, c, after_id: int) -> Optional[tuple]:
+        """Net (xp, gold earned, gold spent) recorded after a ledger id, from running totals"""
+        c.execute("""
+            SELECT id, xp_running, gold_earned_running, gold_spent_running FROM reward_ledger
+            WHERE user_id = ? ORDER BY id DESC LIMIT 1
+        """, (self.user_id,))
+        last = c.fetchone()
+        if not last or last[0] <= after_id:
+            return None
+        
+        base = (0, 0, 0)
+        if after_id:
+            c.execute("SELECT xp_running, gold_earned_running, gold_spent_running FROM reward_ledger WHERE id = ?", (after_id,))
+            base = tuple(c.fetchone() or base)
+        return tuple(last[i + 1] - base[i] for i in range(3))
+    
+    @staticmethod
+    def _apply_xp(level: int, current_xp: int, amount: int) -> tuple:
+        """Level N requires N * 500 XP (up to level 100!); negative amounts de-level"""
+        current_xp += amount
+        while current_xp >= level * 500 and level < 100:
+            current_xp -= level * 500
+            level += 1
+        while current_xp < 0 and level > 1:
+            level -= 1
+            current_xp += level * 500
+        return level, max(current_xp, 0)
+    
+    def _record_reward(self, c, source: str, source_id, xp: int = 0, gold: int = 0, ref_date: str = None) -> bool:
+        """Append a ledger entry on an open cursor; the caller owns the commit.
         
-        c.execute("SELECT level, current_xp, total_xp FROM user_stats WHERE id = 1")
-        row = c.fetchone()
+        source is one of habit, goal, achievement, shop or manual. Returns True on level up.
+        The stats row is locked first, so the running totals extend the latest entry.
+        """
+        self._lock_stats(c)
+        today = self._today()
+        ref_date = str(ref_date) if ref_date else today
+        before = self._current_stats(c)
         
-        if row:
-            level, current_xp, total_xp = row
-            new_current = current_xp + amount
-            new_total = total_xp + amount
-            
-            # Level up logic: level N requires N * 500 XP (up to level 100!)
-            new_level = level
-            while new_current >= new_level * 500 and new_level < 100:
-                new_current -= new_level * 500
-                new_level += 1
-            
-            c.execute("""
-                UPDATE user_stats 
-                SET level = ?, current_xp = ?, total_xp = ?,
-                    last_level_up = CASE WHEN ? > ? THEN CURRENT_TIMESTAMP ELSE last_level_up END
-                WHERE id = 1
-            """, (new_level, new_current, new_total, new_level, level))
-            
-            conn.commit()
-            return new_level > level
+        c.execute("""
+            SELECT xp_running, gold_earned_running, gold_spent_running FROM reward_ledger
+            WHERE user_id = ? ORDER BY id DESC LIMIT 1
+        """, (self.user_id,))
+        xp_running, earned_running, spent_running = c.fetchone() or (0, 0, 0)
+        if source == 'shop':
+            spent_running -= gold
+        else:
+            earned_running += gold
         
-        return False
+        c.execute("""
+            INSERT INTO reward_ledger
+            (user_id, source, source_id, xp, gold, xp_running, gold_earned_running, gold_spent_running, day, ref_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, (self.user_id, source, str(source_id) if source_id is not None else None, xp, gold,
+              xp_running + xp, earned_running, spent_running, today, ref_date))
+        ledger_id = c.fetchone()[0]
+        
+        if source != 'shop':
+            self._bump_rollup(c, ref_date, xp=xp, gold=gold)
+        
+        new_level, _ = self._apply_xp(before['level'], before['current_xp'], xp)
+        leveled_up = new_level > before['level']
+        if leveled_up:
+            c.execute("UPDATE user_stats SET last_level_up = CURRENT_TIMESTAMP WHERE id = ?", (self.user_id,))
+        
+        if ledger_id - (before.get('ledger_id') or 0) >= self.LEDGER_CHECKPOINT_INTERVAL:
+            self._checkpoint_stats(c)
+        
+        return leveled_up
     
-    def add_gold(self, amount: int):
+    def _checkpoint_stats(self, c):
+        """Fold the ledger tail into the user_stats snapshot"""
+        stats = self._current_stats(c)
+        c.execute("SELECT MAX(id) FROM reward_ledger WHERE user_id = ?", (self.user_id,))
+        last_id = c.fetchone()[0] or 0
+        c.execute("""
+            UPDATE user_stats
+            SET level = ?, current_xp = ?, total_xp = ?, current_gold = ?, lifetime_gold = ?, ledger_id = ?
+            WHERE id = ?
+        """, (stats['level'], stats['current_xp'], stats['total_xp'],
+              stats['current_gold'], stats['lifetime_gold'], last_id, self.user_id))
+    
+    def checkpoint_stats(self):
+        conn = self.get_connection()
+        self._checkpoint_stats(conn.cursor())
+        conn.commit()
+    
+    def add_xp(self, amount: int, source: str = 'manual', source_id=None):
+        """Add XP and handle leveling up (UP TO LEVEL 100!)"""
+        conn = self.get_connection()
+        c = conn.cursor()
+        leveled_up = self._record_reward(c, source, source_id, xp=amount)
+        conn.commit()
+        return leveled_up
+    
+    def add_gold(self, amount: int, source: str = 'manual', source_id=None):
         """Add gold to player"""
         conn = self.get_connection()
         c = conn.cursor()
-        c.execute("""
-            UPDATE user_stats 
-            SET current_gold = current_gold + ?, lifetime_gold = lifetime_gold + ?
-            WHERE id = 1
-        """, (amount, amount))
+        self._record_reward(c, source, source_id, gold=amount)
+        conn.commit()
+    
+    def add_crystals(self, amount: int):
+        conn = self.get_connection()
+        c = conn.cursor()
+        c.execute("UPDATE user_stats SET crystals = crystals + ? WHERE id = ?", (amount, self.user_id))
         conn.commit()
     
-    def spend_gold(self, amount: int) -> bool:
-        """Spend gold if available"""
+    def spend_gold(self, amount: int, item_id: str = None) -> bool:
+        """Spend gold if available (balance check and debit in one write transaction)"""
         conn = self.get_connection()
         c = conn.cursor()
+        self.backend.begin(c)
+        try:
+            self._lock_stats(c)
+            if self._current_stats(c).get('current_gold', 0) < amount:
+                conn.rollback()
+                return False
+            self._record_reward(c, 'shop', item_id, gold=-amount)
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        return True
+    
+    def purchase(self, item_id: str, quantity: int = 1) -> Dict:
+        """Buy a shop item in one write transaction.
+        
+        Crystals are debited conditionally, then the level requirement, gold
+        balance and stack limit are checked, the stack is upserted and the gold
+        spend is appended to the ledger; any failed check rolls everything back.
+        reason is None on success, else unknown_item, crystals, level, gold or stack_full.
+        """
+        item = get_item_by_id(item_id)
+        price = (item or {}).get('price', {})
+        result = {'purchased': False, 'reason': None, 'item_id': item_id, 'quantity': quantity,
+                  'gold': price.get('gold', 0) * quantity, 'crystals': price.get('crystals', 0) * quantity}
+        if not item or quantity < 1:
+            result['reason'] = 'unknown_item'
+            return result
         
-        c.execute("SELECT current_gold FROM user_stats WHERE id = 1")
+        conn = self.get_connection()
+        c = conn.cursor()
+        self.backend.begin(c)
+        try:
+            result['reason'] = self._purchase(c, item, quantity, result['gold'], result['crystals'])
+            if result['reason']:
+                conn.rollback()
+            else:
+                conn.commit()
+                result['purchased'] = True
+        except:
+            conn.rollback()
+            raise
+        return result
+    
+    def _purchase(self, c, item: Dict, quantity: int, gold: int, crystals: int) -> Optional[str]:
+        # As the first write this also locks the stats row, so the gold check below can't interleave with another purchase
+        c.execute("UPDATE user_stats SET crystals = crystals - ? WHERE id = ? AND crystals >= ?",
+                  (crystals, self.user_id, crystals))
+        if c.rowcount != 1:
+            return 'crystals'
+        stats = self._current_stats(c)
+        if not meets_level_requirement(item, stats['level']):
+            return 'level'
+        if stats['current_gold'] < gold:
+            return 'gold'
+        if not self._add_to_inventory(c, item['id'], quantity):
+            return 'stack_full'
+        if gold:
+            self._record_reward(c, 'shop', item['id'], gold=-gold)
+        return None
+    
+    def _take_from_inventory(self, c, item_id: str) -> Optional[int]:
+        """Conditionally decrement a stack; returns what's left, or None if there was none"""
+        c.execute("""
+            UPDATE inventory SET quantity = quantity - 1
+            WHERE user_id = ? AND item_id = ? AND quantity > 0
+            RETURNING quantity
+        """, (self.user_id, item_id))
         row = c.fetchone()
+        if row is None:
+            return None
+        if row[0] == 0:
+            c.execute("DELETE FROM inventory WHERE user_id = ? AND item_id = ? AND quantity = 0", (self.user_id, item_id))
+        return row[0]
+    
+    def _lock_stats(self, c):
+        """Write-lock this user's stats row (SQLite's BEGIN IMMEDIATE already holds the database lock)"""
+        c.execute("UPDATE user_stats SET crystals = crystals WHERE id = ?", (self.user_id,))
+    
+    def get_reward_totals(self, start_date: str = None, end_date: str = None) -> Dict:
+        """XP and gold earned/spent between two days (inclusive), from two index lookups"""
+        c = self.get_connection().cursor()
         
-        if row and row[0] >= amount:
-            c.execute("UPDATE user_stats SET current_gold = current_gold - ? WHERE id = 1", (amount,))
-            conn.commit()
-            return True
-        return False
+        def running_through(day):
+            if day is None:
+                c.execute("""
+                    SELECT xp_running, gold_earned_running, gold_spent_running FROM reward_ledger
+                    WHERE user_id = ? ORDER BY id DESC LIMIT 1
+                """, (self.user_id,))
+            else:
+                c.execute("""
+                    SELECT xp_running, gold_earned_running, gold_spent_running FROM reward_ledger
+                    WHERE user_id = ? AND day <= ? ORDER BY day DESC, id DESC LIMIT 1
+                """, (self.user_id, str(day)))
+            return tuple(c.fetchone() or (0, 0, 0))
+        
+        end = running_through(end_date)
+        start = (0, 0, 0)
+        if start_date:
+            c.execute("""
+                SELECT xp_running, gold_earned_running, gold_spent_running FROM reward_ledger
+                WHERE user_id = ? AND day < ? ORDER BY day DESC, id DESC LIMIT 1
+            """, (self.user_id, str(start_date)))
+            start = tuple(c.fetchone() or start)
+        
+        return {
+            'xp_earned': end[0] - start[0],
+            'gold_earned': end[1] - start[1],
+            'gold_spent': end[2] - start[2],
+        }
+    
+    def get_ledger(self, start_date: str = None, end_date: str = None, source: str = None) -> List[Dict]:
+        c = self.get_connection().cursor()
+        query = "SELECT * FROM reward_ledger WHERE user_id = ?"
+        params = [self.user_id]
+        
+        if start_date:
+            query += " AND day >= ?"
+            params.append(str(start_date))
+        if end_date:
+            query += " AND day <= ?"
+            params.append(str(end_date))
+        if source:
+            query += " AND source = ?"
+            params.append(source)
+        
+        query += " ORDER BY id DESC"
+        
+        c.execute(query, params)
+        return [dict(row) for row in c.fetchall()]
     
     def update_stat(self, stat_name: str, amount: int):
         """Update a specific stat"""
         conn = self.get_connection()
-        c = conn.cursor()
+        self._update_stat(conn.cursor(), stat_name, amount)
+        conn.commit()
+    
+    def _update_stat(self, c, stat_name: str, amount: int):
         c.execute(f"""
             UPDATE user_stats 
             SET {stat_name} = {stat_name} + ?
-            WHERE id = 1
-        """, (amount,))
+            WHERE id = ?
+        """, (amount, self.user_id))
+        self.get_connection().after_commit(self.reset_stat_sheet)
+    
+    # ===== EFFECTIVE STATS =====
+    def get_effective_stats(self) -> Dict[str, int]:
+        """Base stats plus equipped gear, unlocked achievements and running stat boosts"""
+        conn = self.get_connection()
+        c = conn.cursor()
+        boost = self._effects(c).stat_bonus
+        stats = self._stat_sheet(c).effective(boost)
         conn.commit()
+        return stats
+    
+    def reset_stat_sheet(self):
+        """Forget the summed stats (base stats or unlocks changed); the next read reloads them.
+        
+        Writers on an open transaction queue it with after_commit, so a rollback keeps the sheet.
+        """
+        self.stat_sheets.pop(self.user_id, None)
+    
+    def _stat_sheet(self, c) -> StatSheet:
+        sheet = self.stat_sheets.get(self.user_id)
+        if sheet is None:
+            c.execute(f"SELECT {', '.join(STAT_NAMES)} FROM user_stats WHERE id = ?", (self.user_id,))
+            row = c.fetchone()
+            base = dict(zip(STAT_NAMES, row)) if row else {}
+            c.execute(f"SELECT {', '.join(slot + '_id' for slot in EQUIPMENT_SLOTS)} FROM equipment WHERE id = ?",
+                      (self.user_id,))
+            row = c.fetchone()
+            gear = dict(zip(EQUIPMENT_SLOTS, row)) if row else {}
+            c.execute("""
+                SELECT a.stat_bonus FROM achievement_unlocks u
+                JOIN achievements a ON a.key = u.key
+                WHERE u.user_id = ? AND a.stat_bonus IS NOT NULL
+            """, (self.user_id,))
+            bonuses = [bonus for bonus in (parse_stat_bonus(row[0]) for row in c.fetchall()) if bonus]
+            sheet = self.stat_sheets.setdefault(self.user_id, StatSheet(base, gear, bonuses))
+        return sheet
     
     # ===== INVENTORY & SHOP =====
-    def add_to_inventory(self, item_id: str, quantity: int = 1):
+    def add_to_inventory(self, item_id: str, quantity: int = 1) -> bool:
+        """Add to the item's stack; False (nothing added) if that would pass its max_stack"""
         conn = self.get_connection()
         c = conn.cursor()
+        added = self._add_to_inventory(c, item_id, quantity)
+        conn.commit()
+        return added
+    
+    def _add_to_inventory(self, c, item_id: str, quantity: int = 1) -> bool:
+        limit = stack_limit(get_item_by_id(item_id))
+        if limit is not None and quantity > limit:
+            return False
+        # One statement: concurrent adds can't both insert, and the limit is checked against the stored quantity
+        query = """
+            INSERT INTO inventory (user_id, item_id, quantity) VALUES (?, ?, ?)
+            ON CONFLICT(user_id, item_id) DO UPDATE SET quantity = inventory.quantity + excluded.quantity
+        """
+        params = [self.user_id, item_id, quantity]
+        if limit is not None:
+            query += " WHERE inventory.quantity + excluded.quantity <= ?"
+            params.append(limit)
+        c.execute(query, params)
+        return c.rowcount == 1
+    
+    def use_item(self, item_id: str, target=None) -> Optional[Dict]:
+        """Consume one of an item and apply its effect in one transaction.
         
-        c.execute("SELECT id, quantity FROM inventory WHERE item_id = ?", (item_id,))
-        row = c.fetchone()
-        
-        if row:
-            c.execute("UPDATE inventory SET quantity = quantity + ? WHERE item_id = ?", (quantity, item_id))
-        else:
-            c.execute("INSERT INTO inventory (item_id, quantity) VALUES (?, ?)", (item_id, quantity))
+        target is the stat for stat_boost_perm and the habit id for
+        instant_complete_habit. Returns {'item_id', 'remaining', 'effect_id'},
+        or None if none are left or the item can't be used that way.
+        """
+        effect = (get_item_by_id(item_id) or {}).get('effect') or {}
+        effect_type = effect.get('type')
+        if (effect_type not in USABLE_EFFECTS or (effect_type == 'stat_boost_perm' and target not in STAT_NAMES)
+                or (effect_type == 'instant_complete_habit' and target is None)):
+            return None
         
-        conn.commit()
+        conn = self.get_connection()
+        c = conn.cursor()
+        self.backend.begin(c)
+        try:
+            remaining = self._take_from_inventory(c, item_id)
+            used = remaining is not None
+            if used and effect_type == 'instant_complete_habit':
+                used = self._check_in(c, int(target), self._today()) is not None
+            if not used:
+                conn.rollback()
+                return None
+            
+            effect_id = None
+            if effect.get('duration'):
+                effect_id = self._add_effect(c, effect_type, effect['value'], effect['duration'], item_id)
+            elif effect_type == 'stat_boost_perm':
+                self._update_stat(c, target, effect['value'])
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        return {'item_id': item_id, 'remaining': remaining, 'effect_id': effect_id}
     
     def get_inventory(self) -> List[Dict]:
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM inventory ORDER BY purchased_at DESC")
+        c.execute("SELECT * FROM inventory WHERE user_id = ? ORDER BY purchased_at DESC", (self.user_id,))
         return [dict(row) for row in c.fetchall()]
     
     def get_equipped_items(self) -> Dict:
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM equipment WHERE id = 1")
+        c.execute("SELECT * FROM equipment WHERE id = ?", (self.user_id,))
         row = c.fetchone()
         return dict(row) if row else {}
     
     def equip_item(self, item_id: str, slot: str):
         conn = self.get_connection()
         c = conn.cursor()
-        c.execute(f"UPDATE equipment SET {slot}_id = ? WHERE id = 1", (item_id,))
+        c.execute(f"UPDATE equipment SET {slot}_id = ? WHERE id = ?", (item_id, self.user_id))
         conn.commit()
+        self.reset_effects()
+        sheet = self.stat_sheets.get(self.user_id)
+        if sheet is not None:
+            sheet.equip(slot, item_id)
+    
+    # ===== ACTIVE EFFECTS =====
+    def add_effect(self, effect_type: str, value: float, duration: int, item_id: str = None) -> int:
+        """Start a timed effect lasting duration seconds"""
+        conn = self.get_connection()
+        c = conn.cursor()
+        effect_id = self._add_effect(c, effect_type, value, duration, item_id)
+        conn.commit()
+        return effect_id
+    
+    def _add_effect(self, c, effect_type: str, value: float, duration: int, item_id: str = None) -> int:
+        expires_at = to_stored(self.clock.now() + timedelta(seconds=duration))
+        c.execute("""
+            INSERT INTO active_effects (user_id, effect_type, value, expires_at, item_id)
+            VALUES (?, ?, ?, ?, ?) RETURNING id
+        """, (self.user_id, effect_type, value, expires_at, item_id))
+        effect_id = c.fetchone()[0]
+        
+        def add_to_engine():
+            engine = self.effects.get(self.user_id)
+            if engine is not None:
+                with self._cache_lock:
+                    engine.add({'id': effect_id, 'effect_type': effect_type, 'value': value,
+                                'expires_at': expires_at, 'item_id': item_id})
+        self.get_connection().after_commit(add_to_engine)
+        return effect_id
+    
+    def get_active_effects(self) -> List[Dict]:
+        """Timed effects still running, soonest to expire first"""
+        conn = self.get_connection()
+        effects = self._effects(conn.cursor()).active()
+        conn.commit()
+        return effects
+    
+    def get_effects(self) -> EffectsEngine:
+        """The loaded effects engine, for multipliers and stat bonuses"""
+        conn = self.get_connection()
+        engine = self._effects(conn.cursor())
+        conn.commit()
+        return engine
+    
+    def reset_effects(self):
+        """Forget the loaded effects (gear changed, or rows were written behind the engine's back)"""
+        self.effects.pop(self.user_id, None)
+    
+    def _effects(self, c) -> EffectsEngine:
+        """This user's effects, loaded on first use; expired rows are deleted in one sweep when the earliest runs out"""
+        now = self.clock.now()
+        engine = self.effects.get(self.user_id)
+        if engine is None:
+            self._sweep_effects(c, now)
+            c.execute("SELECT id, effect_type, value, expires_at, item_id FROM active_effects WHERE user_id = ?",
+                      (self.user_id,))
+            engine = self.effects.setdefault(self.user_id, EffectsEngine([dict(row) for row in c.fetchall()],
+                                                                         self._equipped_effects(c)))
+        elif engine.is_stale(now):
+            with self._cache_lock:
+                engine.expire(now)
+            self._sweep_effects(c, now)
+        return engine
+    
+    def _sweep_effects(self, c, now: datetime):
+        c.execute("DELETE FROM active_effects WHERE user_id = ? AND expires_at <= ?", (self.user_id, to_stored(now)))
+    
+    def _equipped_effects(self, c) -> List[Dict]:
+        c.execute(f"SELECT {', '.join(slot + '_id' for slot in EQUIPMENT_SLOTS)} FROM equipment WHERE id = ?",
+                  (self.user_id,))
+        row = c.fetchone()
+        items = [get_item_by_id(item_id) for item_id in (row or []) if item_id]
+        return [item['effect'] for item in items if item and item.get('effect')]
     
     # ===== NOTES =====
     def create_note(self, title: str, content: str = "", **kwargs) -> int:
@@ -566,18 +1541,20 @@ class Database:
         if 'tags' in kwargs and isinstance(kwargs['tags'], list):
             kwargs['tags'] = json.dumps(kwargs['tags'])
         
-        fields = ['title', 'content'] + list(kwargs.keys())
-        values = [title, content] + list(kwargs.values())
+        fields = ['user_id', 'title', 'content'] + list(kwargs.keys())
+        values = [self.user_id, title, content] + list(kwargs.values())
         placeholders = ', '.join(['?'] * len(fields))
         
-        query = f"INSERT INTO notes ({', '.join(fields)}) VALUES ({placeholders})"
-        c.execute(query, values)
+        query = f"INSERT INTO notes ({', '.join(fields)}) VALUES ({placeholders}) RETURNING id"
+        new_id = c.execute(query, values).fetchone()[0]
         conn.commit()
-        return c.lastrowid
+        return new_id
     
-    def get_notes(self) -> List[Dict]:
+    def get_notes(self, search: str = None, category: str = None, after: Dict = None, limit: int = None) -> List[Dict]:
+        """Notes, pinned then most recently updated; with limit, one page of them starting after the row `after`"""
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM notes ORDER BY pinned DESC, updated_at DESC")
+        query, params = self._note_filter(search, category)
+        c.execute(*_page(f"SELECT * FROM notes WHERE {query}", params, NOTE_ORDER, after, limit))
         notes = [dict(row) for row in c.fetchall()]
         
         for note in notes:
@@ -589,6 +1566,23 @@ class Database:
         
         return notes
     
+    def count_notes(self, search: str = None, category: str = None) -> int:
+        c = self.get_connection().cursor()
+        query, params = self._note_filter(search, category)
+        c.execute(f"SELECT COUNT(*) FROM notes WHERE {query}", params)
+        return c.fetchone()[0]
+    
+    def _note_filter(self, search: str = None, category: str = None) -> tuple:
+        """WHERE clause and params for this user's notes, matching search in the title or text"""
+        query, params = "user_id = ?", [self.user_id]
+        if search:
+            query += " AND (LOWER(title) LIKE ? OR LOWER(content) LIKE ?)"
+            params += [f"%{search.lower()}%"] * 2
+        if category:
+            query += " AND category = ?"
+            params.append(category)
+        return query, params
+    
     def update_note(self, note_id: int, **kwargs):
         conn = self.get_connection()
         c = conn.cursor()
@@ -596,7 +1590,7 @@ class Database:
         if 'tags' in kwargs and isinstance(kwargs['tags'], list):
             kwargs['tags'] = json.dumps(kwargs['tags'])
         
-        kwargs['updated_at'] = datetime.now().isoformat()
+        kwargs['updated_at'] = to_stored(self.clock.now())
         
         fields = []
         values = []
@@ -604,26 +1598,32 @@ class Database:
             fields.append(f"{key} = ?")
             values.append(value)
         
-        values.append(note_id)
-        query = f"UPDATE notes SET {', '.join(fields)} WHERE id = ?"
+        values += [note_id, self.user_id]
+        query = f"UPDATE notes SET {', '.join(fields)} WHERE id = ? AND user_id = ?"
         c.execute(query, values)
         conn.commit()
     
     def delete_note(self, note_id: int):
         conn = self.get_connection()
         c = conn.cursor()
-        c.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+        c.execute("DELETE FROM notes WHERE id = ? AND user_id = ?", (note_id, self.user_id))
         conn.commit()
     
     # ===== ACHIEVEMENTS =====
-    def get_achievements(self, unlocked_only=False) -> List[Dict]:
+    def get_achievements(self, unlocked_only=False, after: Dict = None, limit: int = None) -> List[Dict]:
+        """Unlocked achievements (newest first), then locked ones; with limit, one page starting after the row `after`"""
         c = self.get_connection().cursor()
-        query = "SELECT * FROM achievements"
+        query = """
+            SELECT a.id, a.key, a.title, a.description, a.icon, a.category, a.tier,
+                   a.xp_reward, a.gold_reward, a.stat_bonus, a.special_power, u.unlocked_at
+            FROM achievements a
+            LEFT JOIN achievement_unlocks u ON u.key = a.key AND u.user_id = ?
+            WHERE 1 = 1
+        """
         if unlocked_only:
-            query += " WHERE unlocked_at IS NOT NULL"
-        query += " ORDER BY unlocked_at DESC NULLS LAST, tier, category"
+            query += " AND u.unlocked_at IS NOT NULL"
         
-        c.execute(query)
+        c.execute(*_page(query, [self.user_id], ACHIEVEMENT_ORDER, after, limit))
         achievements = [dict(row) for row in c.fetchall()]
         
         for ach in achievements:
@@ -635,40 +1635,197 @@ class Database:
         
         return achievements
     
+    def get_achievement_progress(self) -> Dict:
+        """{'unlocked': n, 'total': n} without loading the catalog"""
+        c = self.get_connection().cursor()
+        c.execute("""
+            SELECT COUNT(u.key), COUNT(*) FROM achievements a
+            LEFT JOIN achievement_unlocks u ON u.key = a.key AND u.user_id = ?
+        """, (self.user_id,))
+        unlocked, total = c.fetchone()
+        return {'unlocked': unlocked, 'total': total}
+    
     def unlock_achievement(self, key: str):
         conn = self.get_connection()
-        c = conn.cursor()
-        
-        c.execute("SELECT unlocked_at, xp_reward, gold_reward, stat_bonus FROM achievements WHERE key = ?", (key,))
+        unlocked = self._unlock_achievement(conn.cursor(), key)
+        conn.commit()
+        return unlocked
+    
+    def _unlock_achievement(self, c, key: str) -> bool:
+        """Unlock and reward an achievement on an open cursor; False if unknown or already unlocked"""
+        c.execute("SELECT xp_reward, gold_reward, stat_bonus FROM achievements WHERE key = ?", (key,))
         row = c.fetchone()
+        if not row:
+            return False
         
-        if row and not row[0]:
-            c.execute("UPDATE achievements SET unlocked_at = CURRENT_TIMESTAMP WHERE key = ?", (key,))
-            
-            if row[1]:
-                self.add_xp(row[1])
+        c.execute("""
+            INSERT INTO achievement_unlocks (user_id, key) VALUES (?, ?)
+            ON CONFLICT(user_id, key) DO NOTHING
+        """, (self.user_id, key))
+        
+        unlocked = c.rowcount == 1
+        if unlocked:
+            if row[0] or row[1]:
+                self._record_reward(c, 'achievement', key, row[0] or 0, row[1] or 0)
             
+            # Stat bonuses stay out of user_stats; effective stats add them on read
             if row[2]:
-                self.add_gold(row[2])
-            
-            if row[3]:
-                try:
-                    bonus = json.loads(row[3])
-                    self.update_stat(bonus['stat'], bonus['amount'])
-                except:
-                    pass
-            
-            conn.commit()
-            return True
-        return False
+                self.get_connection().after_commit(self.reset_stat_sheet)
+        return unlocked
+    
+    # ===== DAILY ROLLUPS =====
+    def _today(self) -> str:
+        return self.clock.today_str()
+    
+    def _bump_rollup(self, c, date_str: str, completions: int = 0, xp: int = 0, gold: int = 0):
+        """Apply deltas to one day's rollup on an open cursor; the caller owns the commit"""
+        self._bump_rollups(c, [(str(date_str), completions, xp, gold)])
+    
+    def _bump_rollups(self, c, deltas: List[tuple]):
+        """Apply (date, completions, xp, gold) deltas to several days' rollups on an open cursor"""
+        c.executemany("""
+            INSERT INTO daily_rollups (user_id, date, completions, xp_earned, gold_earned, habits_completed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, date) DO UPDATE SET
+                completions = daily_rollups.completions + excluded.completions,
+                xp_earned = daily_rollups.xp_earned + excluded.xp_earned,
+                gold_earned = daily_rollups.gold_earned + excluded.gold_earned,
+                habits_completed = daily_rollups.habits_completed + excluded.habits_completed
+        """, [(self.user_id, date_str, completions, xp, gold, completions) for date_str, completions, xp, gold in deltas])
+        
+        self._update_perfect_days(c, [date_str for date_str, completions, _, _ in deltas if completions])
+    
+    def _update_perfect_days(self, c, dates: List[str]):
+        """Re-evaluate perfect_day for some of this user's rollups.
+        
+        A day is perfect when something was checked in and every active habit
+        scheduled on that weekday (and created by then) was done.
+        """
+        dates = sorted({str(date_str) for date_str in dates})
+        if not dates:
+            return
+        
+        c.execute("SELECT id, substr(created_at, 1, 10), frequency, frequency_days FROM habits WHERE user_id = ? AND active = 1",
+                  (self.user_id,))
+        habits = []
+        for habit_id, created, frequency, frequency_days in c.fetchall():
+            try:
+                frequency_days = json.loads(frequency_days) if frequency_days else []
+            except:
+                frequency_days = []
+            habits.append((habit_id, created, weekday_mask(frequency or 'daily', frequency_days)))
+        
+        c.execute("SELECT habit_id, date FROM completions WHERE user_id = ? AND completed = 1 AND date BETWEEN ? AND ?",
+                  (self.user_id, dates[0], dates[-1]))
+        done = {(row[0], row[1]) for row in c.fetchall()}
+        
+        perfect = []
+        for date_str in dates:
+            weekday = date.fromisoformat(date_str).weekday()
+            scheduled = [habit_id for habit_id, created, mask in habits if created <= date_str and mask >> weekday & 1]
+            perfect.append((int(all((habit_id, date_str) in done for habit_id in scheduled)), self.user_id, date_str))
+        c.executemany("""
+            UPDATE daily_rollups SET perfect_day = CASE WHEN habits_completed > 0 AND ? = 1 THEN 1 ELSE 0 END
+            WHERE user_id = ? AND date = ?
+        """, perfect)
+    
+    def rebuild_daily_rollups(self):
+        """Recompute this user's daily rollups from completions and the reward ledger"""
+        conn = self.get_connection()
+        c = conn.cursor()
+        
+        c.execute("DELETE FROM daily_rollups WHERE user_id = ?", (self.user_id,))
+        
+        c.execute("""
+            INSERT INTO daily_rollups (user_id, date, completions, habits_completed)
+            SELECT user_id, date, COUNT(*), COUNT(DISTINCT habit_id)
+            FROM completions
+            WHERE user_id = ? AND completed = 1
+            GROUP BY user_id, date
+        """, (self.user_id,))
+        
+        # Exact rewards from the ledger, by the day they refer to
+        c.execute("""
+            SELECT ref_date, SUM(xp), SUM(gold) FROM reward_ledger
+            WHERE user_id = ? AND source != 'shop'
+            GROUP BY ref_date
+        """, (self.user_id,))
+        rewards = c.fetchall()
+        
+        # Rewards granted before the ledger existed are estimated from current values
+        rewards += c.execute("""
+            SELECT c.date, SUM(h.xp_reward), SUM(h.gold_reward)
+            FROM completions c
+            JOIN habits h ON h.id = c.habit_id
+            WHERE c.user_id = ? AND c.completed = 1 AND NOT EXISTS (
+                SELECT 1 FROM reward_ledger l
+                WHERE l.user_id = c.user_id AND l.source = 'habit'
+                  AND l.source_id = CAST(c.habit_id AS TEXT) AND l.ref_date = c.date
+            )
+            GROUP BY c.date
+        """, (self.user_id,)).fetchall()
+        # completed_at is stored in local time; unlocked_at is SQLite's UTC CURRENT_TIMESTAMP
+        rewards += c.execute("""
+            SELECT substr(completed_at, 1, 10), xp_reward, gold_reward FROM goals g
+            WHERE user_id = ? AND completed = 1 AND completed_at IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM reward_ledger l
+                WHERE l.user_id = g.user_id AND l.source = 'goal' AND l.source_id = CAST(g.id AS TEXT)
+            )
+        """, (self.user_id,)).fetchall()
+        rewards += [(str(self.clock.local_date(row[0])), row[1], row[2]) for row in c.execute("""
+            SELECT u.unlocked_at, a.xp_reward, a.gold_reward
+            FROM achievement_unlocks u
+            JOIN achievements a ON a.key = u.key
+            WHERE u.user_id = ? AND NOT EXISTS (
+                SELECT 1 FROM reward_ledger l
+                WHERE l.user_id = u.user_id AND l.source = 'achievement' AND l.source_id = u.key
+            )
+        """, (self.user_id,)).fetchall()]
+        
+        for day, xp, gold in rewards:
+            if day:
+                self._bump_rollup(c, day, xp=xp or 0, gold=gold or 0)
+        
+        c.execute("SELECT date FROM daily_rollups WHERE user_id = ?", (self.user_id,))
+        self._update_perfect_days(c, [row[0] for row in c.fetchall()])
+        
+        conn.commit()
+    
+    def get_daily_rollups(self, start_date: str = None, end_date: str = None) -> List[Dict]:
+        c = self.get_connection().cursor()
+        query = "SELECT * FROM daily_rollups WHERE user_id = ?"
+        params = [self.user_id]
+        
+        if start_date:
+            query += " AND date >= ?"
+            params.append(str(start_date))
+        if end_date:
+            query += " AND date <= ?"
+            params.append(str(end_date))
+        
+        query += " ORDER BY date ASC"
+        
+        c.execute(query, params)
+        return [dict(row) for row in c.fetchall()]
+    
+    def get_rollup_totals(self, start_date: str = None, end_date: str = None) -> Dict:
+        """Sum rollups over a period (at most one row per day)"""
+        rollups = self.get_daily_rollups(start_date, end_date)
+        return {
+            'completions': sum(r['completions'] for r in rollups),
+            'xp_earned': sum(r['xp_earned'] for r in rollups),
+            'gold_earned': sum(r['gold_earned'] for r in rollups),
+            'active_days': sum(1 for r in rollups if r['completions'] > 0),
+            'perfect_days': sum(1 for r in rollups if r['perfect_day']),
+        }
     
     # ===== DAILY MOTIVATION =====
     def get_daily_motivation(self, date_str: str = None) -> Optional[Dict]:
         if date_str is None:
-            date_str = datetime.now(self.cst).strftime('%Y-%m-%d')
+            date_str = self._today()
         
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM motivations WHERE date = ?", (date_str,))
+        c.execute("SELECT * FROM motivations WHERE user_id = ? AND date = ?", (self.user_id, date_str))
         row = c.fetchone()
         return dict(row) if row else None
     
@@ -676,35 +1833,180 @@ class Database:
         conn = self.get_connection()
         c = conn.cursor()
         c.execute("""
-            INSERT OR REPLACE INTO motivations (date, quote, philosophy, tradition, habit_context)
-            VALUES (?, ?, ?, ?, ?)
-        """, (date_str, quote, philosophy, tradition, habit_context))
+            INSERT INTO motivations (user_id, date, quote, philosophy, tradition, habit_context)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, date) DO UPDATE SET
+                quote = excluded.quote, philosophy = excluded.philosophy,
+                tradition = excluded.tradition, habit_context = excluded.habit_context
+        """, (self.user_id, date_str, quote, philosophy, tradition, habit_context))
         conn.commit()
     
     # ===== PHILOSOPHY LIBRARY =====
-    def upload_document(self, filename: str, content: str, file_type: str, file_size: int) -> int:
+    # Documents uploaded with a file hash keep their text in document_blobs,
+    # older documents on their own row. Either way it is stored compressed and
+    # only decompressed when get_document_content asks for it.
+    DOCUMENT_COLUMNS = """pd.id, pd.user_id, pd.filename, pd.file_type, pd.file_size, pd.ai_summary,
+        pd.key_concepts, pd.uploaded_at, pd.content_sha256"""
+    DOCUMENT_TEXT = """COALESCE(pd.content, b.content) AS content,
+        COALESCE(pd.content_compressed, b.content_compressed) AS content_compressed"""
+    DOCUMENT_JOIN = "philosophy_documents pd LEFT JOIN document_blobs b ON b.sha256 = pd.content_sha256"
+    
+    def upload_document(self, filename: str, content: str, file_type: str, file_size: int,
+                        content_sha256: str = None) -> int:
+        """Add a document; with content_sha256 (of the uploaded bytes) its text goes to the shared store"""
         conn = self.get_connection()
         c = conn.cursor()
+        
+        compressed = text_codec.compress(content)
+        if content_sha256:
+            signature = minhash.signature(content)
+            c.execute("""
+                INSERT INTO document_blobs (sha256, content_compressed, file_size, minhash) VALUES (?, ?, ?, ?)
+                ON CONFLICT(sha256) DO NOTHING
+            """, (content_sha256, compressed, file_size, minhash.to_blob(signature) if content.strip() else None))
+            compressed = None
+        
         c.execute("""
-            INSERT INTO philosophy_documents (filename, content, file_type, file_size)
-            VALUES (?, ?, ?, ?)
-        """, (filename, content, file_type, file_size))
+            INSERT INTO philosophy_documents (user_id, filename, content_compressed, file_type, file_size, content_sha256)
+            VALUES (?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, (self.user_id, filename, compressed, file_type, file_size, content_sha256))
+        doc_id = c.fetchone()[0]
         conn.commit()
-        return c.lastrowid
+        return doc_id
     
-    def get_documents(self) -> List[Dict]:
+    def find_document_blob(self, content_sha256: str) -> Optional[Dict]:
+        """Stored extraction and cached analysis for a file hash, from anyone's upload"""
         c = self.get_connection().cursor()
-        c.execute("SELECT * FROM philosophy_documents ORDER BY uploaded_at DESC")
-        docs = [dict(row) for row in c.fetchall()]
+        c.execute("SELECT sha256, file_size, ai_summary, key_concepts FROM document_blobs WHERE sha256 = ?", (content_sha256,))
+        row = c.fetchone()
+        return dict(row) if row else None
+    
+    def get_document_by_hash(self, content_sha256: str) -> Optional[Dict]:
+        """This user's document with the given file hash"""
+        c = self.get_connection().cursor()
+        c.execute(f"SELECT {self.DOCUMENT_COLUMNS} FROM {self.DOCUMENT_JOIN} WHERE pd.user_id = ? AND pd.content_sha256 = ?",
+                  (self.user_id, content_sha256))
+        row = c.fetchone()
+        return self._document(row) if row else None
+    
+    def link_document(self, filename: str, content_sha256: str, file_type: str = 'pdf') -> Optional[int]:
+        """Add a document for a file that is already stored, reusing its extraction, analysis and segments.
         
-        for doc in docs:
-            if doc.get('key_concepts'):
-                try:
-                    doc['key_concepts'] = json.loads(doc['key_concepts']) if isinstance(doc['key_concepts'], str) else []
-                except:
-                    doc['key_concepts'] = []
+        Returns the existing id if this user already has the file, or None if the store doesn't.
+        """
+        existing = self.get_document_by_hash(content_sha256)
+        if existing:
+            return existing['id']
+        blob = self.find_document_blob(content_sha256)
+        if not blob:
+            return None
+        
+        conn = self.get_connection()
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO philosophy_documents (user_id, filename, file_type, file_size, ai_summary, key_concepts, content_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, (self.user_id, filename, file_type, blob['file_size'], blob['ai_summary'], blob['key_concepts'] or '[]',
+              content_sha256))
+        doc_id = c.fetchone()[0]
+        
+        if 'document_segments' in self.backend.tables(c):
+            c.execute("""
+                SELECT MIN(ds.document_id) FROM document_segments ds
+                JOIN philosophy_documents pd ON ds.document_id = pd.id
+                WHERE pd.content_sha256 = ?
+            """, (content_sha256,))
+            source_id = c.fetchone()[0]
+            if source_id:
+                c.execute("""
+                    INSERT INTO document_segments
+                    (document_id, segment_type, segment_number, title, content, content_compressed, dictionary_id,
+                     page_number, word_count, key_terms)
+                    SELECT ?, segment_type, segment_number, title, content, content_compressed, dictionary_id,
+                        page_number, word_count, key_terms
+                    FROM document_segments WHERE document_id = ?
+                """, (doc_id, source_id))
         
-        return docs
+        conn.commit()
+        return doc_id
+    
+    def find_similar_documents(self, doc_id: int, threshold: float = 0.8) -> List[Dict]:
+        """This user's other documents whose MinHash similarity to doc_id is at least threshold"""
+        c = self.get_connection().cursor()
+        c.execute("""
+            SELECT pd.id, pd.filename, pd.content_sha256, b.minhash FROM philosophy_documents pd
+            JOIN document_blobs b ON b.sha256 = pd.content_sha256
+            WHERE pd.user_id = ? AND b.minhash IS NOT NULL
+        """, (self.user_id,))
+        rows = c.fetchall()
+        target = next((row for row in rows if row[0] == doc_id), None)
+        if target is None:
+            return []
+        
+        signature = minhash.from_blob(target[3])
+        similar = []
+        for row in rows:
+            if row[2] == target[2]:
+                continue
+            score = minhash.similarity(signature, minhash.from_blob(row[3]))
+            if score >= threshold:
+                similar.append({'id': row[0], 'filename': row[1], 'similarity': score})
+        return sorted(similar, key=lambda doc: -doc['similarity'])
+    
+    def _document(self, row) -> Dict:
+        doc = dict(row)
+        if doc.get('key_concepts'):
+            try:
+                doc['key_concepts'] = json.loads(doc['key_concepts']) if isinstance(doc['key_concepts'], str) else []
+            except:
+                doc['key_concepts'] = []
+        return doc
+    
+    def get_documents(self, search: str = None, after: Dict = None, limit: int = None) -> List[Dict]:
+        """This user's documents, newest first, without their text; with limit, one page starting after the row `after`"""
+        c = self.get_connection().cursor()
+        query, params = f"SELECT {self.DOCUMENT_COLUMNS} FROM {self.DOCUMENT_JOIN} WHERE pd.user_id = ?", [self.user_id]
+        if search:
+            query += " AND LOWER(pd.filename) LIKE ?"
+            params.append(f"%{search.lower()}%")
+        c.execute(*_page(query, params, DOCUMENT_ORDER, after, limit))
+        return [self._document(row) for row in c.fetchall()]
+    
+    def get_library_summary(self) -> Dict:
+        """Document count, total file size and how many have an AI summary"""
+        c = self.get_connection().cursor()
+        c.execute("""
+            SELECT COUNT(*), COALESCE(SUM(file_size), 0), COUNT(NULLIF(ai_summary, ''))
+            FROM philosophy_documents WHERE user_id = ?
+        """, (self.user_id,))
+        documents, total_size, analyzed = c.fetchone()
+        return {'documents': documents, 'total_size': total_size, 'analyzed': analyzed}
+    
+    def get_document_content(self, doc_id: int, limit: int = None) -> Optional[str]:
+        """A document's text; with limit, only its first `limit` characters are decompressed"""
+        c = self.get_connection().cursor()
+        c.execute(f"SELECT {self.DOCUMENT_TEXT} FROM {self.DOCUMENT_JOIN} WHERE pd.id = ? AND pd.user_id = ?",
+                  (doc_id, self.user_id))
+        row = c.fetchone()
+        return self._stored_text(row['content'], row['content_compressed'], limit=limit) if row else None
+    
+    def _stored_text(self, content: Optional[str], compressed: Optional[bytes], dictionary_id: int = None,
+                     limit: int = None) -> str:
+        if compressed is None:
+            text = content or ''
+            return text[:limit] if limit else text
+        return text_codec.decompress(compressed, self._dictionary(dictionary_id), limit)
+    
+    def _dictionary(self, dictionary_id: Optional[int]) -> Optional[bytes]:
+        if dictionary_id is None:
+            return None
+        if dictionary_id not in self.dictionaries:
+            c = self.get_connection().cursor()
+            c.execute("SELECT data FROM compression_dictionaries WHERE id = ?", (dictionary_id,))
+            self.dictionaries[dictionary_id] = bytes(c.fetchone()[0])
+        return self.dictionaries[dictionary_id]
     
     def update_document(self, doc_id: int, **kwargs):
         conn = self.get_connection()
@@ -719,62 +2021,156 @@ class Database:
             fields.append(f"{key} = ?")
             values.append(value)
         
-        values.append(doc_id)
-        query = f"UPDATE philosophy_documents SET {', '.join(fields)} WHERE id = ?"
+        values += [doc_id, self.user_id]
+        query = f"UPDATE philosophy_documents SET {', '.join(fields)} WHERE id = ? AND user_id = ?"
         c.execute(query, values)
+        
+        # Cache the analysis on the stored file so later uploads of it skip the AI call
+        if 'ai_summary' in kwargs or 'key_concepts' in kwargs:
+            c.execute("""
+                UPDATE document_blobs
+                SET ai_summary = COALESCE(?, ai_summary), key_concepts = COALESCE(?, key_concepts)
+                WHERE sha256 = (SELECT content_sha256 FROM philosophy_documents WHERE id = ? AND user_id = ?)
+            """, (kwargs.get('ai_summary'), kwargs.get('key_concepts'), doc_id, self.user_id))
+        conn.commit()
+    
+    def delete_document(self, doc_id: int):
+        conn = self.get_connection()
+        c = conn.cursor()
+        if 'document_segments' in self.backend.tables(c):
+            self._delete_segments(c, doc_id)
+        c.execute("DELETE FROM philosophy_documents WHERE id = ? AND user_id = ? RETURNING content_sha256",
+                  (doc_id, self.user_id))
+        row = c.fetchone()
+        if row and row[0]:
+            # Drop the stored file once nobody references it
+            c.execute("""
+                DELETE FROM document_blobs WHERE sha256 = ?
+                AND NOT EXISTS (SELECT 1 FROM philosophy_documents WHERE content_sha256 = ?)
+            """, (row[0], row[0]))
         conn.commit()
     
     def get_all_document_content(self) -> str:
         """Get all document content for AI context"""
         c = self.get_connection().cursor()
-        c.execute("SELECT content FROM philosophy_documents WHERE content IS NOT NULL")
-        rows = c.fetchall()
-        return "\n\n---\n\n".join([row[0] for row in rows if row[0]])
+        c.execute(f"SELECT {self.DOCUMENT_TEXT} FROM {self.DOCUMENT_JOIN} WHERE pd.user_id = ?", (self.user_id,))
+        texts = [self._stored_text(row['content'], row['content_compressed']) for row in c.fetchall()]
+        return "\n\n---\n\n".join([text for text in texts if text])
+    
+    def compress_stored_text(self):
+        """Compress any document text still stored as plain text (older or imported rows)"""
+        conn = self.get_connection()
+        self._compress_stored_text(conn.cursor())
+        conn.commit()
+    
+    def _compress_stored_text(self, c):
+        for table, key in [('document_blobs', 'sha256'), ('philosophy_documents', 'id')]:
+            c.execute(f"SELECT {key} FROM {table} WHERE content IS NOT NULL")
+            for row_key in [row[0] for row in c.fetchall()]:
+                # One row at a time: a document's text can be hundreds of megabytes
+                c.execute(f"SELECT content FROM {table} WHERE {key} = ?", (row_key,))
+                compressed = text_codec.compress(c.fetchone()[0])
+                c.execute(f"UPDATE {table} SET content_compressed = ?, content = NULL WHERE {key} = ?", (compressed, row_key))
+        
+        if 'document_segments' not in self.backend.tables(c):
+            return
+        c.execute("SELECT DISTINCT document_id FROM document_segments WHERE content IS NOT NULL")
+        for document_id in [row[0] for row in c.fetchall()]:
+            c.execute("SELECT id, content FROM document_segments WHERE document_id = ? AND content IS NOT NULL", (document_id,))
+            rows = c.fetchall()
+            dictionary_id, compress = self._segment_compressor(c, [row[1] for row in rows])
+            c.executemany("UPDATE document_segments SET content_compressed = ?, dictionary_id = ?, content = NULL WHERE id = ?",
+                          [(compress(row[1]), dictionary_id, row[0]) for row in rows])
 
     # ===== PDF SEGMENTS & SEARCH =====
+    # Segment text is compressed with a dictionary trained on the document's own
+    # segments, and decompressed one row at a time as segments are read.
     def create_segments_table(self):
         """Create table for PDF segments/chunks"""
         conn = self.get_connection()
-        c = conn.cursor()
-        
+        self._create_segments_table(conn.cursor())
+        conn.commit()
+    
+    def _create_segments_table(self, c):
         c.execute('''CREATE TABLE IF NOT EXISTS document_segments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             document_id INTEGER NOT NULL,
             segment_type TEXT DEFAULT 'paragraph',
             segment_number INTEGER,
             title TEXT,
-            content TEXT NOT NULL,
+            content TEXT,
+            content_compressed BLOB,
+            dictionary_id INTEGER,
             page_number INTEGER,
             word_count INTEGER,
             key_terms TEXT DEFAULT '[]',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (document_id) REFERENCES philosophy_documents(id) ON DELETE CASCADE
         )''')
-
-        self.create_segments_table()
-        
-        conn.commit()
+        c.execute("CREATE INDEX IF NOT EXISTS idx_segments_document ON document_segments(document_id, segment_number)")
+    
+    def _segment_compressor(self, c, texts: List[str]):
+        """(dictionary id or None, compress function) for one document's segments"""
+        dictionary = text_codec.train_dictionary(texts)
+        dictionary_id = None
+        if dictionary:
+            c.execute("INSERT INTO compression_dictionaries (data) VALUES (?) RETURNING id", (dictionary,))
+            dictionary_id = c.fetchone()[0]
+            # A rolled-back id can be handed out again, so only cache committed dictionaries
+            self.get_connection().after_commit(lambda: self.dictionaries.setdefault(dictionary_id, dictionary))
+        return dictionary_id, text_codec.compressor(dictionary)
+    
+    def _segment(self, row) -> Dict:
+        segment = dict(row)
+        segment['content'] = self._stored_text(segment['content'], segment.pop('content_compressed'),
+                                               segment.pop('dictionary_id'))
+        if segment.get('key_terms'):
+            try:
+                segment['key_terms'] = json.loads(segment['key_terms'])
+            except:
+                segment['key_terms'] = []
+        return segment
+    
+    def _delete_segments(self, c, document_id: int):
+        """Delete a document's segments, and their dictionary unless a linked copy still uses it"""
+        c.execute("""
+            SELECT DISTINCT ds.dictionary_id FROM document_segments ds
+            JOIN philosophy_documents pd ON ds.document_id = pd.id
+            WHERE ds.document_id = ? AND pd.user_id = ? AND ds.dictionary_id IS NOT NULL
+        """, (document_id, self.user_id))
+        dictionary_ids = [row[0] for row in c.fetchall()]
+        c.execute("""
+            DELETE FROM document_segments
+            WHERE document_id IN (SELECT id FROM philosophy_documents WHERE id = ? AND user_id = ?)
+        """, (document_id, self.user_id))
+        for dictionary_id in dictionary_ids:
+            c.execute("""
+                DELETE FROM compression_dictionaries WHERE id = ?
+                AND NOT EXISTS (SELECT 1 FROM document_segments WHERE dictionary_id = ?)
+            """, (dictionary_id, dictionary_id))
     
     def save_document_segments(self, document_id: int, segments: List[Dict]):
         """Save document segments for intelligent search"""
         conn = self.get_connection()
         c = conn.cursor()
         
-        for segment in segments:
-            c.execute("""
-                INSERT INTO document_segments 
-                (document_id, segment_type, segment_number, title, content, page_number, word_count, key_terms)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                document_id,
-                segment.get('type', 'paragraph'),
-                segment.get('number', 0),
-                segment.get('title', ''),
-                segment['content'],
-                segment.get('page', 0),
-                segment.get('word_count', 0),
-                json.dumps(segment.get('key_terms', []))
-            ))
+        dictionary_id, compress = self._segment_compressor(c, [segment['content'] for segment in segments])
+        c.executemany("""
+            INSERT INTO document_segments 
+            (document_id, segment_type, segment_number, title, content_compressed, dictionary_id,
+             page_number, word_count, key_terms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            document_id,
+            segment.get('type', 'paragraph'),
+            segment.get('number', 0),
+            segment.get('title', ''),
+            compress(segment['content']),
+            dictionary_id,
+            segment.get('page', 0),
+            segment.get('word_count', 0),
+            json.dumps(segment.get('key_terms', []))
+        ) for segment in segments])
         
         conn.commit()
     
@@ -782,49 +2178,73 @@ class Database:
         """Get all segments for a document"""
         c = self.get_connection().cursor()
         
-        query = "SELECT * FROM document_segments WHERE document_id = ?"
-        params = [document_id]
+        query = """
+            SELECT ds.* FROM document_segments ds
+            JOIN philosophy_documents pd ON ds.document_id = pd.id
+            WHERE ds.document_id = ? AND pd.user_id = ?
+        """
+        params = [document_id, self.user_id]
         
         if segment_type:
-            query += " AND segment_type = ?"
+            query += " AND ds.segment_type = ?"
             params.append(segment_type)
         
-        query += " ORDER BY segment_number ASC"
+        query += " ORDER BY ds.segment_number ASC"
         
         c.execute(query, params)
-        segments = [dict(row) for row in c.fetchall()]
-        
-        for segment in segments:
-            if segment.get('key_terms'):
-                try:
-                    segment['key_terms'] = json.loads(segment['key_terms'])
-                except:
-                    segment['key_terms'] = []
-        
-        return segments
+        return [self._segment(row) for row in c.fetchall()]
+    
+    def get_segment(self, segment_id: int) -> Optional[Dict]:
+        """One segment, decompressing only its own text"""
+        c = self.get_connection().cursor()
+        c.execute("""
+            SELECT ds.* FROM document_segments ds
+            JOIN philosophy_documents pd ON ds.document_id = pd.id
+            WHERE ds.id = ? AND pd.user_id = ?
+        """, (segment_id, self.user_id))
+        row = c.fetchone()
+        return self._segment(row) if row else None
     
-    def search_documents(self, query: str, document_id: int = None) -> List[Dict]:
-        """Search through document content"""
+    def search_documents(self, query: str, document_id: int = None, limit: int = 50) -> List[Dict]:
+        """Search through document content (case-insensitive), decompressing segments only until `limit` match"""
         c = self.get_connection().cursor()
         
         search_query = """
-            SELECT ds.*, pd.filename 
-            FROM document_segments ds
+            SELECT ds.id FROM document_segments ds
             JOIN philosophy_documents pd ON ds.document_id = pd.id
-            WHERE ds.content LIKE ?
+            WHERE pd.user_id = ?
         """
-        params = [f"%{query}%"]
+        params = [self.user_id]
         
         if document_id:
             search_query += " AND ds.document_id = ?"
             params.append(document_id)
         
-        search_query += " ORDER BY ds.document_id, ds.segment_number LIMIT 50"
+        search_query += " ORDER BY ds.document_id, ds.segment_number"
         
         c.execute(search_query, params)
-        return [dict(row) for row in c.fetchall()]
+        segment_ids = [row[0] for row in c.fetchall()]
+        needle = query.lower()
+        results = []
+        for start in range(0, len(segment_ids), 200):
+            batch = segment_ids[start:start + 200]
+            c.execute(f"""
+                SELECT ds.*, pd.filename FROM document_segments ds
+                JOIN philosophy_documents pd ON ds.document_id = pd.id
+                WHERE ds.id IN ({', '.join('?' * len(batch))})
+            """, batch)
+            rows = {row['id']: row for row in c.fetchall()}
+            for segment_id in batch:
+                segment = self._segment(rows[segment_id])
+                if needle in segment['content'].lower():
+                    results.append(segment)
+                    if len(results) == limit:
+                        return results
+        return results
     
     def close(self):
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        """Give this thread's connection back to the pool"""
+        release = getattr(self._local, 'release', None)
+        if release is not None:
+            self._local.conn = self._local.release = None
+            release()
@@ -0,0 +1,119 @@
+"""
+Effects Engine
+Which buffs are active for a user right now, and what they multiply a reward by.
+
+- Timed effects (potions, scrolls) are active_effects rows, kept in a heap
+  ordered by expires_at; equipped gear contributes passive effects that never
+  expire. Both are loaded once and only reloaded when gear changes.
+- Timed boosts of the same type don't stack, the strongest one applies;
+  different types and gear bonuses multiply.
+- Multipliers are folded into a few numbers when the set of effects changes,
+  and each (category, difficulty) composite is memoised, so multipliers() is
+  a dict lookup at reward time.
+- Expiry is a comparison against the heap's head: nothing is re-read until
+  the earliest effect runs out, and the caller then deletes every expired row
+  in one statement.
+"""
+import heapq
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# Timed boosts that multiply a reward; everything else in shop_items is handled elsewhere or cosmetic
+XP_MULTIPLIER = 'xp_multiplier'
+GOLD_MULTIPLIER = 'gold_multiplier'
+STAT_BOOST = 'stat_boost_temp'
+TIMED_EFFECTS = (XP_MULTIPLIER, GOLD_MULTIPLIER, STAT_BOOST)
+# Difficulty names used by gear, as the 1-3 scale habits and goals are rated on
+DIFFICULTY_LEVELS = {'easy': 1, 'medium': 2, 'hard': 3}
+
+
+def to_utc(value) -> Optional[datetime]:
+    """Aware UTC datetime from a stored timestamp; naive values (SQLite text, Postgres TIMESTAMP) are UTC"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def to_stored(value: datetime) -> str:
+    """UTC timestamp text in CURRENT_TIMESTAMP's format, so SQL comparisons order correctly"""
+    return to_utc(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class EffectsEngine:
+    """Active effects for one user"""
+
+    def __init__(self, timed: List[Dict] = (), passive: List[Dict] = ()):
+        self.passive = list(passive)
+        self.timed: List[tuple] = []  # (expires_at, id, effect) min-heap
+        for effect in timed:
+            self.timed.append((to_utc(effect['expires_at']), effect.get('id') or 0, effect))
+        heapq.heapify(self.timed)
+        self._rebuild()
+
+    @property
+    def next_expiry(self) -> Optional[datetime]:
+        return self.timed[0][0] if self.timed else None
+
+    def is_stale(self, now: datetime) -> bool:
+        """Whether any timed effect has run out by now (O(1))"""
+        return bool(self.timed) and self.timed[0][0] <= to_utc(now)
+
+    def expire(self, now: datetime) -> int:
+        """Drop effects that have run out; returns how many"""
+        now = to_utc(now)
+        expired = 0
+        while self.timed and self.timed[0][0] <= now:
+            heapq.heappop(self.timed)
+            expired += 1
+        if expired:
+            self._rebuild()
+        return expired
+
+    def add(self, effect: Dict):
+        heapq.heappush(self.timed, (to_utc(effect['expires_at']), effect.get('id') or 0, effect))
+        self._rebuild()
+
+    def active(self) -> List[Dict]:
+        """Timed effects, soonest to expire first"""
+        return [effect for _, _, effect in sorted(self.timed, key=lambda entry: entry[:2])]
+
+    def multipliers(self, category: str = None, difficulty: int = None) -> Tuple[float, float]:
+        """(xp, gold) multipliers for a reward in this category at this difficulty"""
+        key = (category, difficulty)
+        if key not in self._composites:
+            xp = self.xp * self.category_xp.get(category, 1.0)
+            for level, value in self.difficulty_xp:
+                if (difficulty or 0) >= level:
+                    xp *= value
+            self._composites[key] = (xp, self.gold)
+        return self._composites[key]
+
+    def apply(self, xp: int, gold: int, category: str = None, difficulty: int = None) -> Tuple[int, int]:
+        """Boosted (xp, gold) for a base reward"""
+        xp_multiplier, gold_multiplier = self.multipliers(category, difficulty)
+        return int(round((xp or 0) * xp_multiplier)), int(round((gold or 0) * gold_multiplier))
+
+    def _rebuild(self):
+        strongest: Dict[str, float] = {}
+        for _, _, effect in self.timed:
+            strongest[effect['effect_type']] = max(strongest.get(effect['effect_type'], 0.0), float(effect['value']))
+        self.xp = strongest.get(XP_MULTIPLIER, 1.0)
+        self.gold = strongest.get(GOLD_MULTIPLIER, 1.0)
+        self.stat_bonus = int(strongest.get(STAT_BOOST, 0))
+        self.category_xp: Dict[str, float] = {}
+        difficulty_xp: Dict[int, float] = {}
+        for effect in self.passive:
+            if effect.get('type') == 'category_xp_boost':
+                category = effect.get('category')
+                self.category_xp[category] = self.category_xp.get(category, 1.0) * effect['value']
+            elif effect.get('type') == 'difficulty_xp_boost':
+                level = DIFFICULTY_LEVELS.get(effect.get('difficulty'), 3)
+                difficulty_xp[level] = difficulty_xp.get(level, 1.0) * effect['value']
+            elif effect.get('type') == 'gold_multiplier_passive':
+                self.gold *= effect['value']
+        self.difficulty_xp = sorted(difficulty_xp.items())
+        self._composites: Dict[tuple, Tuple[float, float]] = {}
@@ -0,0 +1,100 @@
+"""
+Habit Schedules
+Expected-day calendars for habit frequencies ("daily", "weekdays", "weekends",
+"custom" with frequency_days), encoded as a 7-bit weekday mask (bit 0 = Monday)
+and expanded into per-day bitmasks or NumPy matrices for streak and rate math.
+"""
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+
+from completion_bitmap import CompletionBitmap, to_day
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+ALL_DAYS = 0b1111111
+FREQUENCY_MASKS = {
+    "daily": ALL_DAYS,
+    "weekdays": 0b0011111,
+    "weekends": 0b1100000,
+}
+
+
+def weekday_mask(frequency: str = "daily", frequency_days: list = None) -> int:
+    """7-bit mask of the weekdays a habit is scheduled on; unknown or empty schedules mean daily"""
+    if frequency == "custom":
+        mask = 0
+        for day in frequency_days or []:
+            if str(day).lower() in WEEKDAYS:
+                mask |= 1 << WEEKDAYS.index(str(day).lower())
+        return mask or ALL_DAYS
+    return FREQUENCY_MASKS.get(frequency, ALL_DAYS)
+
+
+def habit_mask(habit: Dict) -> int:
+    return weekday_mask(habit.get('frequency', 'daily'), habit.get('frequency_days'))
+
+
+def expected_bits(mask: int, start, length: int) -> int:
+    """Bitmask over `length` days from `start` (bit 0) with a bit set on each scheduled day"""
+    if length <= 0:
+        return 0
+    if mask == ALL_DAYS:
+        return (1 << length) - 1
+
+    # Repeat the weekly pattern (bit j <-> weekday j % 7), then align bit 0 to start's weekday
+    offset = date.fromordinal(to_day(start)).weekday()
+    weeks = (length + offset) // 7 + 1
+    pattern = ((1 << (7 * weeks)) - 1) // ALL_DAYS * mask
+    return (pattern >> offset) & ((1 << length) - 1)
+
+
+def expected_matrix(habits: List[Dict], start: date, end: date, completed: np.ndarray = None) -> np.ndarray:
+    """habits x days boolean matrix of scheduled days.
+    
+    Days before a habit existed are not expected; a habit exists from its
+    creation day or its first completion (backfills), whichever is earlier.
+    """
+    days = max((end - start).days + 1, 0)
+    masks = np.array([habit_mask(h) for h in habits], dtype=np.uint8).reshape(-1, 1)
+    weekdays = ((start.weekday() + np.arange(days)) % 7).astype(np.uint8)
+    expected = ((masks >> weekdays) & 1).astype(bool)
+
+    for row, habit in enumerate(habits):
+        created = str(habit.get('created_at') or '')[:10]
+        if not created:
+            continue
+        first = (date.fromisoformat(created) - start).days
+        if completed is not None and completed[row].any():
+            first = min(first, int(completed[row].argmax()))
+        if first > 0:
+            expected[row, :first] = False
+
+    return expected
+
+
+def scheduled_streak(bitmap: CompletionBitmap, habit: Dict, today, excused: CompletionBitmap = None) -> int:
+    """Current streak counting only the habit's scheduled days; excused (shielded) days don't break it"""
+    if not bitmap.bits:
+        return 0
+    mask = habit_mask(habit)
+    if mask == ALL_DAYS and not (excused and excused.bits):
+        return bitmap.current_streak(today)
+    expected = expected_bits(mask, bitmap.base, to_day(today) - bitmap.base + 1)
+    if excused is not None:
+        expected &= ~excused.window(bitmap.base, today)
+    return bitmap.current_streak(today, expected)
+
+
+def finalized_streak(bitmap: CompletionBitmap, habit: Dict, day, excused: CompletionBitmap = None) -> int:
+    """Streak at the end of a finished day; unlike scheduled_streak, a miss on that day counts"""
+    end = to_day(day)
+    if not bitmap.bits or end < bitmap.base:
+        return 0
+    length = end - bitmap.base + 1
+    expected = expected_bits(habit_mask(habit), bitmap.base, length)
+    if excused is not None:
+        expected &= ~excused.window(bitmap.base, end)
+    misses = expected & ~bitmap.bits
+    return ((bitmap.bits & expected) >> misses.bit_length()).bit_count()
@@ -0,0 +1,240 @@
+"""
+Instrumentation
+Call counts, latency histograms, rows and bytes for Database and AICoach
+methods, aggregated per Streamlit rerun and per page.
+
+- Profiler.wrap(cls) replaces a class's public methods with timing wrappers,
+  once per process. Nothing is wrapped unless profiling is switched on.
+- Each full-script rerun is a Run; calls made on the thread that started it
+  are added to it as well as to the process-wide per-method and per-page
+  totals. A fragment that reruns on its own (Profiler.fragment) is a Run of
+  its own, totalled per fragment name rather than per page; inside a full
+  rerun its calls simply count towards that run.
+- Nested calls (one public method calling another) are recorded under their
+  own names, but a run's total time only counts the outermost ones.
+- Rows are len() of list results (1 for anything else, 0 for None); bytes add
+  up the str/bytes values in the result, a cheap size estimate.
+- to_json() and to_prometheus() export the totals; write() replaces a file
+  atomically, so a Prometheus textfile collector never reads half a file.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import types
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# Latency histogram upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Calls per run to one method at or above this look like a query in a loop
+N_PLUS_ONE_CALLS = 20
+
+
+class Stat:
+    """Aggregate for one method"""
+    __slots__ = ('calls', 'seconds', 'max_seconds', 'rows', 'bytes', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds: float, rows: int, size: int):
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows += rows
+        self.bytes += size
+        self.buckets[next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+
+    def to_dict(self) -> Dict:
+        return {'calls': self.calls, 'seconds': self.seconds, 'max_seconds': self.max_seconds,
+                'rows': self.rows, 'bytes': self.bytes, 'buckets': list(self.buckets)}
+
+
+class Run:
+    """One Streamlit rerun of one page, or of one fragment on it"""
+
+    def __init__(self, page: str, fragment: str = None):
+        self.page = page
+        self.fragment = fragment
+        self.started = time.time()
+        self.began = time.perf_counter()
+        self.wall_seconds: Optional[float] = None
+        self.seconds = 0.0  # outermost instrumented calls only
+        self.methods: Dict[str, Stat] = {}
+
+    @property
+    def calls(self) -> int:
+        return sum(stat.calls for stat in self.methods.values())
+
+    def hot_spots(self) -> List[str]:
+        """Methods called often enough in this run to suggest an N+1 loop"""
+        return sorted(name for name, stat in self.methods.items() if stat.calls >= N_PLUS_ONE_CALLS)
+
+    def to_dict(self) -> Dict:
+        return {'page': self.page, 'fragment': self.fragment, 'started': self.started, 'wall_seconds': self.wall_seconds,
+                'seconds': self.seconds, 'calls': self.calls,
+                'methods': {name: stat.to_dict() for name, stat in self.methods.items()}}
+
+
+def _measure(result) -> tuple:
+    """(rows, bytes) estimate for a method's return value"""
+    if result is None:
+        return 0, 0
+    items = result if isinstance(result, (list, tuple)) else (result,)
+    size = 0
+    for item in items:
+        for value in (item.values() if isinstance(item, dict) else (item,)):
+            if isinstance(value, (str, bytes, bytearray)):
+                size += len(value)
+            elif isinstance(value, (int, float)):
+                size += 8
+    return len(items), size
+
+
+class Profiler:
+    """Process-wide call statistics with per-run and per-page breakdowns"""
+
+    def __init__(self, history: int = 50):
+        self.methods: Dict[str, Stat] = {}
+        self.pages: Dict[str, Dict] = {}  # full-script reruns
+        self.fragments: Dict[str, Dict] = {}  # fragment reruns, by fragment name
+        self.runs = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ===== WRAPPING =====
+    def wrap(self, cls, skip=()):
+        """Time every public method of cls (idempotent)"""
+        for name, attribute in list(vars(cls).items()):
+            if (name.startswith('_') or name in skip or not isinstance(attribute, types.FunctionType)
+                    or hasattr(attribute, '__profiled__')):
+                continue
+            setattr(cls, name, self._wrapper(f"{cls.__name__}.{name}", attribute))
+        return cls
+
+    def _wrapper(self, name: str, method):
+        local = self._local
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            depth = getattr(local, 'depth', 0)
+            local.depth = depth + 1
+            began = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - began
+                local.depth = depth
+            self.record(name, elapsed, *_measure(result), outermost=depth == 0)
+            return result
+
+        wrapper.__profiled__ = True
+        return wrapper
+
+    def fragment(self, name: str, page: Callable[[], str]):
+        """Decorator for a fragment function: a rerun of just that fragment is recorded as a Run for name"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if getattr(self._local, 'run', None) is not None:
+                    return func(*args, **kwargs)  # drawn by a full rerun, which already counts it
+                run = self.start_run(page(), fragment=name)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.finish_run(run)
+            return wrapper
+        return decorate
+
+    # ===== RECORDING =====
+    def start_run(self, page: str, fragment: str = None) -> Run:
+        """Begin a rerun on this thread; later calls here count towards it"""
+        run = Run(page, fragment)
+        self._local.run = run
+        self._local.depth = 0
+        return run
+
+    def finish_run(self, run: Run):
+        """Close a run (idempotent, so a run cut short by st.rerun can be closed by the next one)"""
+        if run.wall_seconds is not None:
+            return
+        run.wall_seconds = time.perf_counter() - run.began
+        if getattr(self._local, 'run', None) is run:
+            self._local.run = None
+        with self._lock:
+            self.runs.append(run)
+            totals = self.pages if run.fragment is None else self.fragments
+            key = run.page if run.fragment is None else run.fragment
+            total = totals.setdefault(key, {'runs': 0, 'wall_seconds': 0.0, 'seconds': 0.0, 'calls': 0})
+            total['runs'] += 1
+            total['wall_seconds'] += run.wall_seconds
+            total['seconds'] += run.seconds
+            total['calls'] += run.calls
+
+    def record(self, name: str, seconds: float, rows: int = 0, size: int = 0, outermost: bool = True):
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            run.methods.setdefault(name, Stat()).add(seconds, rows, size)
+            if outermost:
+                run.seconds += seconds
+        with self._lock:
+            self.methods.setdefault(name, Stat()).add(seconds, rows, size)
+
+    # ===== EXPORT =====
+    def to_json(self) -> str:
+        with self._lock:
+            return json.dumps({
+                'methods': {name: stat.to_dict() for name, stat in self.methods.items()},
+                'pages': self.pages,
+                'fragments': self.fragments,
+                'runs': [run.to_dict() for run in self.runs],
+                'buckets': list(BUCKETS),
+            }, indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = ["# HELP goal_quest_call_seconds Latency of Database and AICoach method calls",
+                 "# TYPE goal_quest_call_seconds histogram"]
+        with self._lock:
+            methods = sorted(self.methods.items())
+            for name, stat in methods:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), stat.buckets):
+                    cumulative += count
+                    lines.append(f'goal_quest_call_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'goal_quest_call_seconds_sum{{method="{name}"}} {stat.seconds}')
+                lines.append(f'goal_quest_call_seconds_count{{method="{name}"}} {stat.calls}')
+            for metric, field, help_text in [('rows', 'rows', "Rows returned"), ('bytes', 'bytes', "Estimated bytes returned")]:
+                lines += [f"# HELP goal_quest_call_{metric}_total {help_text} by Database and AICoach methods",
+                          f"# TYPE goal_quest_call_{metric}_total counter"]
+                lines += [f'goal_quest_call_{metric}_total{{method="{name}"}} {getattr(stat, field)}' for name, stat in methods]
+            for metric, field, help_text in [('runs', 'runs', "Streamlit reruns"),
+                                             ('seconds', 'wall_seconds', "wall time of Streamlit reruns"),
+                                             ('calls', 'calls', "instrumented calls made by Streamlit reruns")]:
+                lines += [f"# HELP goal_quest_page_{metric}_total Full-script {help_text} per page",
+                          f"# TYPE goal_quest_page_{metric}_total counter"]
+                lines += [f'goal_quest_page_{metric}_total{{page="{page}"}} {totals[field]}'
+                          for page, totals in sorted(self.pages.items())]
+                lines += [f"# HELP goal_quest_fragment_{metric}_total Fragment-only {help_text} per fragment",
+                          f"# TYPE goal_quest_fragment_{metric}_total counter"]
+                lines += [f'goal_quest_fragment_{metric}_total{{fragment="{name}"}} {totals[field]}'
+                          for name, totals in sorted(self.fragments.items())]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> str:
+        """Write a .json or Prometheus text (.prom) export, replacing path atomically"""
+        text = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        partial = path + ".tmp"
+        with open(partial, 'w') as f:
+            f.write(text)
+        os.replace(partial, path)
+        return path
@@ -0,0 +1,60 @@
+"""
+MinHash Signatures
+Fixed-size sketches of a document's word 5-gram shingles. The fraction of
+matching signature slots estimates the Jaccard similarity of two documents,
+which flags near-duplicate uploads (another scan or edition of the same text)
+without comparing full texts.
+"""
+import re
+import zlib
+
+import numpy as np
+
+NUM_PERMUTATIONS = 64
+SHINGLE_WORDS = 5
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+CHUNK = 1 << 16
+
+# Fixed seed: signatures are stored, so they must be comparable across processes
+_rng = np.random.default_rng(20240501)
+_A = _rng.integers(1, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64).reshape(-1, 1)
+_B = _rng.integers(0, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64).reshape(-1, 1)
+WORD = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Unique 32-bit hashes of the text's consecutive 5-word windows"""
+    words = np.array([zlib.crc32(word.encode('utf-8')) for word in WORD.findall(text.lower())], dtype=np.uint64)
+    if len(words) < SHINGLE_WORDS:
+        return np.unique(words)
+    # Polynomial combination of each window's word hashes, folded to 32 bits
+    combined = np.zeros(len(words) - SHINGLE_WORDS + 1, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        combined = combined * np.uint64(1000003) + words[offset:offset + len(combined)]
+    return np.unique(combined & np.uint64(0xFFFFFFFF))
+
+
+def signature(text: str) -> np.ndarray:
+    """NUM_PERMUTATIONS minimum hash values (uint32); all-max for empty text"""
+    result = np.full(NUM_PERMUTATIONS, 0xFFFFFFFF, dtype=np.uint64)
+    hashes = shingle_hashes(text)
+    for start in range(0, len(hashes), CHUNK):
+        # a * h + b stays below 2^64 since a, b and h are all under 2^32
+        permuted = (_A * hashes[start:start + CHUNK] + _B) % MERSENNE_PRIME & np.uint64(0xFFFFFFFF)
+        result = np.minimum(result, permuted.min(axis=1))
+    return result.astype(np.uint32)
+
+
+def to_blob(sig: np.ndarray) -> bytes:
+    return sig.astype('<u4').tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(bytes(blob), dtype='<u4')
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    if len(a) != len(b) or not len(a):
+        return 0.0
+    return float(np.mean(a == b))
@@ -0,0 +1,221 @@
+"""
+Daily Rollover
+Finalizes each user's finished days once, after their local midnight.
+
+- Every day since the last rollover is processed in order, so a user who
+  hasn't opened the app for a week is caught up in one run.
+- Each scheduled habit's persisted streak grows on a check-in, survives a
+  miss a streak shield covers, and resets otherwise. Streaks without a row
+  for the day before (new habits, backfills into finalized days) are first
+  recomputed from the completion bitmap.
+- Shields are only spent on streaks worth saving, in this order: equipped
+  streak immunity (never runs out), the weekly auto shield on equipped
+  armor, charges left in an opened streak_protection item, then a new one
+  from the inventory. A covered miss is a completion row with completed = 0:
+  it earns and counts nothing, but excuses the day in streak math.
+- Each finalized day gets a daily_rollups row and a final perfect_day.
+- One write transaction with batched writes. rollover_state records the
+  last finalized day, so running again (another session, cron) is a no-op.
+
+    python rollover.py [handle] [--db goal_quest.db] [--url URL] [--data-dir DIR]
+"""
+import argparse
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from completion_bitmap import CompletionBitmap
+from database import Database
+from habit_schedule import finalized_streak, habit_mask, scheduled_streak
+from shop_items import ALL_SHOP_ITEMS
+
+# Inventory shields as (item_id, uses), fewest uses first so a big one isn't opened for a single miss
+SHIELD_ITEMS = sorted(((item['id'], item['effect'].get('uses', 1)) for item in ALL_SHOP_ITEMS
+                       if item.get('effect', {}).get('type') == 'streak_protection'), key=lambda shield: shield[1])
+
+
+class Shields:
+    """Streak shields available to one rollover, spent in priority order"""
+
+    def __init__(self, db: Database, c, charges: int = 0, auto_shield_week: str = None):
+        self.db = db
+        self.c = c
+        self.charges = charges or 0
+        self.auto_shield_week = auto_shield_week
+        equipped = {effect.get('type') for effect in db._equipped_effects(c)}
+        self.immune = 'streak_immunity' in equipped
+        self.auto = 'auto_streak_shield' in equipped
+        self.items_opened = 0
+
+    def take(self, day: date) -> bool:
+        """Spend a shield on a miss on this day; False if none is left"""
+        if self.immune:
+            return True
+        week = "%d-W%02d" % day.isocalendar()[:2]
+        if self.auto and self.auto_shield_week != week:
+            self.auto_shield_week = week
+            return True
+        if self.charges:
+            self.charges -= 1
+            return True
+        for item_id, uses in SHIELD_ITEMS:
+            if self.db._take_from_inventory(self.c, item_id) is not None:
+                self.items_opened += 1
+                self.charges = uses - 1
+                return True
+        return False
+
+
+def roll_over(db: Database, today: date = None) -> Dict:
+    """Finalize every day before today that hasn't been; returns what changed"""
+    today = today or db.clock.today()
+    through = today - timedelta(days=1)
+    summary = {'days': 0, 'through': str(through), 'protected': 0, 'broken': 0, 'shields_opened': 0}
+    state = db.get_rollover_state()
+    if state.get('last_day') and str(state['last_day']) >= str(through):
+        return summary
+
+    conn = db.get_connection()
+    c = conn.cursor()
+    db.backend.begin(c)
+    try:
+        _finalize(db, c, through, summary)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return summary
+
+
+def _finalize(db: Database, c, through: date, summary: Dict):
+    # Re-read under the write lock: another session may have just finished this rollover
+    c.execute("SELECT last_day, shield_charges, auto_shield_week FROM rollover_state WHERE id = ?", (db.user_id,))
+    row = c.fetchone()
+    if row and row[0] and str(row[0]) >= str(through):
+        return
+    first = date.fromisoformat(str(row[0])) + timedelta(days=1) if row and row[0] else through
+    shields = Shields(db, c, row[1], row[2]) if row else Shields(db, c)
+
+    habits = db.get_habits()
+    habit_ids = [habit['id'] for habit in habits]
+    bitmaps = db.get_habit_bitmaps(habit_ids)
+    protected = db.get_protected_days(habit_ids)
+    saved = db.get_habit_streaks()
+    masks = {habit['id']: habit_mask(habit) for habit in habits}
+
+    # [current, longest] as of the day before `first`
+    start = first - timedelta(days=1)
+    streaks = {}
+    for habit in habits:
+        habit_id = habit['id']
+        persisted = saved.get(habit_id)
+        if persisted and str(persisted['through']) == str(start):
+            streaks[habit_id] = [persisted['current_streak'], persisted['longest_streak']]
+        else:
+            current = finalized_streak(bitmaps[habit_id], habit, start, protected[habit_id])
+            longest = persisted['longest_streak'] if persisted else bitmaps[habit_id].longest_streak()
+            streaks[habit_id] = [current, max(current, longest)]
+
+    markers, days = [], []
+    day = first
+    while day <= through:
+        days.append(str(day))
+        for habit_id in habit_ids:
+            if not masks[habit_id] >> day.weekday() & 1 or protected[habit_id].has(day):
+                continue
+            streak = streaks[habit_id]
+            if bitmaps[habit_id].has(day):
+                streak[0] += 1
+                streak[1] = max(streak[1], streak[0])
+            elif streak[0] and shields.take(day):
+                markers.append((db.user_id, habit_id, str(day)))
+                protected[habit_id].set(day)
+            elif streak[0]:
+                streak[0] = 0
+                summary['broken'] += 1
+        day += timedelta(days=1)
+
+    c.executemany("""
+        INSERT INTO completions (user_id, habit_id, date, completed)
+        VALUES (?, ?, ?, 0)
+        ON CONFLICT(habit_id, date) DO NOTHING
+    """, markers)
+    c.executemany("""
+        INSERT INTO habit_streaks (habit_id, user_id, current_streak, longest_streak, through)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(habit_id) DO UPDATE SET
+            current_streak = excluded.current_streak,
+            longest_streak = excluded.longest_streak,
+            through = excluded.through
+    """, [(habit_id, db.user_id, current, longest, str(through)) for habit_id, (current, longest) in streaks.items()])
+    c.executemany("INSERT INTO daily_rollups (user_id, date) VALUES (?, ?) ON CONFLICT(user_id, date) DO NOTHING",
+                  [(db.user_id, day) for day in days])
+    db._update_perfect_days(c, days)
+    c.execute("""
+        INSERT INTO rollover_state (id, last_day, shield_charges, auto_shield_week, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(id) DO UPDATE SET
+            last_day = excluded.last_day,
+            shield_charges = excluded.shield_charges,
+            auto_shield_week = excluded.auto_shield_week,
+            updated_at = excluded.updated_at
+    """, (db.user_id, str(through), shields.charges, shields.auto_shield_week))
+
+    summary['days'] = len(days)
+    summary['protected'] = len(markers)
+    summary['shields_opened'] = shields.items_opened
+
+
+def live_streak(habit: Dict, bitmap: CompletionBitmap, saved: Optional[Dict], today: date,
+                excused: CompletionBitmap = None) -> int:
+    """Streak to show today: the persisted streak through yesterday plus today's check-in.
+
+    Falls back to computing it from the bitmap (and shielded days) when the
+    rollover hasn't covered yesterday for this habit.
+    """
+    if saved and str(saved['through']) == str(today - timedelta(days=1)):
+        return saved['current_streak'] + (1 if habit_mask(habit) >> today.weekday() & 1 and bitmap.has(today) else 0)
+    return scheduled_streak(bitmap, habit, today, excused)
+
+
+def live_streaks(db: Database, habits: List[Dict], bitmaps: Dict[int, CompletionBitmap], today: date) -> Dict[int, int]:
+    """live_streak for several habits; shield markers are only read if some habit needs the fallback"""
+    saved = db.get_habit_streaks()
+    yesterday = str(today - timedelta(days=1))
+    protected = {}
+    if any(str((saved.get(habit['id']) or {}).get('through')) != yesterday for habit in habits):
+        protected = db.get_protected_days([habit['id'] for habit in habits])
+    return {habit['id']: live_streak(habit, bitmaps[habit['id']], saved.get(habit['id']), today, protected.get(habit['id']))
+            for habit in habits}
+
+
+# ===== CLI =====
+def _databases(args) -> List[Database]:
+    if args.data_dir:
+        from shards import ShardRouter
+        router = ShardRouter(args.data_dir)
+        users = [router.get_or_create_user(args.handle)] if args.handle else [user['id'] for user in router.get_users()]
+        return [router.database(user_id) for user_id in users]
+
+    from storage import backend_from_url
+    db = Database(backend=backend_from_url(args.url, db_path=args.db))
+    users = [db.get_or_create_user(args.handle)] if args.handle else [user['id'] for user in db.get_users()]
+    return [db.for_user(user_id) for user_id in users]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finalize finished days (streaks, shields, rollups) for Goal Quest users")
+    parser.add_argument('handle', nargs='?', help="only this user (default: everyone)")
+    parser.add_argument('--db', default='goal_quest.db', help="SQLite file")
+    parser.add_argument('--url', default=os.environ.get('GOAL_QUEST_DATABASE_URL'), help="database URL, e.g. postgresql://...")
+    parser.add_argument('--data-dir', default=os.environ.get('GOAL_QUEST_DATA_DIR'), help="shard directory")
+    args = parser.parse_args()
+
+    for db in _databases(args):
+        summary = roll_over(db)
+        print(f"user {db.user_id}: {summary['days']} day(s) through {summary['through']}, "
+              f"{summary['protected']} shielded, {summary['broken']} streak(s) broken")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Shard Router
+Stores each user's data in its own SQLite file under a data directory, so
+check-ins from different users never contend for the same write lock.
+
+- Shards are created lazily by copying a template database that already has
+  the schema and achievement catalog; older shards are migrated on open when
+  their PRAGMA user_version is behind SCHEMA_VERSION.
+- Each open shard has its own SQLiteBackend pool, so every thread gets its
+  own connection as with a shared database. Pools are kept in an LRU capped at
+  max_open shards; an evicted pool closes its idle connections at once and
+  the rest as their threads release them.
+- A small directory database maps user handles to ids.
+- Cross-shard reads (admin queries, leaderboards) use short-lived read-only
+  connections so they don't churn the LRU.
+"""
+import glob
+import heapq
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+from database import Database, SCHEMA_VERSION
+from storage import SQLiteBackend, connect
+
+SHARD_PATTERN = re.compile(r'user_(\d+)\.db$')
+
+
+class ShardRouter:
+    """Routes a user id to that user's SQLite file"""
+
+    def __init__(self, data_dir: str = "data", max_open: int = 128, max_idle: int = 2):
+        self.data_dir = data_dir
+        self.max_open = max_open
+        self.max_idle = max_idle  # idle connections kept per open shard
+        self._backends: 'OrderedDict[int, SQLiteBackend]' = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(os.path.join(data_dir, "shards"), exist_ok=True)
+
+        self.template_path = os.path.join(data_dir, "template.db")
+        self._directory = connect(os.path.join(data_dir, "directory.db"))
+        self._directory.execute('''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            handle TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        self._directory.execute("INSERT OR IGNORE INTO users (id, handle) VALUES (1, 'default')")
+        self._directory.commit()
+
+    # ===== ROUTING =====
+    def shard_path(self, user_id: int) -> str:
+        # Fan out into 256 subdirectories so no directory grows too large
+        return os.path.join(self.data_dir, "shards", f"{user_id % 256:02x}", f"user_{user_id}.db")
+
+    def database(self, user_id: int, **kwargs) -> Database:
+        return Database(self.shard_path(user_id), user_id=user_id, router=self, backend=self.backend(user_id), **kwargs)
+
+    def backend(self, user_id: int) -> SQLiteBackend:
+        """Connection pool for a user's shard, creating or migrating the file first"""
+        with self._lock:
+            backend = self._backends.get(user_id)
+            if backend is not None:
+                self._backends.move_to_end(user_id)
+                return backend
+
+            path = self.shard_path(user_id)
+            if not os.path.exists(path):
+                self._create_shard(path)
+            backend = SQLiteBackend(path, max_idle=self.max_idle)
+            conn = backend.connect()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            backend.release(conn)
+            if version < SCHEMA_VERSION:
+                Database(path, user_id=user_id, backend=backend).close()
+
+            self._backends[user_id] = backend
+            while len(self._backends) > self.max_open:
+                self._backends.popitem(last=False)[1].close()
+            return backend
+
+    def _create_shard(self, path: str):
+        if not os.path.exists(self.template_path):
+            self._build_template()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Online backup copies a consistent snapshot even if the template is open elsewhere
+        template = sqlite3.connect(self.template_path)
+        shard = sqlite3.connect(path)
+        template.backup(shard)
+        shard.close()
+        template.close()
+
+    def _build_template(self):
+        from achievements import initialize_achievements
+
+        partial = self.template_path + ".tmp"
+        if os.path.exists(partial):
+            os.remove(partial)
+        db = Database(partial)
+        initialize_achievements(db)
+
+        # Per-user default rows are added when a shard is first opened for its user
+        conn = db.get_connection()
+        for table in ['user_profile', 'user_stats', 'equipment']:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+        conn.execute("PRAGMA journal_mode=DELETE")
+        db.close()
+        os.replace(partial, self.template_path)
+
+    def close(self):
+        with self._lock:
+            for backend in self._backends.values():
+                backend.close()
+            self._backends.clear()
+            self._directory.close()
+
+    # ===== USER DIRECTORY =====
+    def get_or_create_user(self, handle: str) -> int:
+        with self._lock:
+            self._directory.execute("INSERT INTO users (handle) VALUES (?) ON CONFLICT(handle) DO NOTHING", (handle,))
+            self._directory.commit()
+            return self._directory.execute("SELECT id FROM users WHERE handle = ?", (handle,)).fetchone()[0]
+
+    def get_users(self) -> List[Dict]:
+        with self._lock:
+            return [dict(row) for row in self._directory.execute("SELECT * FROM users ORDER BY id")]
+
+    # ===== CROSS-SHARD QUERIES =====
+    def user_ids(self) -> List[int]:
+        """Users that have a shard on disk"""
+        paths = glob.glob(os.path.join(self.data_dir, "shards", "*", "user_*.db"))
+        return sorted(int(SHARD_PATTERN.search(path).group(1)) for path in paths)
+
+    def map_shards(self, fn: Callable[[int, sqlite3.Connection], Any], user_ids: List[int] = None) -> Dict[int, Any]:
+        """Apply fn(user_id, read-only connection) to every shard"""
+        results = {}
+        for user_id in user_ids if user_ids is not None else self.user_ids():
+            conn = sqlite3.connect(f"file:{self.shard_path(user_id)}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            try:
+                results[user_id] = fn(user_id, conn)
+            except sqlite3.Error:
+                # Shards created by a newer build may not have the queried tables yet
+                pass
+            finally:
+                conn.close()
+        return results
+
+    def aggregate(self, query: str, params: tuple = ()) -> List[Dict]:
+        """Run a read query on every shard; each row is tagged with its shard's user_id"""
+        rows = []
+        for user_id, shard_rows in self.map_shards(lambda uid, conn: conn.execute(query, params).fetchall()).items():
+            rows.extend({'user_id': user_id, **dict(row)} for row in shard_rows)
+        return rows
+
+    def leaderboard(self, limit: int = 10) -> List[Dict]:
+        """Top users by total XP, including ledger entries not yet checkpointed"""
+        handles = {user['id']: user['handle'] for user in self.get_users()}
+
+        def standing(user_id, conn):
+            row = conn.execute("""
+                SELECT p.display_name, s.level, s.current_xp, s.total_xp,
+                       COALESCE((SELECT xp_running FROM reward_ledger WHERE user_id = s.id ORDER BY id DESC LIMIT 1), 0)
+                     - COALESCE((SELECT xp_running FROM reward_ledger WHERE id = s.ledger_id), 0) AS xp_tail
+                FROM user_stats s
+                JOIN user_profile p ON p.id = s.id
+                WHERE s.id = ?
+            """, (user_id,)).fetchone()
+            if not row:
+                return None
+            level, _ = Database._apply_xp(row['level'], row['current_xp'], row['xp_tail'])
+            return {
+                'user_id': user_id,
+                'handle': handles.get(user_id),
+                'display_name': row['display_name'],
+                'level': level,
+                'total_xp': row['total_xp'] + row['xp_tail'],
+            }
+
+        standings = [s for s in self.map_shards(standing).values() if s]
+        return heapq.nlargest(limit, standings, key=lambda s: s['total_xp'])
@@ -315,6 +315,14 @@ def get_item_by_id(item_id):
             return item
     return None
 
+def stack_limit(item):
+    """Most of an item one inventory stack holds (None = no limit)"""
+    if not item:
+        return None
+    if item.get("stackable"):
+        return item.get("max_stack")
+    return 1
+
 def can_afford(item, gold, crystals=0):
     """Check if player can afford an item"""
     price = item.get("price", {})
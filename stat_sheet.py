@@ -0,0 +1,79 @@
+"""
+Effective Stats
+A user's stats as the game uses them: base + equipped gear + achievement bonuses + timed boosts.
+
+- user_stats holds only base values (starting stats plus permanent elixirs);
+  gear `stats` and achievement `stat_bonus` are added on top, never written back.
+- Everything except timed boosts is summed once per user and then kept up to
+  date by deltas: equipping an item subtracts the stats of whatever was in
+  the slot and adds the new item's, so a gear change costs a few additions.
+- Timed boosts (stat_boost_temp raises every stat) come from the effects
+  engine; the totals are only rebuilt when its bonus changes, so an expiring
+  boost needs no separate invalidation.
+- A sheet is shared by every session of its user; its own lock serializes
+  updates and reads, and callers get a copy of the totals.
+"""
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from shop_items import get_item_by_id
+
+STAT_NAMES = ('strength', 'intelligence', 'vitality', 'agility', 'sense', 'willpower')
+
+
+def parse_stat_bonus(value) -> Optional[Tuple[str, int]]:
+    """(stat, amount) from an achievement's stat_bonus (JSON text or dict); None if missing or malformed"""
+    try:
+        bonus = json.loads(value) if isinstance(value, str) else value
+        if bonus['stat'] in STAT_NAMES:
+            return bonus['stat'], int(bonus['amount'])
+    except:
+        pass
+    return None
+
+
+class StatSheet:
+    """Effective stats for one user"""
+
+    def __init__(self, base: Dict, gear: Dict[str, Optional[str]] = None, bonuses: List[Tuple[str, int]] = ()):
+        self._lock = threading.Lock()
+        self.permanent = {stat: base.get(stat) or 0 for stat in STAT_NAMES}  # base + gear + achievements
+        self.gear: Dict[str, Optional[str]] = {}  # slot -> item id
+        for stat, amount in bonuses:
+            self.permanent[stat] += amount
+        for slot, item_id in (gear or {}).items():
+            self.equip(slot, item_id)
+        self.boost = 0
+        self._effective: Optional[Dict[str, int]] = None
+
+    def equip(self, slot: str, item_id: Optional[str]):
+        """Put an item in a slot (None empties it), adjusting totals by the difference"""
+        with self._lock:
+            previous = self.gear.get(slot)
+            if previous == item_id:
+                return
+            self._add_item(previous, -1)
+            self._add_item(item_id, 1)
+            self.gear[slot] = item_id
+
+    def add(self, stat: str, amount: int):
+        """A change to a base stat or a new achievement bonus"""
+        with self._lock:
+            self.permanent[stat] += amount
+            self._effective = None
+
+    def effective(self, boost: int = 0) -> Dict[str, int]:
+        """Totals with a timed boost applied to every stat (a copy the caller may keep)"""
+        with self._lock:
+            if self._effective is None or boost != self.boost:
+                self.boost = boost
+                self._effective = {stat: value + boost for stat, value in self.permanent.items()}
+            return dict(self._effective)
+
+    def _add_item(self, item_id: Optional[str], sign: int):
+        item = get_item_by_id(item_id) if item_id else None
+        for stat, amount in ((item or {}).get('stats') or {}).items():
+            if stat in self.permanent:
+                self.permanent[stat] += sign * amount
+                self._effective = None
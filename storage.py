@@ -0,0 +1,345 @@
+"""
+Storage Backends
+What Database needs from a SQL engine: connections, schema introspection and
+the schema version. Database writes portable SQL (qmark parameters,
+ON CONFLICT upserts, RETURNING ids); each backend adapts the rest.
+
+- SQLiteBackend: one file, WAL mode (the default); released connections are
+  kept open for the next thread instead of reopening the file
+- PostgresBackend: psycopg 3 connection pool with server-side prepared
+  statements; SQLite-flavoured DDL and placeholders are translated on the fly
+- Connections on both take after_commit(action) hooks, so in-process caches
+  only change once the writes behind them are committed
+"""
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Callable, List, Set
+
+
+class CommitHooks:
+    """Actions queued with after_commit run once the transaction commits; a rollback drops them"""
+
+    _after_commit = ()
+
+    def after_commit(self, action: Callable[[], None]):
+        if not self._after_commit:
+            self._after_commit = []
+        self._after_commit.append(action)
+
+    def _run_after_commit(self):
+        actions, self._after_commit = self._after_commit, ()
+        for action in actions:
+            action()
+
+
+class Connection(CommitHooks, sqlite3.Connection):
+    def commit(self):
+        super().commit()
+        self._run_after_commit()
+
+    def rollback(self):
+        self._after_commit = ()
+        super().rollback()
+
+
+def connect(db_path: str) -> Connection:
+    """Open a connection with the app's row factory and concurrency settings"""
+    # WAL lets readers run alongside the single writer; writers wait instead of failing
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, factory=Connection)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # consistent under WAL; skips an fsync per commit
+    return conn
+
+
+class StorageBackend:
+    """Connection source plus the engine-specific bits of schema management"""
+
+    name = "base"
+
+    def connect(self):
+        raise NotImplementedError
+
+    def release(self, conn):
+        conn.close()
+    
+    def begin(self, c):
+        """Open a write transaction up front, for multi-statement jobs that also run DDL"""
+        c.execute("BEGIN")
+
+    def tables(self, c) -> Set[str]:
+        raise NotImplementedError
+
+    def columns(self, c, table: str) -> List[str]:
+        raise NotImplementedError
+
+    def drop_not_null(self, c, table: str, column: str):
+        """Let a column hold NULLs (no-op if it already can)"""
+        raise NotImplementedError
+
+    def schema_version(self, c) -> int:
+        raise NotImplementedError
+
+    def set_schema_version(self, c, version: int):
+        raise NotImplementedError
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, db_path: str = "goal_quest.db", max_idle: int = 8):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.db_path)
+
+    def release(self, conn):
+        """Keep the connection for reuse (up to max_idle), rolling back anything left open"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close the idle connections; ones still checked out are closed when released"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.max_idle = 0
+        for conn in idle:
+            conn.close()
+    
+    def begin(self, c):
+        # Take the write lock now rather than at the first write
+        c.execute("BEGIN IMMEDIATE")
+
+    def tables(self, c) -> Set[str]:
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {row[0] for row in c.fetchall()}
+
+    def columns(self, c, table: str) -> List[str]:
+        c.execute(f"PRAGMA table_info({table})")
+        return [row[1] for row in c.fetchall()]
+
+    def drop_not_null(self, c, table: str, column: str):
+        # SQLite can't alter a column constraint; rebuild the table from its edited DDL
+        c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        ddl = c.fetchone()[0]
+        relaxed = re.sub(rf'(\b{column}\s+\w+)\s+NOT NULL', r'\1', ddl, count=1)
+        if relaxed == ddl:
+            return
+        c.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))
+        indexes = [row[0] for row in c.fetchall()]
+        c.execute(f"ALTER TABLE {table} RENAME TO {table}_rebuild")
+        c.execute(relaxed)
+        c.execute(f"INSERT INTO {table} SELECT * FROM {table}_rebuild")
+        c.execute(f"DROP TABLE {table}_rebuild")
+        for sql in indexes:
+            c.execute(sql)
+
+    def schema_version(self, c) -> int:
+        c.execute("PRAGMA user_version")
+        return c.fetchone()[0]
+
+    def set_schema_version(self, c, version: int):
+        c.execute(f"PRAGMA user_version = {int(version)}")
+
+
+# ===== POSTGRESQL =====
+# SQLite types keep their loose semantics: booleans stay 0/1 integers and
+# dates/timestamps stay ISO strings, so Database code is identical on both.
+DDL_REWRITES = [
+    (re.compile(r'\bINTEGER PRIMARY KEY AUTOINCREMENT\b', re.I), 'INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY'),
+    (re.compile(r'\bTIMESTAMP DEFAULT CURRENT_TIMESTAMP\b', re.I),
+     "TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"),
+    (re.compile(r'\bBOOLEAN\b', re.I), 'INTEGER'),
+    (re.compile(r'\bTIMESTAMP\b', re.I), 'TEXT'),
+    (re.compile(r'\bDATE\b(?=\s*(NOT NULL|PRIMARY|DEFAULT|,|\n|$))', re.I), 'TEXT'),
+    (re.compile(r'\bBLOB\b', re.I), 'BYTEA'),
+    (re.compile(r'\bREAL\b', re.I), 'DOUBLE PRECISION'),
+]
+CURRENT_TIMESTAMP = re.compile(r'\bCURRENT_TIMESTAMP\b', re.I)
+QUOTED_OR_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+
+@lru_cache(maxsize=1024)
+def to_postgres(sql: str) -> str:
+    """Translate a qmark-style SQLite statement to psycopg's format style"""
+    if sql.lstrip().upper().startswith(('CREATE TABLE', 'ALTER TABLE')):
+        for pattern, replacement in DDL_REWRITES:
+            sql = pattern.sub(replacement, sql)
+    else:
+        # Timestamps are stored as text, so CURRENT_TIMESTAMP must produce SQLite's format
+        sql = CURRENT_TIMESTAMP.sub("to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')", sql)
+
+    def replace(match):
+        token = match.group(0)
+        return {'?': '%s', '%': '%%'}.get(token, token)
+    return QUOTED_OR_PLACEHOLDER.sub(replace, sql)
+
+
+class Row(tuple):
+    """Tuple row that also supports row['column'] and dict(row), like sqlite3.Row"""
+
+    def __new__(cls, values, index):
+        row = super().__new__(cls, values)
+        row._index = index
+        return row
+
+    def keys(self):
+        return list(self._index)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+
+def row_factory(cursor):
+    index = {column.name: i for i, column in enumerate(cursor.description or [])}
+    return lambda values: Row(values, index)
+
+
+WRITE_STATEMENT = re.compile(r'^\s*(INSERT|UPDATE|DELETE)\b', re.I)
+
+
+def adapt_params(params) -> tuple:
+    # Boolean columns are integers, as in SQLite
+    return tuple(int(p) if isinstance(p, bool) else p for p in params)
+
+
+class PostgresCursor:
+    def __init__(self, conn: 'PostgresConnection'):
+        self._conn = conn
+        self._cursor = conn.raw.cursor()
+
+    def execute(self, sql: str, params=()):
+        self._conn.begin_if_write(sql)
+        self._cursor.execute(to_postgres(sql), adapt_params(params))
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        self._conn.begin_if_write(sql)
+        self._cursor.executemany(to_postgres(sql), [adapt_params(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class PostgresConnection(CommitHooks):
+    """Pooled psycopg connection exposing the slice of the sqlite3 API that Database uses.
+    
+    Like sqlite3's default mode, reads run outside a transaction and the first
+    write opens one that lasts until commit(), so read-only sessions never sit
+    idle in a transaction.
+    """
+
+    def __init__(self, conn):
+        self.raw = conn
+        self.raw.autocommit = True
+
+    def in_transaction(self) -> bool:
+        from psycopg.pq import TransactionStatus
+        return self.raw.info.transaction_status != TransactionStatus.IDLE
+
+    def begin_if_write(self, sql: str):
+        if WRITE_STATEMENT.match(sql) and not self.in_transaction():
+            self.raw.execute("BEGIN")
+
+    def cursor(self) -> PostgresCursor:
+        return PostgresCursor(self)
+
+    def execute(self, sql: str, params=()):
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        if self.in_transaction():
+            self.raw.execute("COMMIT")
+        self._run_after_commit()
+
+    def rollback(self):
+        self._after_commit = ()
+        if self.in_transaction():
+            self.raw.execute("ROLLBACK")
+
+
+class PostgresBackend(StorageBackend):
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 20):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise ImportError("PostgresBackend needs psycopg 3 and psycopg_pool: pip install 'psycopg[binary]' psycopg_pool")
+
+        # prepare_threshold=0 prepares every statement on first use; Database reuses a small fixed set
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True,
+                                   kwargs={'prepare_threshold': 0, 'row_factory': row_factory})
+
+    def connect(self) -> PostgresConnection:
+        return PostgresConnection(self.pool.getconn())
+
+    def release(self, conn: PostgresConnection):
+        self.pool.putconn(conn.raw)
+
+    def close(self):
+        self.pool.close()
+
+    def tables(self, c) -> Set[str]:
+        c.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")
+        return {row[0] for row in c.fetchall()}
+
+    def columns(self, c, table: str) -> List[str]:
+        c.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+            ORDER BY ordinal_position
+        """, (table,))
+        return [row[0] for row in c.fetchall()]
+
+    def drop_not_null(self, c, table: str, column: str):
+        c.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL")
+
+    def schema_version(self, c) -> int:
+        c.execute("CREATE TABLE IF NOT EXISTS schema_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        c.execute("SELECT value FROM schema_meta WHERE key = 'schema_version'")
+        row = c.fetchone()
+        return row[0] if row else 0
+
+    def set_schema_version(self, c, version: int):
+        c.execute("""
+            INSERT INTO schema_meta (key, value) VALUES ('schema_version', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (version,))
+
+
+def backend_from_url(url: str = None, db_path: str = "goal_quest.db") -> StorageBackend:
+    """PostgresBackend for postgres:// URLs, SQLiteBackend otherwise"""
+    if url and url.startswith(('postgres://', 'postgresql://')):
+        return PostgresBackend(url)
+    return SQLiteBackend(url or db_path)
@@ -0,0 +1,143 @@
+"""
+Streak Matrix
+Vectorized multi-habit streak analytics over a habits x days boolean matrix,
+built from the per-habit completion bitmaps in a single query. Streaks and
+rates are measured against each habit's expected (scheduled) days only.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from completion_bitmap import CompletionBitmap
+from habit_schedule import expected_matrix
+
+
+class CompletionMatrix:
+    """Boolean matrices of completions and expected days: one row per habit, one column per day"""
+
+    def __init__(self, habit_ids: List[int], start: date, matrix: np.ndarray, expected: np.ndarray = None):
+        self.habit_ids = list(habit_ids)
+        self.start = start
+        self.matrix = matrix
+        self.expected = np.ones_like(matrix) if expected is None else expected
+        self._streaks = None
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.matrix.shape[1] - 1)
+
+    @classmethod
+    def from_bitmaps(cls, habit_ids: List[int], start: date, end: date, bitmaps: Dict[int, CompletionBitmap]) -> 'CompletionMatrix':
+        """Unpack each habit's completion bitmap window into a matrix row"""
+        days = max((end - start).days + 1, 0)
+        matrix = np.zeros((len(habit_ids), days), dtype=bool)
+        nbytes = (days + 7) // 8
+
+        for row, habit_id in enumerate(habit_ids):
+            bitmap = bitmaps.get(habit_id)
+            if bitmap is None or not bitmap.bits or days == 0:
+                continue
+            packed = np.frombuffer(bitmap.window(start, end).to_bytes(nbytes, 'little'), dtype=np.uint8)
+            matrix[row] = np.unpackbits(packed, bitorder='little')[:days]
+
+        return cls(habit_ids, start, matrix)
+
+    @staticmethod
+    def streak_lengths(hits: np.ndarray, misses: np.ndarray) -> np.ndarray:
+        """Hits counted since the most recent miss, at each cell (days that are neither don't break a streak)"""
+        idx = np.arange(hits.shape[-1], dtype=np.int32)
+        hit_count = np.cumsum(hits, axis=-1, dtype=np.int32)
+        last_miss = np.maximum.accumulate(np.where(misses, idx, np.int32(-1)), axis=-1)
+        before = np.take_along_axis(hit_count, np.maximum(last_miss, 0), axis=-1)
+        return hit_count - np.where(last_miss >= 0, before, 0)
+
+    @property
+    def streaks(self) -> np.ndarray:
+        """Streak length at each cell; the last day can't break a streak while it is still open"""
+        if self._streaks is None:
+            misses = self.expected & ~self.matrix
+            misses[:, -1:] = False
+            self._streaks = self.streak_lengths(self.matrix & self.expected, misses)
+        return self._streaks
+
+    def current_streaks(self) -> np.ndarray:
+        """Per-habit count of scheduled days completed since the last missed one"""
+        if self.matrix.shape[1] == 0:
+            return np.zeros(len(self.habit_ids), dtype=np.int32)
+        return self.streaks[:, -1]
+
+    def longest_streaks(self) -> np.ndarray:
+        if self.matrix.shape[1] == 0:
+            return np.zeros(len(self.habit_ids), dtype=np.int32)
+        return self.streaks.max(axis=1)
+
+    def misses(self) -> np.ndarray:
+        """Scheduled days not completed"""
+        return self.expected & ~self.matrix
+
+    def all_done(self) -> np.ndarray:
+        """Per-day flag: at least one habit was scheduled and every scheduled habit was completed"""
+        if not self.habit_ids:
+            return np.zeros(self.matrix.shape[1], dtype=bool)
+        return self.expected.any(axis=0) & ~self.misses().any(axis=0)
+
+    def longest_perfect_run(self) -> int:
+        if not self.habit_ids or self.matrix.shape[1] == 0:
+            return 0
+        missed = self.misses().any(axis=0)
+        missed[-1] = False
+        return int(self.streak_lengths(self.all_done(), missed).max())
+
+    def completion_rate(self, days: int = None) -> float:
+        """Completed scheduled days / scheduled days over the trailing `days` (whole range by default)"""
+        window = slice(-days, None) if days else slice(None)
+        expected = self.expected[:, window]
+        total = int(expected.sum())
+        return float((self.matrix[:, window] & expected).sum() / total) if total else 0.0
+
+    def rolling_rates(self, window: int = 7) -> np.ndarray:
+        """Per-habit completion rate of scheduled days over the trailing `window` days, for every day"""
+        def trailing(matrix):
+            counts = np.cumsum(matrix, axis=1, dtype=np.int32)
+            counts[:, window:] -= counts[:, :-window].copy()
+            return counts
+
+        done = trailing(self.matrix & self.expected)
+        expected = trailing(self.expected)
+        return np.divide(done, expected, out=np.zeros(done.shape), where=expected > 0)
+
+    def summary(self) -> Dict:
+        current = self.current_streaks()
+        return {
+            'current_streaks': dict(zip(self.habit_ids, current.tolist())),
+            'longest_streaks': dict(zip(self.habit_ids, self.longest_streaks().tolist())),
+            'best_current_streak': int(current.max()) if current.size else 0,
+            'habits_with_7_day_streak': int((current >= 7).sum()),
+            'longest_perfect_run': self.longest_perfect_run(),
+        }
+
+    def days_without_misses(self) -> int:
+        """Consecutive days, ending yesterday, on which no scheduled habit was missed"""
+        missed = self.misses().any(axis=0)[:-1]
+        if not missed.any():
+            return int(missed.size)
+        return int(missed.size - 1 - np.flatnonzero(missed)[-1])
+
+
+def load_completion_matrix(db, habits: List[Dict] = None, start: Optional[date] = None,
+                           end: Optional[date] = None, days: int = 366) -> CompletionMatrix:
+    """Build the matrix for the given habits (all active by default) from bitmaps and shield markers"""
+    end = end or db.clock.today()
+    start = start or end - timedelta(days=days - 1)
+    if habits is None:
+        habits = db.get_habits()
+    habit_ids = [h['id'] for h in habits]
+
+    # One query over habit_bitmaps; no completion rows or dates are parsed in Python
+    bitmaps = db.get_habit_bitmaps(habit_ids)
+    matrix = CompletionMatrix.from_bitmaps(habit_ids, start, end, bitmaps)
+    matrix.expected = expected_matrix(habits, start, end, matrix.matrix)
+    # Days a streak shield covered are neither expected nor missed
+    matrix.expected &= ~CompletionMatrix.from_bitmaps(habit_ids, start, end, db.get_protected_days(habit_ids)).matrix
+    return matrix
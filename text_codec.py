@@ -0,0 +1,99 @@
+"""
+Text Compression
+Storage encoding for extracted document text and segments.
+
+- zstd via the zstandard package (in requirements.txt), zlib if it is
+  missing. Every payload starts with a one-byte codec tag, so any build reads
+  zlib rows; zstd rows need the package whenever they are read, so keep it
+  installed once anything has been stored with it.
+- Segments are a few hundred bytes each, too short for zstd to find much to
+  reuse on its own, so a document's segments share a dictionary trained on
+  them. The dictionary is stored once; rows only carry its id.
+- decompress() takes a character limit, so previews inflate only the start.
+"""
+import zlib
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = b'z'
+ZSTD = b'Z'
+# zstd's default level; 6 shrinks text ~2% more at half the ingest speed
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+DICTIONARY_SIZE = 16 * 1024
+# Fewer segments than this can't train a dictionary worth storing
+MIN_DICTIONARY_SAMPLES = 32
+# Training time grows with the sample; an evenly spaced subset of a long book trains as well
+MAX_DICTIONARY_SAMPLES = 2000
+# Whole documents above this are compressed on all cores
+THREADED_BYTES = 1 << 20
+
+
+def compress(text: str, dictionary: bytes = None) -> bytes:
+    """Payload for text, using the given zstd dictionary if any"""
+    data = text.encode('utf-8')
+    if zstandard is None:
+        return ZLIB + zlib.compress(data, ZLIB_LEVEL)
+    return ZSTD + _compressor(dictionary, threaded=len(data) >= THREADED_BYTES).compress(data)
+
+
+def compressor(dictionary: bytes = None):
+    """compress() bound to one reusable compressor, for batches in a single thread"""
+    if zstandard is None:
+        return lambda text: ZLIB + zlib.compress(text.encode('utf-8'), ZLIB_LEVEL)
+    zstd = _compressor(dictionary)
+    return lambda text: ZSTD + zstd.compress(text.encode('utf-8'))
+
+
+def _compressor(dictionary: Optional[bytes], threaded: bool = False):
+    # Rows carry their dictionary id, so frames skip the id, checksum and (for dictionaries) the header bytes
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_dictionary(dictionary), write_checksum=False,
+                                    write_dict_id=False, threads=-1 if threaded else 0)
+
+
+def _dictionary(dictionary: Optional[bytes]):
+    return zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+
+
+def decompress(payload: bytes, dictionary: bytes = None, limit: int = None) -> str:
+    """Text from a payload; with limit, at most that many characters (decoding stops there)"""
+    payload = bytes(payload)
+    codec, body = payload[:1], payload[1:]
+    # UTF-8 is at most 4 bytes per character; a cut mid-character is dropped
+    max_bytes = limit * 4 if limit else None
+    if codec == ZLIB:
+        data = zlib.decompressobj().decompress(body, max_bytes or 0)
+    elif codec == ZSTD:
+        if zstandard is None:
+            raise ImportError("This text was stored with zstd and needs the zstandard package: pip install zstandard")
+        decompressor = zstandard.ZstdDecompressor(dict_data=_dictionary(dictionary))
+        if max_bytes:
+            with decompressor.stream_reader(body) as reader:
+                data = reader.read(max_bytes)
+        else:
+            data = decompressor.decompress(body)
+    else:
+        raise ValueError(f"Unknown text codec {codec!r}")
+    text = data.decode('utf-8', errors='ignore' if max_bytes else 'strict')
+    return text[:limit] if limit else text
+
+
+def train_dictionary(samples: List[str]) -> Optional[bytes]:
+    """A zstd dictionary for compressing these segments, or None if it wouldn't pay off"""
+    if zstandard is None or len(samples) < MIN_DICTIONARY_SAMPLES:
+        return None
+    step = max(1, len(samples) // MAX_DICTIONARY_SAMPLES)
+    data = [sample.encode('utf-8') for sample in samples[::step]]
+    # A dictionary much larger than a tenth of the text costs more than it saves
+    size = min(DICTIONARY_SIZE, sum(len(sample) for sample in data) // 10)
+    if size < 1024:
+        return None
+    try:
+        # Fixed cover parameters: searching for the best ones is ~5x slower for ~1% better ratios
+        return zstandard.train_dictionary(size, data, k=200, d=8, level=ZSTD_LEVEL).as_bytes()
+    except zstandard.ZstdError:
+        return None
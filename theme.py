@@ -0,0 +1,70 @@
+"""
+Theme
+Markup for the app's cards and bars, styled by static/theme.css.
+
+- The stylesheet is a static file (server.enableStaticServing); every rerun
+  sends a one-line @import the browser answers from its cache, instead of the
+  whole <style> block.
+- Fragments carry class names and, where an item needs its own color or
+  width, a CSS custom property, so a card is tens of bytes on the wire
+  rather than the hundreds its inline styles used to take.
+- Text arguments are HTML-escaped; `body` arguments are markup and are not.
+"""
+from html import escape
+
+THEME_URL = "app/static/theme.css"
+# Style-only HTML: st.html puts it in the event container, so it takes no space on the page
+STYLESHEET = f"<style>@import url('{THEME_URL}');</style>"
+
+# Hunter card stages by minimum level, highest first
+STAGES = [
+    (76, 'monarch', "Shadow Monarch", "👑"),
+    (51, 's-rank', "S-Rank Hunter", "⚔️"),
+    (26, 'elite', "Elite Hunter", "🛡️"),
+    (11, 'skilled', "Skilled Hunter", "🗡️"),
+    (0, 'novice', "Novice Hunter", "⚡"),
+]
+
+
+def card(body: str, kind: str = '') -> str:
+    """A bordered panel; kind adds modifier classes ('compact', 'gold')"""
+    return f"<div class='card {kind}'>{body}</div>"
+
+
+def heading(text: str, level: int = 1, kind: str = 'centered') -> str:
+    return f"<h{level} class='{kind}'>{escape(text)}</h{level}>"
+
+
+def tagline(text: str) -> str:
+    return f"<p class='tagline'>{escape(text)}</p>"
+
+
+def profile_card(name: str, path: str, level: int) -> str:
+    return card(f"<h2>{escape(name)}</h2><p class='subtitle'>{escape(path)}</p>"
+                f"<div class='level-badge'>LEVEL {level}</div>", 'centered')
+
+
+def gold_counter(gold: int) -> str:
+    return card(f"<h3>💰 {gold:,} Gold</h3>", 'compact gold centered')
+
+
+def hunter_card(name: str, avatar_icon: str, path: str, level: int, gold: int) -> str:
+    """The dashboard character card, bordered and lit by the level's stage"""
+    kind, stage, stage_icon = next((kind, stage, icon) for minimum, kind, stage, icon in STAGES if level >= minimum)
+    return (f"<div class='hunter-card {kind}'><div class='avatar'>{avatar_icon}</div>"
+            f"<div class='stage-icon'>{stage_icon}</div><h2>{escape(name)}</h2>"
+            f"<p class='stage'>{stage}</p><p class='path'>{escape(path)}</p>"
+            f"<div class='level'>LEVEL {level}</div><p class='gold'>💰 {gold:,} Gold</p></div>")
+
+
+def equipment_slot(icon: str, slot: str, item: str) -> str:
+    return (f"<div class='equipment-slot'><div class='icon'>{icon}</div>"
+            f"<div class='slot'>{escape(slot)}</div><div class='item'>{escape(item)}</div></div>")
+
+
+def stat_bar(label: str, value: int, percent: float, color: str, bonus: int = 0) -> str:
+    """One stat as a filled bar; bonus is shown as (+N) next to the value"""
+    extra = f" <span class='bonus'>(+{bonus})</span>" if bonus else ""
+    return (f"<div class='stat-bar' style='--accent: {color}; --fill: {percent:g}%'>"
+            f"<div class='label'><span>{label}</span><span class='value'>{value}{extra}</span></div>"
+            f"<div class='track'><div class='fill'></div></div></div>")
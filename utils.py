@@ -1,40 +1,28 @@
-from datetime import datetime, timedelta, date
-import pytz
+from datetime import datetime, timedelta, date, timezone
+from clock import get_clock
+from completion_bitmap import CompletionBitmap
+from habit_schedule import scheduled_streak
 
 def get_cst_date():
-    """Get current date in CST timezone"""
-    cst = pytz.timezone('America/Chicago')
-    return datetime.now(cst).date()
+    """Get current date in the user's timezone (CST by default)"""
+    return get_clock().today()
 
 def get_cst_datetime():
-    """Get current datetime in CST timezone"""
-    cst = pytz.timezone('America/Chicago')
-    return datetime.now(cst)
+    """Get current datetime in the user's timezone (CST by default)"""
+    return get_clock().now()
 
 def format_xp(xp: int) -> str:
     """Format XP with commas for readability"""
     return f"{xp:,}"
 
-def calculate_streak(completions: list) -> int:
-    """Calculate current streak from completion dates"""
+def calculate_streak(completions: list, frequency: str = "daily", frequency_days: list = None) -> int:
+    """Calculate current streak from completion dates, counting only scheduled days"""
     if not completions:
         return 0
     
-    today = get_cst_date()
-    streak = 0
-    current_date = today
-    
-    sorted_dates = sorted([c['date'] for c in completions], reverse=True)
-    sorted_dates = [d if isinstance(d, date) else datetime.fromisoformat(d).date() for d in sorted_dates]
-    
-    for completion_date in sorted_dates:
-        if completion_date == current_date or completion_date == current_date - timedelta(days=1):
-            streak += 1
-            current_date = completion_date - timedelta(days=1)
-        else:
-            break
-    
-    return streak
+    bitmap = CompletionBitmap.from_dates(c['date'] for c in completions)
+    habit = {'frequency': frequency, 'frequency_days': frequency_days}
+    return scheduled_streak(bitmap, habit, get_cst_date())
 
 def get_date_range(period: str) -> tuple:
     """Get start and end dates for a given period"""
@@ -64,6 +52,8 @@ def format_time_ago(dt: datetime) -> str:
     """Format datetime as X time ago"""
     if isinstance(dt, str):
         dt = datetime.fromisoformat(dt)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
     
     now = get_cst_datetime()
     diff = now - dt